@@ -1,7 +1,18 @@
 from django.contrib import admin
 from .models import *
+from .catalog import deferred_catalog_bumps
 
 
+class CatalogAdmin(admin.ModelAdmin):
+    """
+    Single saves and deletes bump the catalog version through the model
+    signals; a changelist bulk delete bumps it once instead of per row.
+    """
+
+    def delete_queryset(self, request, queryset):
+        with deferred_catalog_bumps():
+            super().delete_queryset(request, queryset)
+
 
 # Register the models
 admin.site.register(User)
@@ -9,12 +20,14 @@ admin.site.register(Event)
 admin.site.register(Resource)
 admin.site.register(Comment)
 admin.site.register(ErasmusParticipant)
-admin.site.register(ErasmusProgram)
-admin.site.register(Country)
+admin.site.register(ErasmusProgram, CatalogAdmin)
+admin.site.register(Country, CatalogAdmin)
 admin.site.register(Profile)
 admin.site.register(Field_Study)
 admin.site.register(ErasmusReview)
 admin.site.register(FavouriteErasmusProgram)
 admin.site.register(EventParticipant)
 admin.site.register(EmailVerificationToken)
-admin.site.register(BugReport)
\ No newline at end of file
+admin.site.register(BugReport)
+admin.site.register(StagedErasmusProgram)
+admin.site.register(ImportCheckpoint)
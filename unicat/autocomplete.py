@@ -0,0 +1,80 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+
+from .catalog import catalog_programs, catalog_version, normalize
+
+WORD_RE = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD_RE.findall(normalize(text))
+
+
+class AutocompleteIndex:
+    """
+    Word-prefix index over university and city names. Entries are stored in
+    QS order, so an entry's position is also its rank: the best matches are
+    just the smallest positions among the candidates.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (row['index'] is None, row['index'] or 0, row['university']))
+        self.entries = []
+        postings = []
+        for position, row in enumerate(rows):
+            self.entries.append({
+                'id': row['id'],
+                'university': row['university'],
+                'city': row['city'],
+                'country': row['country_code__name'],
+                'rank': row['rank'],
+            })
+            entry_words = set(words(row['university'])) | set(words(row['city']))
+            postings.extend((word, position) for word in entry_words)
+        postings.sort()
+        self.keys = [word for word, _ in postings]
+        self.positions = [position for _, position in postings]
+
+    def _prefix_positions(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+        return self.positions[start:end]
+
+    def search(self, query, limit=10):
+        terms = set(words(query))
+        if not terms:
+            return []
+        # Every term must prefix some word of the entry: intersect the postings
+        matches = sorted((set(self._prefix_positions(term)) for term in terms), key=len)
+        candidates = matches[0].intersection(*matches[1:])
+        return [self.entries[position] for position in heapq.nsmallest(limit, candidates)]
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def get_index():
+    """This worker's index, rebuilt whenever the catalog version changes."""
+    global _index, _index_version
+    version = catalog_version()
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                rows = catalog_programs().values('id', 'index', 'university', 'city', 'rank', 'country_code__name')
+                _index = AutocompleteIndex(list(rows))
+                _index_version = version
+    return _index
+
+
+def clear_index():
+    global _index, _index_version
+    with _lock:
+        _index = _index_version = None
+
+
+def autocomplete(query, limit=10):
+    return get_index().search(query, limit)
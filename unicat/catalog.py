@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import ErasmusProgram, TableGeneration
+
+# Generation name bumped whenever the exchange catalog changes
+CATALOG = TableGeneration.CATALOG
+
+# Keys are versioned, so stale entries are never read again and just age out
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def catalog_version():
+    return TableGeneration.current(CATALOG)
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog count (imports, admin edits...)."""
+    TableGeneration.bump(CATALOG)
+
+
+_deferred = threading.local()
+
+
+def catalog_bumps_deferred():
+    return getattr(_deferred, 'depth', 0) > 0
+
+
+@contextmanager
+def deferred_catalog_bumps():
+    """
+    For imports that save programs one by one: the per-row post_save /
+    post_delete bumps are skipped inside the block, and the version is
+    bumped once when the outermost block exits.
+    """
+    depth = getattr(_deferred, 'depth', 0)
+    _deferred.depth = depth + 1
+    try:
+        yield
+    finally:
+        _deferred.depth = depth
+        if depth == 0:
+            bump_catalog_version()
+
+
+def normalize(text):
+    """Accent- and case-insensitive form of a name ("Politècnica" -> "politecnica")."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def filter_signature(**filters):
+    """Stable short key for a combination of list filters."""
+    parts = []
+    for name in sorted(filters):
+        value = filters[name]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = ','.join(sorted(str(item) for item in value))
+        parts.append(f'{name}={value}')
+    return hashlib.sha1('&'.join(parts).encode()).hexdigest()
+
+
+def _cached(key, compute, version=None):
+    if version is None:
+        version = catalog_version()
+    full_key = f'{CATALOG}:{version}:{key}'
+    value = cache.get(full_key)
+    if value is None:
+        value = compute()
+        cache.set(full_key, value, CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def catalog_programs():
+    """The programs shown in the exchange catalog (home-country ones excluded)."""
+    return ErasmusProgram.objects.exclude(country_code="ES")
+
+
+def catalog_total(version=None):
+    return _cached('total', lambda: catalog_programs().count(), version)
+
+
+def catalog_country_counts(version=None):
+    """{country name: number of programs}, from a single GROUP BY."""
+    def compute():
+        rows = catalog_programs().values('country_code__name').annotate(total=Count('id'))
+        return {row['country_code__name']: row['total'] for row in rows}
+    return _cached('countries', compute, version)
+
+
+def catalog_facets(university_filter='', country_filters=(), favorites_filter='', favorite_ids=(),
+                   rank_min=None, rank_max=None, version=None):
+    """
+    Facet counts for the exchange filters: programs per country and
+    favourites vs. not. Each facet ignores its own filter (so picking a
+    country still shows how many programs the others have) but honours the
+    rest. Both come from one GROUP BY country, cached per catalog version,
+    search text, rank band and favourite set.
+    """
+    favorite_ids = set(favorite_ids)
+    needle = normalize(university_filter)
+    signature = filter_signature(university=needle, favorite_ids=favorite_ids,
+                                 rank_min=rank_min, rank_max=rank_max)
+
+    def compute():
+        programs = catalog_programs()
+        if needle:
+            # Same accent-insensitive match as the list and the autocomplete (SQLite can't fold accents)
+            programs = programs.filter(id__in=[
+                program_id for program_id, university in programs.values_list('id', 'university')
+                if needle in normalize(university)
+            ])
+        if rank_min is not None:
+            programs = programs.filter(rank_low__gte=rank_min)
+        if rank_max is not None:
+            programs = programs.filter(rank_low__lte=rank_max)
+        rows = programs.values('country_code__name').annotate(
+            total=Count('id'),
+            favorites=Count('id', filter=Q(id__in=favorite_ids)),
+        )
+        return [(row['country_code__name'], row['total'], row['favorites']) for row in rows]
+
+    rows = _cached(f'facets:{signature}', compute, version)
+
+    countries = {}
+    favorites = {'favorites': 0, 'not_favorites': 0}
+    for country, total, favorite_total in rows:
+        if favorites_filter == 'favorites':
+            countries[country] = favorite_total
+        elif favorites_filter == 'not_favorites':
+            countries[country] = total - favorite_total
+        else:
+            countries[country] = total
+        if not country_filters or country in country_filters:
+            favorites['favorites'] += favorite_total
+            favorites['not_favorites'] += total - favorite_total
+    return {'countries': countries, 'favorites': favorites}
@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+from . import logo_variants
+from .models import TableGeneration
+
+
+def generation_etag(*generations, time_bucket=None, extra=None):
+    """
+    ETag function for django.views.decorators.http.condition on a JSON list
+    view. The tag only changes when one of the given table generations
+    moves (or, with `time_bucket` seconds, when the clock enters a new
+    bucket, for lists filtered on "now"; or, with `extra`, when that
+    callable's value does). It is also keyed on the URL, the user and the
+    Accept header. Computing it costs one query, so an
+    unchanged list is answered with a 304 before any filtering or
+    serialization.
+    """
+    def etag_func(request, *args, **kwargs):
+        parts = [
+            request.get_full_path(),
+            request.user.pk,
+            request.META.get('HTTP_ACCEPT', ''),
+            TableGeneration.stamp(*generations),
+        ]
+        if time_bucket:
+            parts.append(int(time.time() // time_bucket))
+        if extra:
+            parts.append(extra())
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+    return etag_func
+
+
+events_etag = generation_etag(
+    TableGeneration.EVENTS, TableGeneration.EVENT_PARTICIPANTS, time_bucket=60,
+)
+resources_etag = generation_etag(
+    TableGeneration.RESOURCES, TableGeneration.COMMENTS,
+)
+erasmus_programs_etag = generation_etag(
+    TableGeneration.CATALOG, TableGeneration.REVIEWS,
+    TableGeneration.ERASMUS_PARTICIPANTS, TableGeneration.FAVOURITES,
+    extra=logo_variants.manifest_version,  # the serialized logo URLs come from the variants manifest
+)
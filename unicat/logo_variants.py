@@ -0,0 +1,126 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+
+from django.templatetags.static import static
+from PIL import Image, ImageOps, features
+
+# Paths relative to the app's static directory
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+LOGO_DIR = 'unicat/images/erasmus'
+VARIANT_DIR = 'unicat/images/erasmus/variants'
+MANIFEST_PATH = os.path.join(STATIC_DIR, VARIANT_DIR, 'manifest.json')
+
+# Bounding boxes (px) the logos are rendered in: 1x and 2x of the 80px card logo
+BOXES = (80, 160)
+
+# (extension, Pillow format, MIME type, save options), preferred first; JPEG is the <img> fallback
+FORMATS = (
+    ('avif', 'AVIF', 'image/avif', {'quality': 50}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 6}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def available_formats():
+    """FORMATS this Pillow build can encode (AVIF needs libavif)."""
+    return [fmt for fmt in FORMATS if fmt[1] == 'JPEG' or features.check(fmt[0])]
+
+
+def variant_stem(static_image):
+    stem = os.path.splitext(static_image)[0]
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', stem).strip('-')[:60] or 'logo'
+
+
+def build_variants(source_path, static_image, formats=None):
+    """
+    Encode one logo into every box and format. Returns the manifest entry
+    and {file name: bytes}; file names carry a hash of their content, so
+    they can be cached forever.
+    """
+    formats = formats or available_formats()
+    with open(source_path, 'rb') as source:
+        data = source.read()
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    entry = {'source_hash': hashlib.sha256(data).hexdigest(), 'sizes': []}
+    files = {}
+    for box in BOXES:
+        scale = min(box / image.width, box / image.height, 1.0)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        if entry['sizes'] and size == tuple(entry['sizes'][-1][:2]):
+            break  # the source is too small for a sharper variant
+        resized = image.resize(size, Image.LANCZOS) if size != image.size else image
+        names = {}
+        for extension, pillow_format, _, options in formats:
+            frame = resized
+            if pillow_format == 'JPEG' and has_alpha:
+                frame = Image.new('RGB', resized.size, 'white')
+                frame.paste(resized, mask=resized.getchannel('A'))
+            buffer = io.BytesIO()
+            frame.save(buffer, pillow_format, **options)
+            content = buffer.getvalue()
+            name = f'{variant_stem(static_image)}-{box}.{hashlib.sha256(content).hexdigest()[:12]}.{extension}'
+            files[name] = content
+            names[extension] = name
+        entry['sizes'].append([size[0], size[1], names])
+    return entry, files
+
+
+_lock = threading.Lock()
+_manifest = (None, {})
+
+
+def load_manifest():
+    """The variant manifest, re-read whenever build_logo_variants rewrites it."""
+    global _manifest
+    try:
+        key = (MANIFEST_PATH, os.stat(MANIFEST_PATH).st_mtime_ns)
+    except FileNotFoundError:
+        return {}
+    if _manifest[0] != key:
+        with _lock:
+            if _manifest[0] != key:
+                with open(MANIFEST_PATH, encoding='utf-8') as manifest_file:
+                    _manifest = (key, json.load(manifest_file))
+    return _manifest[1]
+
+
+def manifest_version():
+    """Changes whenever build_logo_variants rewrites the manifest (0 when there is none)."""
+    try:
+        return os.stat(MANIFEST_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def logo_sources(static_image):
+    """
+    Everything needed to render a responsive logo, or None when no variants
+    were built for it: {'src', 'srcset', 'width', 'height', 'sources':
+    [{'type', 'srcset'}, ...]} with width/height of the 1x variant.
+    """
+    entry = load_manifest().get(static_image) if static_image else None
+    if not entry:
+        return None
+    sizes = entry['sizes']
+    width, height = sizes[0][0], sizes[0][1]
+
+    def srcset(extension):
+        return ', '.join(f"{static(f'{VARIANT_DIR}/{names[extension]}')} {w}w"
+                         for w, _, names in sizes if extension in names)
+
+    return {
+        'src': static(f"{VARIANT_DIR}/{sizes[0][2]['jpg']}"),
+        'srcset': srcset('jpg'),
+        'sizes': f'{width}px',
+        'width': width,
+        'height': height,
+        'sources': [{'type': mime, 'srcset': srcset(extension)}
+                    for extension, _, mime, _ in FORMATS if extension != 'jpg' and extension in sizes[0][2]],
+    }
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from unicat import logo_variants
+
+
+class Command(BaseCommand):
+    help = 'Genera miniatures AVIF/WebP/JPEG amb nom hashejat per a cada logo i el manifest que les descriu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                            help='Logos codificats en paral·lel')
+        parser.add_argument('--force', action='store_true',
+                            help='Torna a generar-ho tot, encara que l\'original no hagi canviat')
+
+    def handle(self, *args, **options):
+        logo_dir = os.path.join(logo_variants.STATIC_DIR, logo_variants.LOGO_DIR)
+        variant_dir = os.path.join(logo_variants.STATIC_DIR, logo_variants.VARIANT_DIR)
+        os.makedirs(variant_dir, exist_ok=True)
+        formats = logo_variants.available_formats()
+        self.stdout.write(f"Formats: {', '.join(fmt[1] for fmt in formats)}")
+
+        try:
+            with open(logo_variants.MANIFEST_PATH, encoding='utf-8') as manifest_file:
+                old_manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            old_manifest = {}
+        existing_files = set(os.listdir(variant_dir))
+
+        def up_to_date(static_image):
+            entry = old_manifest.get(static_image)
+            if options['force'] or not entry:
+                return False
+            # Rebuilt when a format was added or dropped, or a variant file went missing
+            if any(set(names) != {fmt[0] for fmt in formats} for *_, names in entry['sizes']):
+                return False
+            if not all(name in existing_files for *_, names in entry['sizes'] for name in names.values()):
+                return False
+            with open(os.path.join(logo_dir, static_image), 'rb') as source:
+                return hashlib.sha256(source.read()).hexdigest() == entry['source_hash']
+
+        def build(static_image):
+            try:
+                if up_to_date(static_image):
+                    return static_image, old_manifest[static_image], {}, None
+                entry, files = logo_variants.build_variants(os.path.join(logo_dir, static_image), static_image,
+                                                            formats)
+                return static_image, entry, files, None
+            except Exception as e:
+                return static_image, None, {}, e
+
+        logos = sorted(name for name in os.listdir(logo_dir) if os.path.isfile(os.path.join(logo_dir, name)))
+        manifest = {}
+        built = errors = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for static_image, entry, files, error in pool.map(build, logos):
+                if error is not None:
+                    self.stdout.write(self.style.WARNING(f"No s'ha pogut processar {static_image}: {error}"))
+                    errors += 1
+                    continue
+                for name, content in files.items():
+                    if name not in existing_files:
+                        with open(os.path.join(variant_dir, name), 'wb') as variant_file:
+                            variant_file.write(content)
+                        existing_files.add(name)
+                built += bool(files)
+                manifest[static_image] = entry
+
+        temporary = f'{logo_variants.MANIFEST_PATH}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, separators=(',', ':'), sort_keys=True)
+        os.replace(temporary, logo_variants.MANIFEST_PATH)
+
+        # Variants que ja no surten al manifest (logos esborrats o canviats)
+        referenced = {name for entry in manifest.values() for *_, names in entry['sizes'] for name in names.values()}
+        manifest_name = os.path.basename(logo_variants.MANIFEST_PATH)
+        stale = [name for name in existing_files if name not in referenced and name != manifest_name]
+        for name in stale:
+            os.remove(os.path.join(variant_dir, name))
+
+        original_bytes = sum(os.path.getsize(os.path.join(logo_dir, name)) for name in manifest)
+        preferred = formats[0][0]
+        variant_bytes = sum(os.path.getsize(os.path.join(variant_dir, entry['sizes'][0][2][preferred]))
+                            for entry in manifest.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(manifest)} logos ({built} regenerats, {errors} errors, {len(stale)} variants antigues esborrades). "
+            f"Originals: {original_bytes / 1024:.0f} KB; variants 1x en {preferred.upper()}: {variant_bytes / 1024:.0f} KB"
+        ))
@@ -1,47 +1,153 @@
 # unicat/management/commands/copy_to_static.py
+import hashlib
+import json
 import os
 import shutil
-from django.core.management.base import BaseCommand
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from unicat import logo_variants
+from unicat.catalog import bump_catalog_version
 from unicat.models import ErasmusProgram
 
 class Command(BaseCommand):
-    help = 'Copia imatges de media/ a static/ mantenint els noms originals'
+    help = 'Copia les imatges noves o modificades de media/ a static/ mantenint els noms originals'
+
+    # Manifest of what was last published: {name: [size, mtime_ns, sha256]}
+    MANIFEST_NAME = '.static-manifest.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--media-dir', default=os.path.join(settings.MEDIA_ROOT, 'erasmus_images'),
+                            help='Directori d\'origen dels logos')
+        parser.add_argument('--static-dir', default=os.path.join(logo_variants.STATIC_DIR, logo_variants.LOGO_DIR),
+                            help='Directori estàtic de destinació')
+        parser.add_argument('--no-links', action='store_true',
+                            help='Copia sempre els fitxers en lloc de crear enllaços durs')
+        parser.add_argument('--clear-missing', action='store_true',
+                            help='Treu el logo dels programes el fitxer dels quals no és enlloc (per defecte només es llisten)')
 
     def handle(self, *args, **options):
-        media_dir = 'media/erasmus_images'
-        static_dir = 'unicat/static/unicat/images/erasmus'
+        started = time.monotonic()
+        media_dir = options['media_dir']
+        static_dir = options['static_dir']
+        if not os.path.isdir(media_dir):
+            raise CommandError(f"No existeix el directori d'origen {media_dir}")
         os.makedirs(static_dir, exist_ok=True)
-        programs_with_image = ErasmusProgram.objects.exclude(image__isnull=True).exclude(image='')
-        self.stdout.write(f"Trobats {programs_with_image.count()} programes amb imatges")
-        copied = 0
-        errors = 0
-        for program in programs_with_image:
+        manifest_path = os.path.join(media_dir, self.MANIFEST_NAME)
+        manifest = self.load_manifest(manifest_path)
+
+        published = {entry.name: entry.stat().st_size for entry in os.scandir(static_dir) if entry.is_file()}
+        sources = [entry for entry in os.scandir(media_dir) if entry.is_file()
+                   and not entry.name.startswith('.') and not entry.name.endswith(('.json', '.tmp'))]
+
+        copied = linked = unchanged = errors = 0
+        new_manifest = {}
+        for entry in sources:
             try:
-                if not program.image:
+                stat = entry.stat()
+                previous = manifest.get(entry.name)
+                if (previous and previous[:2] == [stat.st_size, stat.st_mtime_ns]
+                        and published.get(entry.name) == stat.st_size):
+                    # Same size and mtime as last time and already published: nothing to read
+                    new_manifest[entry.name] = previous
+                    unchanged += 1
                     continue
-                current_filename = os.path.basename(program.image.name)
-                current_path = os.path.join(media_dir, current_filename)
-                new_path = os.path.join(static_dir, current_filename)
-                if os.path.exists(current_path):
-                    shutil.copy2(current_path, new_path)
-                    program.static_image = current_filename
-                    program.save(update_fields=['static_image'])
-                    self.stdout.write(f"Copiat: {program.university[:40]} -> {current_filename}")
-                    copied += 1
+                digest = self.file_hash(entry.path)
+                target = os.path.join(static_dir, entry.name)
+                if (previous and previous[2] == digest and published.get(entry.name) == stat.st_size
+                        and self.file_hash(target) == digest):
+                    new_manifest[entry.name] = [stat.st_size, stat.st_mtime_ns, digest]
+                    unchanged += 1
+                    continue
+                if self.publish(entry.path, target, use_links=not options['no_links']):
+                    linked += 1
                 else:
-                    self.stdout.write(f"Fitxer no trobat: {current_path}")
-                    errors += 1
-            except Exception as e:
-                self.stdout.write(f"Error amb {program.university}: {str(e)}")
+                    copied += 1
+                published[entry.name] = stat.st_size
+                new_manifest[entry.name] = [stat.st_size, stat.st_mtime_ns, digest]
+                self.stdout.write(f"Publicat: {entry.name}")
+            except OSError as e:
+                self.stdout.write(f"Error amb {entry.name}: {str(e)}")
                 errors += 1
-        self.stdout.write(self.style.SUCCESS(f"\n🎉 RESULTAT:"))
-        self.stdout.write(f"Copiades: {copied} imatges")
+
+        if new_manifest != manifest:
+            self.save_manifest(manifest_path, new_manifest)
+
+        # Programes que apunten a un logo que no existeix enlloc: només es llisten, llevat de --clear-missing
+        source_names = {entry.name for entry in sources}
+        missing = []
+        total_programs = with_static = 0
+        for program in ErasmusProgram.objects.only('id', 'index', 'static_image'):
+            total_programs += 1
+            if not program.static_image:
+                continue
+            if program.static_image in published:
+                with_static += 1
+            elif program.static_image not in source_names:
+                self.stdout.write(self.style.WARNING(f"Fitxer no trobat per al programa #{program.index}: "
+                                                     f"{program.static_image}"))
+                missing.append(program)
+        if missing and options['clear_missing']:
+            for program in missing:
+                program.static_image = None
+            with transaction.atomic():
+                ErasmusProgram.objects.bulk_update(missing, ['static_image'], batch_size=500)
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f"\n🎉 RESULTAT ({time.monotonic() - started:.2f}s):"))
+        self.stdout.write(f"Copiades: {copied} imatges, enllaçades: {linked}, sense canvis: {unchanged}")
         self.stdout.write(f"Errors: {errors}")
         self.stdout.write(f"Destinació: {static_dir}")
-        total_programs = ErasmusProgram.objects.count()
-        with_static = ErasmusProgram.objects.exclude(static_image__isnull=True).exclude(static_image='').count()
-        with_media = ErasmusProgram.objects.exclude(image__isnull=True).exclude(image='').count()
         self.stdout.write(f"\nESTAT FINAL:")
         self.stdout.write(f"Total programes: {total_programs}")
         self.stdout.write(f"Amb imatge estàtica: {with_static}")
-        self.stdout.write(f"Amb imatge media: {with_media}")
\ No newline at end of file
+        self.stdout.write(f"Sense fitxer{' (restablerts)' if options['clear_missing'] else ''}: {len(missing)}")
+
+    @staticmethod
+    def publish(source, target, use_links=True):
+        """
+        Posa `source` a `target` de forma atòmica: amb un enllaç dur si el
+        sistema de fitxers ho permet (sense copiar bytes), si no amb una
+        còpia. Retorna si s'ha enllaçat.
+        """
+        if os.path.exists(target) and os.path.samefile(source, target):
+            # Ja enllaçat: el canvi a l'origen ja és visible (i rename() sobre el mateix inode no faria res)
+            return True
+        temporary = f'{target}.tmp'
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        linked = False
+        if use_links:
+            try:
+                os.link(source, temporary)
+                linked = True
+            except OSError:
+                pass  # un altre dispositiu, o un sistema de fitxers sense enllaços durs
+        if not linked:
+            shutil.copy2(source, temporary)
+        os.replace(temporary, target)
+        return linked
+
+    @staticmethod
+    def file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as image_file:
+            for chunk in iter(lambda: image_file.read(1 << 16), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def load_manifest(path):
+        try:
+            with open(path, encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def save_manifest(path, manifest):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, separators=(',', ':'), sort_keys=True)
+        os.replace(temporary, path)
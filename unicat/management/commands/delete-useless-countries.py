@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
 from unicat.models import Country, ErasmusProgram
+from unicat.reference_data import apply_diff, countries_in_use, diff_rows
 
 
 class Command(BaseCommand):
@@ -26,13 +26,10 @@ class Command(BaseCommand):
             self.style.SUCCESS('Buscant països sense programes Erasmus...')
         )
         
-        # Cerca països sense cap programa Erasmus
-        countries_without_programs = Country.objects.filter(
-            erasmusprogram__isnull=True
-        ).distinct()
-        
-        total_countries = Country.objects.count()
-        useless_countries_count = countries_without_programs.count()
+        # Cerca països sense cap programa Erasmus: un origen buit on només es conserven els que estan en ús
+        diff = diff_rows(Country, {}, (), keep=countries_in_use())
+        total_countries = len(diff.deleted) + len(diff.kept)
+        useless_countries_count = len(diff.deleted)
         
         if useless_countries_count == 0:
             self.stdout.write(
@@ -44,7 +41,7 @@ class Command(BaseCommand):
             self.style.WARNING(f'S\'han trobat {useless_countries_count} països sense programes Erasmus de {total_countries} països totals.')
         )
         self.stdout.write('\nPaïsos que s\'eliminarien:')
-        for country in countries_without_programs:
+        for country in diff.deleted:
             self.stdout.write(f'   {country.name} ({country.code})')
         
         if dry_run:
@@ -68,30 +65,25 @@ class Command(BaseCommand):
                 )
                 return
         
-        # Elimina països dins d'una transacció
+        # Elimina països en bloc dins d'una transacció
         try:
-            with transaction.atomic():
-                deleted_countries = []
-                for country in countries_without_programs:
-                    deleted_countries.append(f'{country.name} ({country.code})')
-                deleted_count, _ = countries_without_programs.delete()
-                self.stdout.write(
-                    self.style.SUCCESS(f'\nEliminats {deleted_count} països:')
-                )
-                for country_info in deleted_countries:
-                    self.stdout.write(f'   {country_info}')
-                remaining_countries = Country.objects.count()
-                self.stdout.write(
-                    self.style.SUCCESS(f'\nEstadístiques finals:')
-                )
-                self.stdout.write(f'   Països eliminats: {deleted_count}')
-                self.stdout.write(f'   Països restants: {remaining_countries}')
-                self.stdout.write(f'   Total programes Erasmus: {ErasmusProgram.objects.count()}')
+            apply_diff(diff, catalog=True)
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Error durant l\'eliminació: {str(e)}')
             )
             raise
+        self.stdout.write(
+            self.style.SUCCESS(f'\nEliminats {useless_countries_count} països:')
+        )
+        for country in diff.deleted:
+            self.stdout.write(f'   {country.name} ({country.code})')
+        self.stdout.write(
+            self.style.SUCCESS(f'\nEstadístiques finals:')
+        )
+        self.stdout.write(f'   Països eliminats: {useless_countries_count}')
+        self.stdout.write(f'   Països restants: {len(diff.kept)}')
+        self.stdout.write(f'   Total programes Erasmus: {ErasmusProgram.objects.count()}')
 
     def get_version(self):
         return "1.0.0"
\ No newline at end of file
@@ -1,76 +1,120 @@
-import pandas as pd
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service 
-from webdriver_manager.chrome import ChromeDriverManager
-import requests
-from unicat.models import ErasmusProgram
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 
-from django.core.management.base import BaseCommand
-import os
-import csv
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from unicat.catalog import bump_catalog_version
+from unicat.models import ErasmusProgram
+from unicat.ranking_snapshots import page_cities, parse_snapshot, snapshot_name, snapshot_pages
 
 
 class Command(BaseCommand):
     help = 'Importa ciutats de les universitats des de QS Rankings i les associa amb els programes existents'
 
+    # Ciutats que la pàgina de QS no té (o té malament), per índex
+    CITY_OVERRIDES = {205: 'Paris', 324: 'Miami'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshots',
+                            help='Directori amb pàgines del rànquing desades (page-1.html, ...); '
+                                 'si s\'indica, no es fa servir el navegador')
+        parser.add_argument('--save-snapshots',
+                            help='Desa les pàgines renderitzades en aquest directori per a futures execucions')
+        parser.add_argument('--base-url', default='https://www.topuniversities.com',
+                            help='Arrel del web de rànquings (per defecte QS)')
+        parser.add_argument('--pages', type=int, default=11, help='Pàgines del rànquing a recórrer')
+        parser.add_argument('--items-per-page', type=int, default=150, help='Universitats per pàgina')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                            help='Processos per analitzar les pàgines desades')
+        parser.add_argument('--clear-missing', action='store_true',
+                            help='Esborra la ciutat dels programes que no surten a cap pàgina')
+
     def handle(self, *args, **options):
-        ErasmusProgram.objects.all().update(city=None)  # Esborra les ciutats existents
+        started = time.monotonic()
+        if options['snapshots']:
+            cities = self.parse_snapshots(options['snapshots'], options['items_per_page'], options['workers'])
+        else:
+            cities = self.render_pages(options)
+        for index, city in self.CITY_OVERRIDES.items():
+            if index in cities:
+                cities[index] = city
+        self.stdout.write(f"Ciutats trobades: {len(cities)}")
 
-        for i in range(1,12):
-            url=f"https://www.topuniversities.com/world-university-rankings?page={i}&items_per_page=150"
-            response = requests.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
+        # Primer tot el mapa, després una sola transacció: el catàleg no es queda mai sense ciutats
+        changed = []
+        matched = 0
+        for program in ErasmusProgram.objects.only('id', 'index', 'city'):
+            if program.index in cities:
+                city = cities[program.index]
+                matched += 1
+            elif options['clear_missing']:
+                city = None
+            else:
+                continue
+            if program.city != city:
+                program.city = city
+                changed.append(program)
+        with transaction.atomic():
+            ErasmusProgram.objects.bulk_update(changed, ['city'], batch_size=500)
+        if changed:
+            bump_catalog_version()
 
-            options = webdriver.ChromeOptions()
-            options.add_argument('--headless')
-            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-            driver.get(url)
-            time.sleep(5)
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, "html.parser")
-            driver.quit()
-            location_divs = soup.find_all('div', class_='location')
-            self.stdout.write(f"Divs de localització trobats a la pàgina {i}: {len(location_divs)}")
-            offset = (i - 1) * 150
-            for j, div in enumerate(location_divs):
-                item_index = offset + j + 1
-                self.stdout.write(f"Processant item index {item_index}")
-                try:
-                    program = ErasmusProgram.objects.get(index=item_index)
-                    if item_index == 324:
-                        city="Miami"
-                        program.city = "Miami"
-                        self.stdout.write(self.style.SUCCESS(
-                            f"Actualitzat programa #{item_index}: {program.university} amb ciutat: {city}"
-                        ))
-                        program.save()
-                    elif item_index == 205:
-                        city="Paris"
-                        program.city = "Paris"
-                        self.stdout.write(self.style.SUCCESS(
-                            f"Actualitzat programa #{item_index}: {program.university} amb ciutat: {city}"
-                        ))
-                        program.save()
-                    else:
-                        location_text = div.get_text(strip=True)
-                        location_text = ' '.join(location_text.split())
-                        if ',' in location_text:
-                            city = location_text.split(',')[0].strip()
-                        else:
-                            city = location_text
-                        program.city = city
-                        program.save()
-                        self.stdout.write(self.style.SUCCESS(
-                            f"Actualitzat programa #{item_index}: {program.university} amb ciutat: {city}"
-                        ))
-                except ErasmusProgram.DoesNotExist:
-                    self.stdout.write(self.style.WARNING(
-                        f"No s'ha trobat programa amb index {item_index}"
-                    ))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(
-                        f"Error actualitzant programa #{item_index}: {str(e)}"
-                    ))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(changed)} programes actualitzats, {len(cities) - matched} índexs sense programa "
+            f"({time.monotonic() - started:.2f}s)"
+        ))
+
+    def parse_snapshots(self, directory, per_page, workers):
+        """{índex: ciutat} a partir de les pàgines desades, analitzades en paral·lel."""
+        if not os.path.isdir(directory):
+            raise CommandError(f"No existeix el directori {directory}")
+        pages = snapshot_pages(directory)
+        if not pages:
+            raise CommandError(f"No hi ha cap pàgina desada (page-N.html) a {directory}")
+        cities = {}
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pages)))) as pool:
+            futures = [pool.submit(parse_snapshot, path, page, per_page) for page, path in pages]
+            for future in futures:
+                page, page_result = future.result()
+                self.stdout.write(f"Divs de localització trobats a la pàgina {page}: {len(page_result)}")
+                cities.update(page_result)
+        return cities
 
+    def render_pages(self, options):
+        """{índex: ciutat} renderitzant cada pàgina del rànquing amb un sol Chrome headless."""
+        # Selenium només cal sense --snapshots
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        per_page = options['items_per_page']
+        if options['save_snapshots']:
+            os.makedirs(options['save_snapshots'], exist_ok=True)
+        driver_options = webdriver.ChromeOptions()
+        driver_options.add_argument('--headless')
+        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=driver_options)
+        cities = {}
+        try:
+            for page in range(1, options['pages'] + 1):
+                url = (f"{options['base_url'].rstrip('/')}/world-university-rankings"
+                       f"?page={page}&items_per_page={per_page}")
+                driver.get(url)
+                WebDriverWait(driver, 15).until(
+                    expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'div.location'))
+                )
+                html = driver.page_source
+                if options['save_snapshots']:
+                    with open(os.path.join(options['save_snapshots'], snapshot_name(page)), 'w',
+                              encoding='utf-8') as html_file:
+                        html_file.write(html)
+                page_result = page_cities(html, (page - 1) * per_page)
+                self.stdout.write(f"Divs de localització trobats a la pàgina {page}: {len(page_result)}")
+                cities.update(page_result)
+        finally:
+            driver.quit()
+        return cities
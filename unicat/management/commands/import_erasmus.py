@@ -1,13 +1,48 @@
 import os
 import csv
 import time
+from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand
-from django.db.models import Q
-from unicat.models import Country, ErasmusProgram
+from django.db import transaction
+from django.db.models import Count
+from unicat.catalog import deferred_catalog_bumps, normalize
+from unicat.models import Country, ErasmusProgram, ImportCheckpoint, StagedErasmusProgram
+from unicat.neighbours import rebuild_program_neighbours
 
 class Command(BaseCommand):
     help = 'Importa programes Erasmus des d\'un fitxer CSV eliminant els camps no vàlids'
 
+    # Mapeig de camps del CSV als camps del model
+    FIELD_MAPPING = {
+        "INDEX": "index",
+        'institution': 'university',
+        'rank display': 'rank',
+        'location code': 'country_code',
+        'size': 'size',
+        'focus': 'focus',
+        'research': 'research',
+        'status': 'status',
+        'ar score': 'ar_score',
+        'ar rank': 'ar_rank',
+        'er score': 'er_score',
+        'er rank': 'er_rank',
+        'fsr score': 'fsr_score',
+        'fsr rank': 'fsr_rank',
+        'cpf score': 'cpf_score',
+        'cpf rank': 'cpf_rank',
+        'ifr score': 'ifr_score',
+        'ifr rank': 'ifr_rank',
+        'isr score': 'isr_score',
+        'isr rank': 'isr_rank',
+        'irn score': 'irn_score',
+        'irn rank': 'irn_rank',
+        'ger score': 'ger_score',
+        'ger rank': 'ger_rank',
+        'SUS SCORE': 'sus_score',
+        'SUS RANK': 'sus_rank',
+        'Overall Score': 'overall_score'
+    }
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--csv-file',
@@ -20,26 +55,71 @@ class Command(BaseCommand):
             action='store_true',
             help='Esborra tots els programes existents abans d\'importar'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Importa amb escriptures massives (bulk_create/bulk_update) en una sola transacció'
+        )
+        parser.add_argument(
+            '--reload',
+            action='store_true',
+            help='Recàrrega completa: valida el fitxer en una taula intermèdia i reconcilia el catàleg '
+                 'en una sola transacció, conservant els identificadors i les dades dels usuaris'
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Amb --reload, esborra els programes que ja no apareixen al fitxer'
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Importació en streaming per a fitxers molt grans: confirma cada lot i en desa un punt de control'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Amb --stream, continua des de l\'últim lot confirmat d\'aquest fitxer'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Files per sentència (--bulk, --reload) o per lot confirmat (--stream); per defecte 500'
+        )
 
     def handle(self, *args, **options):
-        ErasmusProgram.objects.all().delete()  # Esborra tots els programes existents si --clear és True
         csv_file_path = options['csv_file']
         
         if not os.path.exists(csv_file_path):
             self.stdout.write(self.style.ERROR(f"El fitxer {csv_file_path} no existeix"))
             return
             
-        if options['clear']:
-            if input("Estàs segur que vols esborrar tots els programes? (s/n): ").lower() == 's':
-                ErasmusProgram.objects.all().delete()
-                self.stdout.write(self.style.SUCCESS("S'han esborrat tots els programes"))
-        
-        self.import_from_csv(csv_file_path)
+        # Una sola versió nova del catàleg al final, no una per fila desada
+        with deferred_catalog_bumps():
+            if options['clear']:
+                if input("Estàs segur que vols esborrar tots els programes? (s/n): ").lower() == 's':
+                    ErasmusProgram.objects.all().delete()
+                    self.stdout.write(self.style.SUCCESS("S'han esborrat tots els programes"))
+
+            if options['reload']:
+                if not self.reload_from_csv(csv_file_path, options['batch_size'], options['prune']):
+                    return
+            elif options['stream']:
+                if not self.stream_from_csv(csv_file_path, options['batch_size'], options['resume']):
+                    return
+            elif options['bulk']:
+                self.bulk_import_from_csv(csv_file_path, options['batch_size'])
+            else:
+                self.import_from_csv(csv_file_path)
+        total = rebuild_program_neighbours()
+        self.stdout.write(f"Universitats similars recalculades per a {total} programes")
     
     def import_from_csv(self, csv_file_path):
         created = 0
         updated = 0
         errors = 0
+        countries = Country.objects.in_bulk()
         
         try:
             with open(csv_file_path, 'r', encoding='utf-8-sig') as csvfile:
@@ -57,7 +137,7 @@ class Command(BaseCommand):
                         existing = ErasmusProgram.objects.filter(university__iexact=uni_name).first()
                         
                         # Preparar les dades filtrant els camps no vàlids
-                        program_data = self.prepare_program_data(row)
+                        program_data = self.prepare_program_data(row, countries)
                         
                         if existing:
                             # Actualitzar només els camps que no siguin None
@@ -85,40 +165,384 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"Error obrint el fitxer CSV: {str(e)}"))
     
-    def prepare_program_data(self, row):
-        """
-        Prepara les dades filtrant els camps no vàlids i fent les conversions necessàries
-        """
-        # Mapeig de camps del CSV als camps del model
-        field_mapping = {
-            "INDEX": "index",
-            'institution': 'university',
-            'rank display': 'rank',
-            'location code': 'country_code',
-            'size': 'size',
-            'focus': 'focus',
-            'research': 'research',
-            'status': 'status',
-            'ar score': 'ar_score',
-            'ar rank': 'ar_rank',
-            'er score': 'er_score',
-            'er rank': 'er_rank',
-            'fsr score': 'fsr_score',
-            'fsr rank': 'fsr_rank',
-            'cpf score': 'cpf_score',
-            'cpf rank': 'cpf_rank',
-            'ifr score': 'ifr_score',
-            'ifr rank': 'ifr_rank',
-            'isr score': 'isr_score',
-            'isr rank': 'isr_rank',
-            'irn score': 'irn_score',
-            'irn rank': 'irn_rank',
-            'ger score': 'ger_score',
-            'ger rank': 'ger_rank',
-            'SUS SCORE': 'sus_score',
-            'SUS RANK': 'sus_rank',
-            'Overall Score': 'overall_score'
-        }
+    def bulk_import_from_csv(self, csv_file_path, batch_size):
+        """
+        Mateix resultat que import_from_csv, però amb els països i els
+        programes existents precarregats en memòria: es llegeix tot el CSV,
+        es decideix què cal crear o actualitzar i s'escriu amb
+        bulk_create / bulk_update dins d'una sola transacció.
+        """
+        started = time.monotonic()
+        countries = Country.objects.in_bulk()
+        existing = {}
+        for program in ErasmusProgram.objects.order_by('id'):
+            existing.setdefault(self.program_key(program.university), program)
+
+        rows = []
+        errors = 0
+        try:
+            with open(csv_file_path, 'r', encoding='utf-8-sig') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    try:
+                        program_row = self.read_program_row(row, countries)
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(f"Error processant {row.get('institution', 'Desconeguda')}: {str(e)}"))
+                        errors += 1
+                        continue
+                    if program_row is not None:
+                        rows.append(program_row)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error obrint el fitxer CSV: {str(e)}"))
+            return
+
+        with transaction.atomic():
+            created, updated, unchanged = self.upsert_programs(rows, existing, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importació completada en {time.monotonic() - started:.1f}s: {len(created)} creats, "
+            f"{updated} actualitzats, {unchanged} sense canvis, {errors} errors"
+        ))
+
+    def read_program_row(self, row, countries):
+        """(clau, dades convertides) d'una fila del CSV, o None si no té nom d'universitat."""
+        uni_name = row.get('institution', '').strip()
+        if not uni_name:
+            self.stdout.write(self.style.WARNING("Fila sense nom d'universitat, saltant..."))
+            return None
+        return self.program_key(uni_name), self.clean_program_data(self.prepare_program_data(row, countries))
+
+    def upsert_programs(self, rows, existing, batch_size):
+        """
+        Aplica les files (clau, dades) sobre els programes de `existing`
+        ({clau: ErasmusProgram}) i escriu els canvis amb bulk_create /
+        bulk_update. No obre cap transacció. Retorna (programes creats,
+        nombre d'actualitzats, nombre de sense canvis).
+        """
+        to_create = {}
+        to_update = {}
+        matched = set()
+        changed_fields = set()
+        for key, program_data in rows:
+            program = existing.get(key) or to_create.get(key)
+            if program is None:
+                to_create[key] = ErasmusProgram(**program_data)
+                continue
+
+            # Actualitzar només els camps que no siguin None i hagin canviat
+            changed = [field for field, value in program_data.items()
+                       if value is not None and self.differs(program, field, value)]
+            for field in changed:
+                setattr(program, field, program_data[field])
+            if program.pk is not None:
+                matched.add(program.pk)
+                if changed:
+                    to_update[program.pk] = program
+                    changed_fields.update(changed)
+
+        # bulk_create / bulk_update no criden save(): cal omplir els límits de rànquing aquí
+        for program in [*to_create.values(), *to_update.values()]:
+            program.set_rank_bounds()
+        if changed_fields & set(ErasmusProgram.RANK_FIELDS):
+            changed_fields.update(ErasmusProgram.rank_bound_fields())
+
+        created = ErasmusProgram.objects.bulk_create(list(to_create.values()), batch_size=batch_size)
+        if to_update:
+            ErasmusProgram.objects.bulk_update(list(to_update.values()), sorted(changed_fields),
+                                               batch_size=batch_size)
+        return created, len(to_update), len(matched) - len(to_update)
+
+    def stream_from_csv(self, csv_file_path, batch_size, resume):
+        """
+        Importació per a fitxers molt grans: es llegeix el CSV fila a fila i
+        cada lot de `batch_size` files es confirma en la seva pròpia
+        transacció, juntament amb un punt de control (posició en bytes i
+        número de fila) a ImportCheckpoint. Amb --resume es continua des de
+        l'últim lot confirmat. En memòria només hi ha el lot actual i el
+        mapa clau -> id dels programes. Retorna si s'ha completat.
+        """
+        source = os.path.abspath(csv_file_path)
+        stat = os.stat(source)
+        checkpoint = ImportCheckpoint.objects.filter(source=source).first()
+        if resume and checkpoint is not None:
+            if (checkpoint.file_size, checkpoint.file_mtime) != (stat.st_size, stat.st_mtime):
+                self.stdout.write(self.style.ERROR(
+                    "El fitxer ha canviat des de l'últim punt de control: no es pot reprendre"
+                ))
+                return False
+            self.stdout.write(f"Reprenent des de la fila {checkpoint.row_number} (byte {checkpoint.byte_offset})")
+        else:
+            if resume:
+                self.stdout.write(self.style.WARNING(
+                    "No hi ha cap punt de control per a aquest fitxer: es comença des del principi"
+                ))
+            checkpoint, _ = ImportCheckpoint.objects.update_or_create(source=source, defaults={
+                'byte_offset': 0, 'row_number': 0, 'file_size': stat.st_size, 'file_mtime': stat.st_mtime,
+            })
+
+        countries = Country.objects.in_bulk()
+        key_ids = {}
+        for program_id, university in ErasmusProgram.objects.order_by('id').values_list('id', 'university').iterator():
+            key_ids.setdefault(self.program_key(university), program_id)
+
+        started = time.monotonic()
+        totals = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        processed = 0
+        row_number = checkpoint.row_number
+        batch = []
+        offset = checkpoint.byte_offset
+
+        def commit():
+            created, updated, unchanged = self.commit_batch(batch, key_ids, checkpoint, offset, row_number,
+                                                            batch_size)
+            totals['created'] += created
+            totals['updated'] += updated
+            totals['unchanged'] += unchanged
+            batch.clear()
+            rate = processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"Fila {row_number}: {totals['created']} creats, {totals['updated']} actualitzats "
+                              f"({rate:.0f} files/s)")
+
+        with open(source, 'rb') as csvfile:
+            for row, offset in self.stream_records(csvfile, checkpoint.byte_offset):
+                processed += 1
+                row_number += 1
+                try:
+                    program_row = self.read_program_row(row, countries)
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Error processant la fila {row_number}: {str(e)}"))
+                    totals['errors'] += 1
+                    program_row = None
+                if program_row is not None:
+                    batch.append(program_row)
+                if processed % batch_size == 0:
+                    commit()
+            if processed % batch_size:
+                commit()
+
+        checkpoint.delete()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Importació completada en {elapsed:.1f}s ({processed / max(elapsed, 1e-6):.0f} files/s): "
+            f"{totals['created']} creats, {totals['updated']} actualitzats, {totals['unchanged']} sense canvis, "
+            f"{totals['errors']} errors"
+        ))
+        return True
+
+    def commit_batch(self, rows, key_ids, checkpoint, offset, row_number, batch_size):
+        """Escriu un lot i avança el punt de control en la mateixa transacció."""
+        ids = {key_ids[key] for key, _ in rows if key in key_ids}
+        programs = ErasmusProgram.objects.in_bulk(ids)
+        existing = {key: programs[key_ids[key]] for key, _ in rows if key_ids.get(key) in programs}
+        with transaction.atomic():
+            created, updated, unchanged = self.upsert_programs(rows, existing, batch_size)
+            checkpoint.byte_offset = offset
+            checkpoint.row_number = row_number
+            checkpoint.save(update_fields=['byte_offset', 'row_number', 'updated_at'])
+        for program in created:
+            key_ids[self.program_key(program.university)] = program.pk
+        return len(created), updated, unchanged
+
+    @staticmethod
+    def stream_records(csvfile, offset):
+        """
+        Genera (fila com a diccionari, posició en bytes just després de la
+        fila) a partir de `offset`. `csvfile` s'ha d'obrir en binari: la
+        posició es compta sobre les línies que el lector CSV ha consumit, de
+        manera que un camp entre cometes de diverses línies es compta sencer.
+        """
+        fieldnames = next(csv.reader([csvfile.readline().decode('utf-8-sig')]))
+        position = max(offset, csvfile.tell())
+        csvfile.seek(position)
+
+        def lines():
+            nonlocal position
+            for line in iter(csvfile.readline, b''):
+                position += len(line)
+                yield line.decode('utf-8')
+
+        for values in csv.reader(lines()):
+            if values:
+                yield dict(zip(fieldnames, values)), position
+
+    def reload_from_csv(self, csv_file_path, batch_size, prune):
+        """
+        Carrega el fitxer a StagedErasmusProgram, el valida i, només si no hi
+        ha cap error, reconcilia els programes en una sola transacció.
+        Retorna si el catàleg s'ha modificat.
+        """
+        started = time.monotonic()
+        staging = self.stage_csv(csv_file_path, batch_size)
+        if staging is None:
+            return False
+        errors, fields = staging
+        errors += self.validate_staging()
+        if errors:
+            for error in errors[:20]:
+                self.stdout.write(self.style.ERROR(error))
+            self.stdout.write(self.style.ERROR(
+                f"Recàrrega cancel·lada: {len(errors)} errors de validació. El catàleg no s'ha modificat "
+                f"(les files carregades es poden revisar a StagedErasmusProgram)"
+            ))
+            return False
+
+        created, updated, unchanged, missing = self.reconcile_staging(fields, batch_size, prune)
+        missing_label = 'esborrats' if prune else 'conservats (no són al fitxer)'
+        self.stdout.write(self.style.SUCCESS(
+            f"Recàrrega completada en {time.monotonic() - started:.1f}s: {created} creats, {updated} actualitzats, "
+            f"{unchanged} sense canvis, {missing} {missing_label}"
+        ))
+        return True
+
+    def stage_csv(self, csv_file_path, batch_size):
+        """
+        Omple la taula intermèdia amb el fitxer. Retorna (errors de conversió,
+        camps del model presents al fitxer), o None si no es pot llegir.
+        """
+        errors = []
+        staged = []
+        try:
+            with open(csv_file_path, 'r', encoding='utf-8-sig') as csvfile:
+                reader = csv.DictReader(csvfile)
+                fields = {self.FIELD_MAPPING[name] for name in reader.fieldnames or () if name in self.FIELD_MAPPING}
+                for row_number, row in enumerate(reader, start=2):
+                    uni_name = row.get('institution', '').strip()
+                    if not uni_name:
+                        errors.append(f"Fila {row_number}: sense nom d'universitat")
+                        continue
+                    try:
+                        program_data = self.clean_program_data(self.prepare_program_data(row))
+                    except ValidationError as e:
+                        errors.append(f"Fila {row_number} ({uni_name}): {' '.join(e.messages)}")
+                        continue
+                    program_data.pop('university', None)
+                    staged.append(StagedErasmusProgram(
+                        row_number=row_number,
+                        index=program_data.pop('index', None),
+                        university=uni_name,
+                        normalized_name=self.normalized_name(uni_name),
+                        country_code=program_data.pop('country_code', None),
+                        data=program_data,
+                    ))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error obrint el fitxer CSV: {str(e)}"))
+            return None
+
+        with transaction.atomic():
+            StagedErasmusProgram.objects.all().delete()
+            StagedErasmusProgram.objects.bulk_create(staged, batch_size=batch_size)
+        return errors, fields
+
+    def validate_staging(self):
+        """Claus duplicades i països desconeguts, comprovats amb consultes agrupades sobre la taula intermèdia."""
+        errors = []
+        staged = StagedErasmusProgram.objects.all()
+        for key, label in (('normalized_name', 'Nom'), ('index', 'INDEX')):
+            duplicates = (staged.exclude(**{f'{key}__isnull': True}).values(key)
+                          .annotate(n=Count('id')).filter(n__gt=1).order_by(key))
+            for row in duplicates:
+                errors.append(f"{label} repetit {row['n']} vegades: {row[key]}")
+        unknown = (staged.exclude(country_code__isnull=True)
+                   .exclude(country_code__in=Country.objects.values('code'))
+                   .values_list('country_code', flat=True).order_by('country_code').distinct())
+        for code in unknown:
+            errors.append(f"País no trobat: {code}")
+        return errors
+
+    def reconcile_staging(self, fields, batch_size, prune):
+        """
+        Aplica la taula intermèdia al catàleg en una sola transacció: cada fila
+        s'aparella amb el programa viu del mateix nom normalitzat o, si no en
+        té, amb el del mateix INDEX (universitats que han canviat de nom).
+        Només s'actualitzen els camps que són al fitxer (`fields`).
+        Els programes aparellats conserven la clau primària i, per tant, els
+        participants, preferits i ressenyes.
+        """
+        with transaction.atomic():
+            live = list(ErasmusProgram.objects.select_for_update().order_by('id'))
+            by_name, by_index = {}, {}
+            for program in live:
+                by_name.setdefault(self.normalized_name(program.university), program)
+                if program.index is not None:
+                    by_index.setdefault(program.index, program)
+
+            staged = list(StagedErasmusProgram.objects.order_by('row_number'))
+            matches = {}
+            claimed = set()
+            for row in staged:
+                program = by_name.get(row.normalized_name)
+                if program is not None and program.pk not in claimed:
+                    matches[row.pk] = program
+                    claimed.add(program.pk)
+            for row in staged:
+                program = by_index.get(row.index)
+                if row.pk not in matches and program is not None and program.pk not in claimed:
+                    matches[row.pk] = program
+                    claimed.add(program.pk)
+
+            to_create, to_update, changed_fields = [], [], set()
+            for row in staged:
+                # El fitxer mana per a les columnes que té: un valor buit també esborra el viu
+                values = {'index': row.index, 'university': row.university,
+                          'country_code': row.country_code, **row.data}
+                values = {('country_code_id' if field == 'country_code' else field): value
+                          for field, value in values.items() if field in fields}
+                program = matches.get(row.pk)
+                if program is None:
+                    to_create.append(ErasmusProgram(**values))
+                    continue
+                changed = [field for field, value in values.items() if self.differs(program, field, value)]
+                if changed:
+                    for field in changed:
+                        setattr(program, field, values[field])
+                    to_update.append(program)
+                    changed_fields.update(changed)
+
+            for program in to_create + to_update:
+                program.set_rank_bounds()
+            if changed_fields & set(ErasmusProgram.RANK_FIELDS):
+                changed_fields.update(ErasmusProgram.rank_bound_fields())
+
+            ErasmusProgram.objects.bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                ErasmusProgram.objects.bulk_update(to_update, sorted(changed_fields), batch_size=batch_size)
+            missing = [program.pk for program in live if program.pk not in claimed]
+            if prune and missing:
+                ErasmusProgram.objects.filter(pk__in=missing).delete()
+            StagedErasmusProgram.objects.all().delete()
+
+        return len(to_create), len(to_update), len(claimed) - len(to_update), len(missing)
+
+    @staticmethod
+    def normalized_name(university):
+        """Nom sense accents, majúscules ni espais repetits ("Politècnica  de" -> "politecnica de")."""
+        return ' '.join(normalize(university).split())
+
+    @staticmethod
+    def program_key(university):
+        """Clau de comparació dels noms d'universitat (com university__iexact)."""
+        return university.strip().lower()
+
+    @staticmethod
+    def clean_program_data(program_data):
+        """Converteix els valors del CSV al tipus de cada camp (per exemple INDEX "12" -> 12)."""
+        cleaned = {}
+        for field, value in program_data.items():
+            if value is not None and not isinstance(value, Country):
+                value = ErasmusProgram._meta.get_field(field).to_python(value)
+            cleaned[field] = value
+        return cleaned
+
+    @staticmethod
+    def differs(program, field, value):
+        if isinstance(value, Country):
+            return program.country_code_id != value.pk
+        return getattr(program, field) != value
+
+    def prepare_program_data(self, row, countries=None):
+        """
+        Prepara les dades filtrant els camps no vàlids i fent les conversions necessàries.
+        Sense `countries` ({codi: Country}), el país es deixa com a codi.
+        """
         
         # Camps numèrics que necessiten conversió
         numeric_fields = [
@@ -130,16 +554,16 @@ class Command(BaseCommand):
         # Preparar les dades
         program_data = {}
         
-        for csv_field, model_field in field_mapping.items():
+        for csv_field, model_field in self.FIELD_MAPPING.items():
             if csv_field in row:
                 # Tractar el país com a cas especial
-                if model_field == 'country_code' and row[csv_field]:
-                    try:
-                        country = Country.objects.get(code=row[csv_field])
-                        program_data[model_field] = country
-                    except Country.DoesNotExist:
+                if model_field == 'country_code' and row[csv_field] and countries is None:
+                    program_data[model_field] = row[csv_field]
+                elif model_field == 'country_code' and row[csv_field]:
+                    country = countries.get(row[csv_field])
+                    if country is None:
                         self.stdout.write(self.style.WARNING(f"País no trobat: {row[csv_field]}"))
-                        program_data[model_field] = None
+                    program_data[model_field] = country
                 
                 # Tractar camps numèrics
                 elif model_field in numeric_fields:
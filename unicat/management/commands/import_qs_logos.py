@@ -1,138 +1,248 @@
-import pandas as pd
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service 
-from webdriver_manager.chrome import ChromeDriverManager
-import requests
-from unicat.models import ErasmusProgram
-import time
-
-from django.core.management.base import BaseCommand
+import hashlib
+import json
+import mimetypes
 import os
-import csv
-import re
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
 import requests
-from urllib.parse import urlparse, unquote
-from django.core.files.base import ContentFile
-import os.path
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from unicat import logo_variants
+from unicat.catalog import bump_catalog_version
+from unicat.models import ErasmusProgram
 
 
 class Command(BaseCommand):
     help = 'Importa logos de les universitats des de QS Rankings i els associa amb les universitats existents'
 
+    # Logos que la pàgina de QS no té (o té malament), per índex
+    LOGO_OVERRIDES = {
+        205: "https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcTeGJfbCGb8HvWcC5vQmuGNTF2AZb1q0NyzkQ&s",
+        324: "https://logos-world.net/wp-content/uploads/2022/02/University-Of-Miami-Symbol.png",
+        1288: "https://upload.wikimedia.org/wikipedia/en/thumb/d/d9/Shahjalal_University_of_Science_and_Technology_logo.png/250px-Shahjalal_University_of_Science_and_Technology_logo.png",
+    }
+    # A la pàgina de QS aquests dos logos surten intercanviats
+    SWAPPED_SPANS = {399: 1, 400: -1}
+    LAST_INDEX = 1503
+
+    MANIFEST_NAME = 'manifest.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='https://www.topuniversities.com',
+                            help='Arrel del web de rànquings (per defecte QS)')
+        parser.add_argument('--pages', type=int, default=11, help='Pàgines del rànquing a recórrer')
+        parser.add_argument('--items-per-page', type=int, default=150, help='Universitats per pàgina')
+        parser.add_argument('--media-dir', default=os.path.join(settings.MEDIA_ROOT, 'erasmus_images'),
+                            help='Directori on es desen els logos')
+        parser.add_argument('--static-dir', default=os.path.join(logo_variants.STATIC_DIR, logo_variants.LOGO_DIR),
+                            help='Directori estàtic on es publiquen els logos (vegeu copy_to_static)')
+        parser.add_argument('--workers', type=int, default=8, help='Descàrregues en paral·lel')
+        parser.add_argument('--timeout', type=float, default=20, help='Temps màxim per petició, en segons')
+        parser.add_argument('--no-render', action='store_true',
+                            help='Llegeix l\'HTML tal com arriba, sense Chrome headless (només per a còpies estàtiques; '
+                                 'el llistat de QS es construeix amb JavaScript)')
+
     def handle(self, *args, **options):
+        media_dir = options['media_dir']
+        os.makedirs(media_dir, exist_ok=True)
+        session = self.make_session(options['workers'])
+
+        logo_urls = self.discover_logo_urls(session, options)
+        self.stdout.write(self.style.SUCCESS(f'Trobats {len(logo_urls)} logos'))
+
+        manifest_path = os.path.join(media_dir, self.MANIFEST_NAME)
+        manifest = self.load_manifest(manifest_path)
+        results = self.fetch_all(session, sorted(set(logo_urls.values())), manifest, media_dir, options)
+        self.save_manifest(manifest_path, manifest)
+
+        # Els programes només passen a un logo nou un cop és a static/: mai apunten a un fitxer que no se serveix
+        call_command('copy_to_static', media_dir=media_dir, static_dir=options['static_dir'], stdout=self.stdout)
+        published = set(os.listdir(options['static_dir']))
+
+        programs = ErasmusProgram.objects.filter(index__in=logo_urls).only('id', 'index', 'static_image')
+        changed = []
+        for program in programs:
+            file_name = results.get(logo_urls[program.index])
+            if file_name in published and program.static_image != file_name:
+                program.static_image = file_name
+                changed.append(program)
+        with transaction.atomic():
+            ErasmusProgram.objects.bulk_update(changed, ['static_image'], batch_size=500)
+        if changed:
+            bump_catalog_version()
 
-        media_dir = 'media/erasmus_images'
-        os.makedirs(media_dir, exist_ok=True)  # Asegurar que el directorio existe
-       
-        
-        # Cantidad de universidades por página
-        items_per_page = 150
-        
-        # Orden explícito por índice
-        university_list = ErasmusProgram.objects.all().order_by('index')
-        
-        for i in range(1, 12):
-            # Calcular el offset correcto basado en el número de página
-            offset = (i - 1) * items_per_page
-            
-            self.stdout.write(self.style.SUCCESS(f'Procesando página {i} (índices {offset+1}-{offset+items_per_page})'))
-            
-            url = f"https://www.topuniversities.com/world-university-rankings?page={i}&items_per_page={items_per_page}"
-            response = requests.get(url)
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            options = webdriver.ChromeOptions()
-            options.add_argument('--headless')
-            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-            driver.get(url)
-
-            # Wait for JavaScript to load content
-            time.sleep(5)
-
-            # Get the page source after JavaScript execution
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, "html.parser")
-            driver.quit()
-
-            spans = soup.find_all('span', class_='logo-wrapper new-rank')
-            self.stdout.write(self.style.SUCCESS(f'Encontrados {len(spans)} logos en la página'))
-            print(len(spans))
-            z=0
-            for j in range(150):
-            
-                # Calcular el índice correcto para cada universidad
-                university_index = offset + j + 1
-                
-                self.stdout.write(f'Procesando universidad #{university_index}')
-                
-                # Casos especiales
-                if university_index == 205:
-                    img_url = "https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcTeGJfbCGb8HvWcC5vQmuGNTF2AZb1q0NyzkQ&s"
-                elif university_index == 324:
-                    img_url = "https://logos-world.net/wp-content/uploads/2022/02/University-Of-Miami-Symbol.png"
-                elif university_index == 1288:
-                    img_url = "https://upload.wikimedia.org/wikipedia/en/thumb/d/d9/Shahjalal_University_of_Science_and_Technology_logo.png/250px-Shahjalal_University_of_Science_and_Technology_logo.png"                
+        fetched = sum(1 for status in self.statuses.values() if status == 'fetched')
+        unchanged = sum(1 for status in self.statuses.values() if status == 'unchanged')
+        failed = sum(1 for status in self.statuses.values() if status == 'error')
+        self.stdout.write(self.style.SUCCESS(
+            f"Logos: {fetched} descarregats, {unchanged} sense canvis, {failed} errors; "
+            f"{len(changed)} programes actualitzats"
+        ))
+
+    @staticmethod
+    def make_session(workers):
+        """Una sola Session per a tots els fils: connexions keep-alive reutilitzades i reintents amb espera."""
+        session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'UNICAT logo importer'
+        return session
+
+    def discover_logo_urls(self, session, options):
+        """{índex de la universitat: URL del logo} a partir de les pàgines del rànquing."""
+        per_page = options['items_per_page']
+        driver = None if options['no_render'] else self.make_driver()
+        logo_urls = {}
+        try:
+            for page in range(1, options['pages'] + 1):
+                offset = (page - 1) * per_page
+                url = (f"{options['base_url'].rstrip('/')}/world-university-rankings"
+                       f"?page={page}&items_per_page={per_page}")
+                self.stdout.write(f'Processant pàgina {page} (índexs {offset + 1}-{offset + per_page})')
+                if driver is not None:
+                    html = self.render_page(driver, url)
                 else:
-                    if university_index == 399:
-                        link_element = spans[z+1].find('a')
-                    elif university_index == 400:
-                        link_element = spans[z-1].find('a')
-                    elif university_index == 1504:
-                        break
-                    else:
-                        link_element = spans[z].find('a')
-                    # Get university link and name
-                    z+=1
-                    if link_element:
-                        img = link_element.find('img')
-                        if img and img.get('src'):
-                            img_url = img.get('src')
-                            print(img_url)
-
-                        else:
-                            self.stdout.write(self.style.WARNING(f"⚠️ No se encontró imagen para universidad #{university_index}"))
-                            continue
-                    else:
-                        self.stdout.write(self.style.WARNING(f"⚠️ No se encontró enlace para universidad #{university_index}"))
-                        continue
-                
-                try:
-                    # Obtener el programa correcto usando el índice calculado
-                    program = ErasmusProgram.objects.get(index=university_index)
-                    
-                    # Procesar la imagen
-                    parsed_url = urlparse(img_url)
-                    file_name = os.path.basename(unquote(parsed_url.path))
-                    
-                    # Si el nombre del archivo es vacío o demasiado corto, usar un nombre basado en la universidad
-                    if not file_name or len(file_name) < 5:
-                        file_name = f"uni_{university_index}.jpg"
-                        
-                    file_path = os.path.join(media_dir, file_name)
-                    
-                    try:
-                        response = requests.get(img_url, stream=True)
-                        response.raise_for_status()  # Verificar si hay errores HTTP
-                        
-                        if response.status_code == 200:
-                            with open(file_path, 'wb') as img_file:
-                                for chunk in response.iter_content(1024):
-                                    img_file.write(chunk)
-
-                            relative_path = os.path.join('erasmus_images', file_name)
-                            program.image = relative_path
-                            program.save()
-                            self.stdout.write(self.style.SUCCESS(f"✓ Guardat logo per a {program.university}"))
-                        else:
-                            self.stdout.write(self.style.WARNING(f"⚠️ Error {response.status_code} descarregant {img_url}"))
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"❌ Error descargando imagen: {str(e)}"))
-                        
-                except ErasmusProgram.DoesNotExist:
-                    self.stdout.write(self.style.WARNING(f"⚠️ No existe programa con índice {university_index}"))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"❌ Error procesando universidad #{university_index}: {str(e)}"))
-                
-                
\ No newline at end of file
+                    response = session.get(url, timeout=options['timeout'])
+                    response.raise_for_status()
+                    html = response.text
+                logo_urls.update(self.page_logo_urls(html, offset, per_page))
+        finally:
+            if driver is not None:
+                driver.quit()
+        return logo_urls
+
+    def page_logo_urls(self, html, offset, per_page):
+        spans = BeautifulSoup(html, 'html.parser').find_all('span', class_='logo-wrapper new-rank')
+        if not spans and offset < self.LAST_INDEX:
+            # Sense logos no hi ha res a actualitzar: millor aturar-se que no pas acabar "bé" sense fer res
+            raise CommandError(f"La pàgina dels índexs {offset + 1}-{offset + per_page} no té cap logo: "
+                               "el llistat no s'ha carregat (amb --no-render no s'executa el JavaScript)")
+        logo_urls = {}
+        z = 0
+        for j in range(per_page):
+            university_index = offset + j + 1
+            if university_index > self.LAST_INDEX:
+                break
+            if university_index in self.LOGO_OVERRIDES:
+                logo_urls[university_index] = self.LOGO_OVERRIDES[university_index]
+                continue
+            position = z + self.SWAPPED_SPANS.get(university_index, 0)
+            z += 1
+            if position >= len(spans):
+                break
+            link = spans[position].find('a')
+            img = link.find('img') if link else None
+            if img and img.get('src'):
+                logo_urls[university_index] = img['src']
+            else:
+                self.stdout.write(self.style.WARNING(f"No s'ha trobat el logo de la universitat #{university_index}"))
+        return logo_urls
+
+    @staticmethod
+    def make_driver():
+        # Selenium només cal si es renderitza
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless')
+        return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+    @staticmethod
+    def render_page(driver, url):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver.get(url)
+        WebDriverWait(driver, 15).until(
+            expected_conditions.presence_of_element_located((By.CSS_SELECTOR, 'span.logo-wrapper.new-rank'))
+        )
+        return driver.page_source
+
+    def fetch_all(self, session, urls, manifest, media_dir, options):
+        """Descarrega cada URL una sola vegada, en paral·lel. Retorna {url: nom del fitxer}."""
+        self.statuses = {}
+        lock = threading.Lock()
+
+        def fetch(url):
+            entry = manifest['urls'].get(url, {})
+            try:
+                file_name, entry, status = self.fetch_logo(session, url, entry, media_dir, options['timeout'])
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Error descarregant {url}: {str(e)}"))
+                file_name, status = entry.get('file'), 'error'
+            with lock:
+                if status != 'error':
+                    manifest['urls'][url] = entry
+                self.statuses[url] = status
+            return url, file_name
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            return {url: file_name for url, file_name in pool.map(fetch, urls) if file_name}
+
+    def fetch_logo(self, session, url, entry, media_dir, timeout):
+        """
+        GET condicional d'un logo. El fitxer es desa amb el hash del
+        contingut com a nom, de manera que logos idèntics comparteixen
+        fitxer. Retorna (nom del fitxer, entrada del manifest, estat).
+        """
+        headers = {}
+        have_file = entry.get('file') and os.path.exists(os.path.join(media_dir, entry['file']))
+        if have_file:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and have_file:
+            return entry['file'], entry, 'unchanged'
+        response.raise_for_status()
+
+        content = response.content
+        file_name = hashlib.sha256(content).hexdigest()[:32] + self.extension(url, response)
+        path = os.path.join(media_dir, file_name)
+        if not os.path.exists(path):
+            temporary = f'{path}.{threading.get_ident()}.tmp'
+            with open(temporary, 'wb') as img_file:
+                img_file.write(content)
+            os.replace(temporary, path)
+        entry = {
+            'file': file_name,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        return file_name, entry, 'fetched'
+
+    @staticmethod
+    def extension(url, response):
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+        extension = mimetypes.guess_extension(content_type) if content_type else None
+        if not extension:
+            extension = os.path.splitext(unquote(urlparse(url).path))[1].lower()
+        return {'.jpe': '.jpg', '.jpeg': '.jpg'}.get(extension, extension or '.img')
+
+    def load_manifest(self, path):
+        try:
+            with open(path, encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {'urls': {}}
+
+    def save_manifest(self, path, manifest):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(temporary, path)
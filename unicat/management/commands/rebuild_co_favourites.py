@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from unicat.models import CoFavourite
+
+
+class Command(BaseCommand):
+    help = 'Recalcula des de zero la matriu de programes desats junts (co-favorits)'
+
+    def handle(self, *args, **options):
+        pairs = CoFavourite.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Co-favorits recalculats: {pairs} parelles de programes"))
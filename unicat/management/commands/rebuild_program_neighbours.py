@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from unicat.neighbours import NEIGHBOURS_PER_PROGRAM, rebuild_program_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la taula d\'universitats similars (k veïns més propers per perfil QS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=NEIGHBOURS_PER_PROGRAM,
+            help='Nombre de veïns per programa'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_program_neighbours(options['k'])
+        self.stdout.write(self.style.SUCCESS(f"Veïns recalculats per a {total} programes"))
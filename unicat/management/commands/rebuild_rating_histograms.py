@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from unicat.models import ErasmusProgram
+
+
+class Command(BaseCommand):
+    help = 'Reconstrueix l\'histograma de valoracions i les mitjanes de tots els programes Erasmus'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = ErasmusProgram.rebuild_review_aggregates()
+        self.stdout.write(self.style.SUCCESS(f"Histogrames reconstruïts per a {updated} programes"))
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:09
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    ErasmusProgram = apps.get_model('unicat', 'ErasmusProgram')
+    ErasmusReview = apps.get_model('unicat', 'ErasmusReview')
+    totals = ErasmusReview.objects.values('program_id').annotate(count=Count('id'), total=Sum('rating'))
+    programs = []
+    for row in totals:
+        programs.append(ErasmusProgram(
+            id=row['program_id'],
+            review_count=row['count'],
+            review_rating_sum=row['total'],
+            cached_average_rating=row['total'] / row['count'],
+        ))
+    ErasmusProgram.objects.exclude(id__in=[p.id for p in programs]).update(cached_average_rating=0)
+    ErasmusProgram.objects.bulk_update(
+        programs, ['review_count', 'review_rating_sum', 'cached_average_rating'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0041_profile_linkedin_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='review_rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
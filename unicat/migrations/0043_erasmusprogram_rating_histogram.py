@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:09
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_histogram(apps, schema_editor):
+    ErasmusProgram = apps.get_model('unicat', 'ErasmusProgram')
+    ErasmusReview = apps.get_model('unicat', 'ErasmusReview')
+    programs = {}
+    for row in ErasmusReview.objects.values('program_id', 'rating').annotate(n=Count('id')):
+        if row['rating'] not in (1, 2, 3, 4, 5):
+            continue
+        program = programs.setdefault(row['program_id'], ErasmusProgram(id=row['program_id']))
+        setattr(program, f"rating_{row['rating']}_count", row['n'])
+    ErasmusProgram.objects.bulk_update(
+        programs.values(),
+        ['rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0042_erasmusprogram_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:10
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+SUB_RATINGS = ('academic', 'housing', 'social', 'city')
+
+
+def backfill_sub_rating_aggregates(apps, schema_editor):
+    ErasmusProgram = apps.get_model('unicat', 'ErasmusProgram')
+    ErasmusReview = apps.get_model('unicat', 'ErasmusReview')
+    aggregates = {}
+    for name in SUB_RATINGS:
+        rated = Q(**{f'{name}_rating__gt': 0})
+        aggregates[f'{name}_rating_sum'] = Sum(f'{name}_rating', filter=rated)
+        aggregates[f'{name}_rating_count'] = Count(f'{name}_rating', filter=rated)
+    programs = []
+    for row in ErasmusReview.objects.values('program_id').annotate(**aggregates):
+        program = ErasmusProgram(id=row['program_id'])
+        for field in aggregates:
+            setattr(program, field, row[field] or 0)
+        programs.append(program)
+    ErasmusProgram.objects.bulk_update(programs, list(aggregates), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0043_erasmusprogram_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='academic_rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='academic_rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='city_rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='city_rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='housing_rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='housing_rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='social_rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='social_rating_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_sub_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0044_erasmusprogram_sub_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableGeneration',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0045_tablegeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('distance', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='unicat.erasmusprogram')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='unicat.erasmusprogram')),
+            ],
+            options={
+                'ordering': ['program', 'rank'],
+                'unique_together': {('program', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0046_programneighbour'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoFavourite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='unicat.erasmusprogram')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_favourites', to='unicat.erasmusprogram')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['program', '-count'], name='unicat_cofa_program_109cf7_idx')],
+                'unique_together': {('program', 'other')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_participants_count(apps, schema_editor):
+    ErasmusProgram = apps.get_model('unicat', 'ErasmusProgram')
+    ErasmusParticipant = apps.get_model('unicat', 'ErasmusParticipant')
+    programs = [
+        ErasmusProgram(id=row['program_id'], participants_count=row['total'])
+        for row in ErasmusParticipant.objects.values('program_id').annotate(total=Count('id'))
+    ]
+    ErasmusProgram.objects.bulk_update(programs, ['participants_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0047_cofavourite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='participants_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_participants_count, migrations.RunPython.noop),
+    ]
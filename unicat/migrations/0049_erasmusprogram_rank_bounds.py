@@ -0,0 +1,186 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:28
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copies of unicat.models.RANK_FIELDS and parse_rank as of this
+# migration, so later changes to the model module can't alter the backfill
+RANK_FIELDS = ('rank', 'ar_rank', 'er_rank', 'fsr_rank', 'cpf_rank',
+               'ifr_rank', 'isr_rank', 'irn_rank', 'ger_rank', 'sus_rank')
+
+RANK_RE = re.compile(r'^=?(\d+)(?:\s*[-\u2013]\s*(\d+)|(\+)|=)?$')
+
+
+def parse_rank(value):
+    match = RANK_RE.match((value or '').strip())
+    if not match:
+        return None, None
+    low = int(match.group(1))
+    if match.group(3):
+        return low, None
+    high = int(match.group(2)) if match.group(2) else low
+    return min(low, high), max(low, high)
+
+
+def backfill_rank_bounds(apps, schema_editor):
+    ErasmusProgram = apps.get_model('unicat', 'ErasmusProgram')
+    bound_fields = [f'{field}_{bound}' for field in RANK_FIELDS for bound in ('low', 'high')]
+    programs = list(ErasmusProgram.objects.only('id', *RANK_FIELDS))
+    for program in programs:
+        for field in RANK_FIELDS:
+            low, high = parse_rank(getattr(program, field))
+            setattr(program, f'{field}_low', low)
+            setattr(program, f'{field}_high', high)
+    ErasmusProgram.objects.bulk_update(programs, bound_fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0048_erasmusprogram_participants_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='ar_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='ar_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='cpf_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='cpf_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='er_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='er_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='fsr_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='fsr_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='ger_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='ger_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='ifr_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='ifr_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='irn_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='irn_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='isr_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='isr_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='sus_rank_high',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='erasmusprogram',
+            name='sus_rank_low',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_rank_bounds, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['rank_low', 'rank_high'], name='unicat_eras_rank_lo_2d8479_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['ar_rank_low', 'ar_rank_high'], name='unicat_eras_ar_rank_7a5a2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['er_rank_low', 'er_rank_high'], name='unicat_eras_er_rank_115b7a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['fsr_rank_low', 'fsr_rank_high'], name='unicat_eras_fsr_ran_1f1153_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['cpf_rank_low', 'cpf_rank_high'], name='unicat_eras_cpf_ran_9a1567_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['ifr_rank_low', 'ifr_rank_high'], name='unicat_eras_ifr_ran_e4d1cd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['isr_rank_low', 'isr_rank_high'], name='unicat_eras_isr_ran_469842_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['irn_rank_low', 'irn_rank_high'], name='unicat_eras_irn_ran_0af701_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['ger_rank_low', 'ger_rank_high'], name='unicat_eras_ger_ran_209954_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='erasmusprogram',
+            index=models.Index(fields=['sus_rank_low', 'sus_rank_high'], name='unicat_eras_sus_ran_6e87fe_idx'),
+        ),
+    ]
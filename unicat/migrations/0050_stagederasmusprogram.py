@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0049_erasmusprogram_rank_bounds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedErasmusProgram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.PositiveIntegerField()),
+                ('index', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('university', models.CharField(max_length=200)),
+                ('normalized_name', models.CharField(db_index=True, max_length=200)),
+                ('country_code', models.CharField(blank=True, max_length=3, null=True)),
+                ('data', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['row_number'],
+            },
+        ),
+    ]
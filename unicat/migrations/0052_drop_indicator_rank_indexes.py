@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicat', '0051_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_ar_rank_7a5a2f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_er_rank_115b7a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_fsr_ran_1f1153_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_cpf_ran_9a1567_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_ifr_ran_e4d1cd_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_isr_ran_469842_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_irn_ran_0af701_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_ger_ran_209954_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='erasmusprogram',
+            name='unicat_eras_sus_ran_6e87fe_idx',
+        ),
+    ]
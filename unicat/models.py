@@ -1,10 +1,13 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Cast
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+import re
 import uuid
 from datetime import timedelta
 
@@ -165,11 +168,13 @@ class Field_Study(models.Model):
     def __str__(self):
         return self.name
     
+    @staticmethod
+    def order_for(name):
+        """'Other' sorts after every real field of study."""
+        return 1 if name == 'Other' else 0
+
     def save(self, *args, **kwargs):
-        if self.name == 'Other':
-            self.order = 1
-        else:
-            self.order = 0
+        self.order = self.order_for(self.name)
         super().save(*args, **kwargs)
 
 class Resource(models.Model):
@@ -207,11 +212,47 @@ class Resource(models.Model):
    
 
 
+class ErasmusProgramQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Everything the program cards need in one query: the country is joined
+        and the counts are denormalized columns, so serializing a page of
+        programs does not hit the database once per row.
+        """
+        return self.select_related('country_code')
+
+
+# QS rank columns on ErasmusProgram, each with integer _low/_high bounds
+RANK_FIELDS = ('rank', 'ar_rank', 'er_rank', 'fsr_rank', 'cpf_rank',
+               'ifr_rank', 'isr_rank', 'irn_rank', 'ger_rank', 'sus_rank')
+
+RANK_RE = re.compile(r'^=?(\d+)(?:\s*[-\u2013]\s*(\d+)|(\+)|=)?$')
+
+
+def parse_rank(value):
+    """
+    Integer (low, high) bounds of a QS rank string: "12" and "=12" -> (12, 12),
+    "601-650" -> (601, 650), "1401+" -> (1401, None). Empty or unparseable
+    values give (None, None).
+    """
+    match = RANK_RE.match((value or '').strip())
+    if not match:
+        return None, None
+    low = int(match.group(1))
+    if match.group(3):
+        return low, None
+    high = int(match.group(2)) if match.group(2) else low
+    return min(low, high), max(low, high)
+
+
 class ErasmusProgram(models.Model):
     index= models.IntegerField(blank=True, null=True)
     university = models.CharField(max_length=200, default='', blank=False)                                 
     city = models.CharField(max_length=255, blank=True, null=True)
     rank = models.CharField(max_length=20, blank=True, null=True)
+    # Integer bounds parsed from each *_rank string ("601-650" -> 601, 650), kept in sync on save
+    rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     country_code = models.ForeignKey(Country, blank=True, null=True,default="", on_delete=models.SET_NULL)
     size = models.CharField(max_length=50, blank=True, null=True)
     focus = models.CharField(max_length=100, blank=True, null=True)
@@ -224,55 +265,238 @@ class ErasmusProgram(models.Model):
         help_text="Nom del fitxer d'imatge a static/unicat/images/erasmus/"
     )
     cached_average_rating = models.FloatField(default=0)
+    # Number of ErasmusParticipant rows, kept in sync by signals
+    participants_count = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    review_rating_sum = models.PositiveIntegerField(default=0)
+    # Per-star histogram of ErasmusReview.rating, kept in sync on review writes
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    # Running sums/counts of the optional ErasmusReview sub-ratings (0 means "not rated")
+    academic_rating_sum = models.FloatField(default=0)
+    academic_rating_count = models.PositiveIntegerField(default=0)
+    housing_rating_sum = models.FloatField(default=0)
+    housing_rating_count = models.PositiveIntegerField(default=0)
+    social_rating_sum = models.FloatField(default=0)
+    social_rating_count = models.PositiveIntegerField(default=0)
+    city_rating_sum = models.FloatField(default=0)
+    city_rating_count = models.PositiveIntegerField(default=0)
+
+    RATING_STARS = (1, 2, 3, 4, 5)
+    RANK_FIELDS = RANK_FIELDS
+    SUB_RATINGS = ('academic', 'housing', 'social', 'city')
+    REVIEW_AGGREGATE_FIELDS = [
+        'review_count', 'review_rating_sum', 'cached_average_rating',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+        'academic_rating_sum', 'academic_rating_count', 'housing_rating_sum', 'housing_rating_count',
+        'social_rating_sum', 'social_rating_count', 'city_rating_sum', 'city_rating_count',
+    ]
 
     ar_score = models.FloatField(blank=True, null=True)
     ar_rank = models.CharField(max_length=20, blank=True, null=True)
+    ar_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    ar_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     er_score = models.FloatField(blank=True, null=True)
     er_rank = models.CharField(max_length=20, blank=True, null=True)
+    er_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    er_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     fsr_score = models.FloatField(blank=True, null=True)
     fsr_rank = models.CharField(max_length=20, blank=True, null=True)
+    fsr_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    fsr_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     cpf_score = models.FloatField(blank=True, null=True)
     cpf_rank = models.CharField(max_length=20, blank=True, null=True)
+    cpf_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    cpf_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     ifr_score = models.FloatField(blank=True, null=True)
     ifr_rank = models.CharField(max_length=20, blank=True, null=True)
+    ifr_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    ifr_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     isr_score = models.FloatField(blank=True, null=True)
     isr_rank = models.CharField(max_length=20, blank=True, null=True)
+    isr_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    isr_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     irn_score = models.FloatField(blank=True, null=True)
     irn_rank = models.CharField(max_length=20, blank=True, null=True)
+    irn_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    irn_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     ger_score = models.FloatField(blank=True, null=True)
     ger_rank = models.CharField(max_length=20, blank=True, null=True)
+    ger_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    ger_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     sus_score = models.FloatField(blank=True, null=True)
     sus_rank = models.CharField(max_length=20, blank=True, null=True)
+    sus_rank_low = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    sus_rank_high = models.PositiveIntegerField(blank=True, null=True, editable=False)
     overall_score = models.FloatField(blank=True, null=True)
 
-    def update_average_rating(self, new_rating=None):
-        # When saving overall rating, ensure it's an integer
-        if new_rating is not None:
-            new_rating = int(new_rating)
-        
-        if new_rating is None:
-            # Recalcular desde todas las reviews
-            ratings = self.reviews.all()
-            if ratings.count() > 0:
-                # Convert all ratings to integers before averaging
-                self.cached_average_rating = sum(int(r.rating) for r in ratings) / ratings.count()
-            else:
-                self.cached_average_rating = 0
-        else:
-            # Actualizar con la nueva review
-            current_count = self.reviews.count() - 1  # Restamos 1 porque la nueva review ya está en la BD
-            if current_count > 0:
-                current_sum = self.cached_average_rating * current_count
-                self.cached_average_rating = (current_sum + new_rating) / (current_count + 1)
-            else:
-                self.cached_average_rating = new_rating
-        
-        self.save(update_fields=['cached_average_rating'])
+    objects = ErasmusProgramQuerySet.as_manager()
+
+    @classmethod
+    def rank_bound_fields(cls):
+        return [f'{field}_{bound}' for field in cls.RANK_FIELDS for bound in ('low', 'high')]
+
+    def set_rank_bounds(self):
+        """Fill every *_rank_low / *_rank_high from its rank string (no save)."""
+        for field in self.RANK_FIELDS:
+            low, high = parse_rank(getattr(self, field))
+            setattr(self, f'{field}_low', low)
+            setattr(self, f'{field}_high', high)
+
+    def save(self, *args, **kwargs):
+        self.set_rank_bounds()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(self.RANK_FIELDS):
+            kwargs['update_fields'] = {*update_fields, *self.rank_bound_fields()}
+        super().save(*args, **kwargs)
+
+    def update_average_rating(self):
+        """
+        Recompute the review aggregates from scratch. Only needed to repair
+        drift; normal review writes keep them up to date incrementally.
+        """
+        counts = self.reviews.values('rating').annotate(n=Count('id'))
+        self.set_rating_histogram({row['rating']: row['n'] for row in counts})
+        self.set_sub_rating_totals(self.reviews.aggregate(**self.sub_rating_aggregates()))
+        self.save(update_fields=self.REVIEW_AGGREGATE_FIELDS)
+        self.reviews_changed()
         return self.cached_average_rating
-    
+
+    def rating_histogram(self):
+        """Return {star: number of reviews} for stars 1..5."""
+        return {star: getattr(self, f'rating_{star}_count') for star in self.RATING_STARS}
+
+    def set_rating_histogram(self, histogram):
+        """
+        Overwrite the buckets and the totals (no save). Like
+        apply_review_change, the totals count every review, even a rating
+        outside 1..5 that has no bucket.
+        """
+        for star in self.RATING_STARS:
+            setattr(self, f'rating_{star}_count', histogram.get(star, 0))
+        self.review_count = sum(histogram.values())
+        self.review_rating_sum = sum(star * count for star, count in histogram.items())
+        if self.review_count > 0:
+            self.cached_average_rating = self.review_rating_sum / self.review_count
+        else:
+            self.cached_average_rating = 0
+
+    @classmethod
+    def sub_rating_aggregates(cls):
+        """Sum/Count expressions over ErasmusReview for every sub-rating, ignoring unrated (0/NULL) values."""
+        aggregates = {}
+        for name in cls.SUB_RATINGS:
+            field = f'{name}_rating'
+            rated = Q(**{f'{field}__gt': 0})
+            aggregates[f'{name}_rating_sum'] = Sum(field, filter=rated)
+            aggregates[f'{name}_rating_count'] = Count(field, filter=rated)
+        return aggregates
+
+    def set_sub_rating_totals(self, totals):
+        """Overwrite the sub-rating sums/counts from an aggregate() result (no save)."""
+        for name in self.SUB_RATINGS:
+            setattr(self, f'{name}_rating_sum', totals.get(f'{name}_rating_sum') or 0)
+            setattr(self, f'{name}_rating_count', totals.get(f'{name}_rating_count') or 0)
+
+    def sub_rating_averages(self):
+        """Return {name: {'average': float or None, 'count': int}} for every sub-rating."""
+        return {name: self._sub_rating_entry(getattr(self, f'{name}_rating_sum'),
+                                             getattr(self, f'{name}_rating_count'))
+                for name in self.SUB_RATINGS}
+
+    @staticmethod
+    def _sub_rating_entry(total, count):
+        return {'average': round(total / count, 2) if count else None, 'count': count}
+
+    @classmethod
+    def sub_rating_summary(cls, program_ids):
+        """
+        Sub-rating averages and counts for a whole page of programs in one
+        query: {program_id: {'academic': {'average': .., 'count': ..}, ...}}.
+        """
+        fields = ['id']
+        for name in cls.SUB_RATINGS:
+            fields += [f'{name}_rating_sum', f'{name}_rating_count']
+        summary = {}
+        for row in cls.objects.filter(id__in=program_ids).values(*fields):
+            summary[row['id']] = {name: cls._sub_rating_entry(row[f'{name}_rating_sum'],
+                                                              row[f'{name}_rating_count'])
+                                  for name in cls.SUB_RATINGS}
+        return summary
+
+    @classmethod
+    def sub_rating_average_expression(cls, name):
+        """SQL expression for one sub-rating mean (NULL when nobody rated it), usable in order_by()."""
+        return Case(
+            When(**{f'{name}_rating_count__gt': 0},
+                 then=F(f'{name}_rating_sum') / Cast(F(f'{name}_rating_count'), models.FloatField())),
+            default=None,
+            output_field=models.FloatField(),
+        )
+
+    @classmethod
+    def rebuild_review_aggregates(cls):
+        """
+        Rebuild every program's histogram and totals from a single grouped
+        aggregate over the reviews. Returns the number of programs written.
+        """
+        histograms = {}
+        counts = ErasmusReview.objects.values('program_id', 'rating').annotate(n=Count('id'))
+        for row in counts:
+            histograms.setdefault(row['program_id'], {})[row['rating']] = row['n']
+
+        sub_totals = {row['program_id']: row for row in ErasmusReview.objects.values('program_id').annotate(
+            **cls.sub_rating_aggregates())}
+
+        programs = list(cls.objects.only('id'))
+        for program in programs:
+            program.set_rating_histogram(histograms.get(program.id, {}))
+            program.set_sub_rating_totals(sub_totals.get(program.id, {}))
+        cls.objects.bulk_update(programs, cls.REVIEW_AGGREGATE_FIELDS, batch_size=500)
+        cls.reviews_changed()
+        return len(programs)
+
+    @classmethod
+    def apply_review_change(cls, program_id, rating, delta, sub_ratings=None):
+        """
+        Add (delta=1) or remove (delta=-1) one review with the given star
+        rating and optional {name: value} sub-ratings. Buckets, totals and
+        the average move together in a single UPDATE, so concurrent reviews
+        never lose each other's changes.
+        """
+        rating = int(rating)
+        new_count = F('review_count') + delta
+        new_sum = F('review_rating_sum') + delta * rating
+        changes = {
+            'review_count': new_count,
+            'review_rating_sum': new_sum,
+            'cached_average_rating': Case(
+                When(review_count__gt=-delta,
+                     then=Cast(new_sum, models.FloatField()) / Cast(new_count, models.FloatField())),
+                default=Value(0.0),
+                output_field=models.FloatField(),
+            ),
+        }
+        if rating in cls.RATING_STARS:
+            bucket = f'rating_{rating}_count'
+            changes[bucket] = F(bucket) + delta
+        for name, value in (sub_ratings or {}).items():
+            if value:
+                changes[f'{name}_rating_sum'] = F(f'{name}_rating_sum') + delta * value
+                changes[f'{name}_rating_count'] = F(f'{name}_rating_count') + delta
+        cls.objects.filter(pk=program_id).update(**changes)
+        cls.reviews_changed()
+
+    @staticmethod
+    def reviews_changed():
+        """Ratings moved: bump the reviews generation once the write commits."""
+        transaction.on_commit(lambda: TableGeneration.bump(TableGeneration.REVIEWS))
+
     def average_rating(self):
-      
-        self.update_average_rating()
         return self.cached_average_rating
  
     
@@ -280,7 +504,7 @@ class ErasmusProgram(models.Model):
         """
         Return the number of full stars for the rating.
         """
-        avg = self.average_rating() or 0  # Call the method to get the value
+        avg = self.average_rating() or 0
         return int(avg)  # Return just the integer part
     
     
@@ -292,15 +516,12 @@ class ErasmusProgram(models.Model):
         return (avg - int(avg)) >= 0.5
         
     def total_ratings(self):
-        return self.reviews.count()
+        return self.review_count
     
     def get_pct_rating(self, num_star):
-        # Filter by exact integer rating value
-        matching_reviews = self.reviews.filter(rating=num_star).count()
-        
         total_reviews = self.total_ratings()
         if total_reviews > 0:
-            return (matching_reviews / total_reviews) * 100
+            return (getattr(self, f'rating_{num_star}_count') / total_reviews) * 100
         return 0
         
     def reviews_breakdown(self):
@@ -320,6 +541,9 @@ class ErasmusProgram(models.Model):
     class Meta:
         verbose_name_plural = "Erasmus Programs"
         #unique_together = ('university', 'country_code')
+        # Rank-band filters (cursor pages, facets) seek on the overall lower bound;
+        # the indicator-rank sorts run in memory on the catalog snapshot
+        indexes = [models.Index(fields=['rank_low', 'rank_high'])]
 
 
 class ErasmusParticipant(models.Model):
@@ -348,6 +572,150 @@ class FavouriteErasmusProgram(models.Model):
     class Meta:
         unique_together = ('user', 'program')
 
+class CoFavourite(models.Model):
+    """
+    Item-to-item co-occurrence of favourites: how many students saved both
+    `program` and `other`. Stored in both directions so "also saved" is a
+    single indexed lookup; kept up to date incrementally by record_change(),
+    from the favourite views and from the delete signals for everything else.
+    """
+    program = models.ForeignKey(ErasmusProgram, on_delete=models.CASCADE, related_name='co_favourites')
+    other = models.ForeignKey(ErasmusProgram, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    # Ids per IN (...) list: two lists per statement stay under SQLite's 999 bound parameters
+    ID_CHUNK = 400
+
+    @classmethod
+    def record_change(cls, changed_ids, favourite_ids, delta):
+        """
+        One student added (delta=1) or removed (delta=-1) `changed_ids`.
+        `favourite_ids` is their favourite set including the changed programs
+        (after adding / before removing). Every pair touched moves by delta.
+        """
+        changed_ids = list(dict.fromkeys(changed_ids))
+        others = sorted(set(favourite_ids) - set(changed_ids))
+        if len(changed_ids) + len(others) < 2:
+            return
+        with transaction.atomic():
+            if delta > 0:
+                cls.objects.bulk_create([
+                    row
+                    for i, program_id in enumerate(changed_ids)
+                    for partner in others + changed_ids[i + 1:]
+                    for row in (cls(program_id=program_id, other_id=partner),
+                                cls(program_id=partner, other_id=program_id))
+                ], batch_size=1000, ignore_conflicts=True)
+            for touched in cls.touched_pairs(changed_ids, others):
+                touched.update(count=F('count') + delta)
+                if delta < 0:
+                    touched.filter(count=0).delete()
+
+    @classmethod
+    def touched_pairs(cls, changed_ids, others):
+        """
+        Querysets that together cover both directions of every pair between a
+        changed program and the rest of the favourite set, each with at most
+        2 * ID_CHUNK ids. Pairs of a program with itself are never stored.
+        """
+        def chunks(ids):
+            return [ids[start:start + cls.ID_CHUNK] for start in range(0, len(ids), cls.ID_CHUNK)]
+
+        for changed_chunk in chunks(changed_ids):
+            # changed -> changed or other
+            for partner_chunk in chunks(changed_ids + others):
+                yield cls.objects.filter(program_id__in=changed_chunk, other_id__in=partner_chunk)
+            # other -> changed
+            for other_chunk in chunks(others):
+                yield cls.objects.filter(program_id__in=other_chunk, other_id__in=changed_chunk)
+
+    @classmethod
+    def rebuild(cls):
+        """Recount every pair from FavouriteErasmusProgram (repairs drift, e.g. after raw SQL deletes)."""
+        counts = {}
+        favourites = FavouriteErasmusProgram.objects.order_by('user_id').values_list('user_id', 'program_id')
+        current_user, saved = None, []
+        for user_id, program_id in list(favourites) + [(None, None)]:
+            if user_id != current_user:
+                for i, first in enumerate(saved):
+                    for second in saved[i + 1:]:
+                        counts[first, second] = counts.get((first, second), 0) + 1
+                current_user, saved = user_id, []
+            saved.append(program_id)
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([
+                row
+                for (first, second), count in counts.items()
+                for row in (cls(program_id=first, other_id=second, count=count),
+                            cls(program_id=second, other_id=first, count=count))
+            ], batch_size=1000)
+        return len(counts)
+
+    def __str__(self):
+        return f"{self.program.university} + {self.other.university}: {self.count}"
+
+    class Meta:
+        unique_together = ('program', 'other')
+        indexes = [models.Index(fields=['program', '-count'])]
+
+class ProgramNeighbour(models.Model):
+    """
+    Precomputed "similar universities": each program's k nearest programs by
+    QS indicator profile, size/focus/research/status and country. Rebuilt by
+    the rebuild_program_neighbours command (rank 1 is the closest).
+    """
+    program = models.ForeignKey(ErasmusProgram, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(ErasmusProgram, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    distance = models.FloatField()
+
+    def __str__(self):
+        return f"{self.program.university} ~ {self.neighbour.university} (#{self.rank})"
+
+    class Meta:
+        unique_together = ('program', 'rank')
+        ordering = ['program', 'rank']
+
+class StagedErasmusProgram(models.Model):
+    """
+    One row of a ranking file being reloaded (import_erasmus --reload). The
+    file is loaded and validated here first; live ErasmusProgram rows are
+    only reconciled against it once the whole file is known to be good.
+    """
+    row_number = models.PositiveIntegerField()
+    index = models.IntegerField(blank=True, null=True, db_index=True)
+    university = models.CharField(max_length=200)
+    # Accent- and case-insensitive name, the matching key for live programs
+    normalized_name = models.CharField(max_length=200, db_index=True)
+    country_code = models.CharField(max_length=3, blank=True, null=True)
+    # Every other ErasmusProgram field from the file, already converted to its type
+    data = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.row_number}: {self.university}"
+
+    class Meta:
+        ordering = ['row_number']
+
+class ImportCheckpoint(models.Model):
+    """
+    How far a streaming import (import_erasmus --stream) has committed into
+    a file: the byte offset just after the last committed row. Written in
+    the same transaction as each batch, so --resume never repeats or skips
+    a row. Removed once the file has been fully imported.
+    """
+    source = models.CharField(max_length=500, unique=True)
+    byte_offset = models.BigIntegerField(default=0)
+    row_number = models.PositiveIntegerField(default=0)
+    # Size and mtime of the file when the import started; a changed file can't be resumed
+    file_size = models.BigIntegerField()
+    file_mtime = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ {self.row_number}"
+
 class ErasmusReview(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     program = models.ForeignKey(ErasmusProgram, on_delete=models.CASCADE, related_name='reviews')
@@ -360,6 +728,8 @@ class ErasmusReview(models.Model):
     tips = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    SUB_RATING_FIELDS = ('academic_rating', 'housing_rating', 'social_rating', 'city_rating')
+
     def has_half_star(self, field_name="rating"):
         """
         Check if the rating has a half-star increment.
@@ -376,6 +746,29 @@ class ErasmusReview(models.Model):
 
 
 
+    def save(self, *args, **kwargs):
+        """
+        Save the review and update the program aggregates in the same
+        transaction. Deletions are handled by the post_delete signal.
+        """
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = ErasmusReview.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values('program_id', 'rating', *self.SUB_RATING_FIELDS).first()
+            super().save(*args, **kwargs)
+            if previous:
+                ErasmusProgram.apply_review_change(previous['program_id'], previous['rating'], -1,
+                                                   self.sub_ratings(previous))
+            ErasmusProgram.apply_review_change(self.program_id, self.rating, 1, self.sub_ratings())
+
+    def sub_ratings(self, values=None):
+        """Return {name: value} for the sub-ratings of this review (or of a values() row)."""
+        if values is None:
+            return {name: getattr(self, f'{name}_rating') for name in ErasmusProgram.SUB_RATINGS}
+        return {name: values[f'{name}_rating'] for name in ErasmusProgram.SUB_RATINGS}
+
     def __str__(self):
         return f"{self.user.username} - {self.program.university} ({self.rating} stars)"
     
@@ -453,3 +846,40 @@ class BugReport(models.Model):
     def __str__(self):
         return f"{self.title} - {self.get_severity_display()}"
 
+
+class TableGeneration(models.Model):
+    """
+    Monotonic change counters ("the catalog changed") used to version
+    caches. Reading one is a primary-key lookup; writers bump it.
+    """
+    CATALOG = 'catalog'
+    REVIEWS = 'reviews'
+    EVENTS = 'events'
+    EVENT_PARTICIPANTS = 'event_participants'
+    RESOURCES = 'resources'
+    COMMENTS = 'comments'
+    ERASMUS_PARTICIPANTS = 'erasmus_participants'
+    FAVOURITES = 'favourites'
+
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+    @classmethod
+    def stamp(cls, *names):
+        """Current values of several generations, read in one query."""
+        values = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return tuple(values.get(name, 0) for name in names)
+
+    @classmethod
+    def bump(cls, name):
+        if not cls.objects.filter(name=name).update(value=F('value') + 1):
+            generation, created = cls.objects.get_or_create(name=name, defaults={'value': 1})
+            if not created:
+                cls.objects.filter(name=name).update(value=F('value') + 1)
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
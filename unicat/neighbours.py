@@ -0,0 +1,97 @@
+import warnings
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from .catalog import catalog_programs
+from .models import ProgramNeighbour
+from .snapshot import SCORE_FIELDS
+
+# Profile attributes compared as equal / different
+CATEGORICAL_FIELDS = ('size', 'focus', 'research', 'status', 'country_code_id')
+
+# A mismatch on one attribute costs as much as being this many standard
+# deviations apart on one QS indicator
+CATEGORICAL_WEIGHT = 0.75
+
+NEIGHBOURS_PER_PROGRAM = 8
+
+
+def feature_matrix(rows):
+    """
+    One row per program: z-scored QS indicators (a missing score counts as
+    the catalog mean) followed by scaled one-hot columns for each
+    categorical attribute, so plain euclidean distance compares profiles.
+    """
+    scores = np.array([[np.nan if row[field] is None else row[field] for field in SCORE_FIELDS] for row in rows],
+                      dtype=np.float64).reshape(len(rows), len(SCORE_FIELDS))
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        # Indicators nobody has (all NaN) just stay NaN here and become 0 below
+        warnings.simplefilter('ignore', RuntimeWarning)
+        means = np.nanmean(scores, axis=0)
+        stds = np.nanstd(scores, axis=0)
+        scores = (scores - means) / np.where(stds > 0, stds, 1.0)
+    columns = [np.nan_to_num(scores, nan=0.0)]
+
+    # sqrt(1/2): two differing one-hot columns add CATEGORICAL_WEIGHT**2 to the squared distance
+    scale = CATEGORICAL_WEIGHT * np.sqrt(0.5)
+    for field in CATEGORICAL_FIELDS:
+        values = sorted({row[field] for row in rows if row[field]})
+        positions = {value: i for i, value in enumerate(values)}
+        one_hot = np.zeros((len(rows), len(values)))
+        for i, row in enumerate(rows):
+            if row[field] in positions:
+                one_hot[i, positions[row[field]]] = scale
+        columns.append(one_hot)
+    return np.hstack(columns)
+
+
+def nearest_neighbours(features, k, chunk_size=256):
+    """Yield (row, [(neighbour row, distance), ...]) for every row, closest first."""
+    count = len(features)
+    k = min(k, count - 1)
+    if k <= 0:
+        return
+    squared_norms = (features ** 2).sum(axis=1)
+    for start in range(0, count, chunk_size):
+        chunk = features[start:start + chunk_size]
+        distances = squared_norms[start:start + chunk_size, None] + squared_norms[None, :] - 2 * chunk @ features.T
+        distances[np.arange(len(chunk)), np.arange(start, start + len(chunk))] = np.inf
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        for offset, candidates in enumerate(nearest):
+            row_distances = distances[offset, candidates]
+            order = np.lexsort((candidates, row_distances))
+            yield start + offset, [
+                (int(candidates[j]), float(np.sqrt(max(row_distances[j], 0.0)))) for j in order
+            ]
+
+
+def rebuild_program_neighbours(k=NEIGHBOURS_PER_PROGRAM):
+    """Recompute the whole ProgramNeighbour table in one transaction. Returns the number of programs."""
+    rows = list(catalog_programs().order_by('id').values('id', *SCORE_FIELDS, *CATEGORICAL_FIELDS))
+    links = []
+    if rows:
+        for row, neighbours in nearest_neighbours(feature_matrix(rows), k):
+            links.extend(
+                ProgramNeighbour(program_id=rows[row]['id'], neighbour_id=rows[other]['id'],
+                                 rank=rank, distance=distance)
+                for rank, (other, distance) in enumerate(neighbours, start=1)
+            )
+    with transaction.atomic():
+        ProgramNeighbour.objects.all().delete()
+        ProgramNeighbour.objects.bulk_create(links, batch_size=1000)
+    return len(rows)
+
+
+def similar_programs(program_ids, limit=NEIGHBOURS_PER_PROGRAM):
+    """{program id: [neighbouring ErasmusProgram, ...]} for many programs in one query."""
+    result = defaultdict(list)
+    links = (ProgramNeighbour.objects
+             .filter(program_id__in=program_ids, rank__lte=limit)
+             .select_related('neighbour__country_code')
+             .order_by('program_id', 'rank'))
+    for link in links:
+        link.neighbour.similarity_distance = link.distance
+        result[link.program_id].append(link.neighbour)
+    return result
@@ -0,0 +1,149 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CountedPaginator(Paginator):
+    """Django Paginator that trusts a count computed (and cached) elsewhere."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            # Paginator.count is a cached_property: seed it so no COUNT runs
+            self.__dict__['count'] = count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the list's sort keys instead of using
+    OFFSET, and never runs a COUNT. The cursor token is opaque to clients:
+    they just follow the cursor from the `next`/`previous` links.
+
+    Unlike DRF's CursorPagination, which seeks on the first key only and
+    falls back to offsets within ties, the cursor holds every key of the
+    boundary row, so `ordering` must end with a unique field (the id).
+    Nullable keys sort their NULLs last in either direction.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def sort_keys(self, model):
+        """
+        [(attribute, descending, model field, is NULL flag), ...] in sort
+        order. A nullable field is preceded by a 0/1 flag annotation that
+        puts its NULLs last.
+        """
+        keys = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            field = model._meta.get_field(name.lstrip('-'))
+            if field.null:
+                keys.append((f'cursor_{field.name}_null', False, field, True))
+            keys.append((field.attname, descending, field, False))
+        return keys
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keys = self.sort_keys(queryset.model)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[0])
+
+        flags = {name: Case(When(**{f'{field.name}__isnull': True}, then=Value(1)),
+                            default=Value(0), output_field=IntegerField())
+                 for name, _, field, is_flag in self.keys if is_flag}
+        queryset = queryset.annotate(**flags).order_by(*[
+            f'{"-" if descending != reverse else ""}{name}' for name, descending, _, _ in self.keys
+        ])
+        if cursor:
+            queryset = queryset.filter(self.seek(cursor[1], reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = True if reverse else has_more
+        self.has_previous = has_more if reverse else cursor is not None
+        self.first_position = self.position(rows[0]) if rows else cursor and cursor[1]
+        self.last_position = self.position(rows[-1]) if rows else cursor and cursor[1]
+        return rows
+
+    def seek(self, position, reverse):
+        """Rows strictly after `position` in the (possibly reversed) order: a row-value comparison spelt out."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, _, _), value in zip(self.keys, position):
+            if value is not None:
+                # Within NULLs every row ties, so only the following keys can tell them apart
+                lookup = 'lt' if descending != reverse else 'gt'
+                condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{f'{name}__isnull': True} if value is None else {name: value})
+        return condition
+
+    def position(self, row):
+        return [getattr(row, name) for name, _, _, _ in self.keys]
+
+    def encode_cursor(self, reverse, position):
+        # isoformat() keeps microseconds (DjangoJSONEncoder would round them off and break the seek)
+        position = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        token = base64.urlsafe_b64encode(json.dumps([int(reverse), position]).encode())
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token.decode())
+
+    def decode_cursor(self, request):
+        """(reverse, position) from ?cursor=, or None on the first page."""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            reverse, position = json.loads(base64.urlsafe_b64decode(token.encode()))
+            if len(position) != len(self.keys):
+                raise ValueError
+            position = [int(value) if is_flag else None if value is None else field.to_python(value)
+                        for (_, _, field, is_flag), value in zip(self.keys, position)]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), position
+
+    def get_next_link(self):
+        return self.encode_cursor(False, self.last_position) if self.has_next and self.last_position else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(True, self.first_position) if self.has_previous and self.first_position else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+def wants_cursor(request):
+    """Cursor mode is opt-in: ?pagination=cursor, or any request carrying a cursor."""
+    return request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET
+
+
+def get_paginator(request, page_size, cursor_ordering=None):
+    """
+    Return the paginator for a JSON list view: KeysetPagination on the given
+    ordering when the client asked for cursor mode (and the current sort
+    supports it), the classic PageNumberPagination otherwise.
+    """
+    if cursor_ordering and wants_cursor(request):
+        return KeysetPagination(cursor_ordering, page_size)
+    paginator = PageNumberPagination()
+    paginator.page_size = page_size
+    return paginator
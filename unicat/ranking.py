@@ -0,0 +1,60 @@
+import numpy as np
+
+from .snapshot import SCORE_FIELDS
+
+# Public indicator names accepted in ?weights= ("ar:2,ger:1"), by model field
+INDICATORS = {field[:-len('_score')]: field for field in SCORE_FIELDS}
+
+
+def parse_weights(value):
+    """
+    Parse "ar:2,er:1" into {'ar_score': 2.0, 'er_score': 1.0}. Raises
+    ValueError on unknown indicators, bad numbers, negative weights or
+    when every weight is zero.
+    """
+    weights = {}
+    for part in filter(None, (value or '').split(',')):
+        name, _, weight = part.partition(':')
+        name = name.strip()
+        if name not in INDICATORS:
+            raise ValueError(f"Unknown indicator: {name}")
+        weight = float(weight)
+        if not np.isfinite(weight) or weight < 0:
+            raise ValueError(f"Invalid weight for {name}")
+        weights[INDICATORS[name]] = weight
+    if not any(weights.values()):
+        raise ValueError("At least one positive weight is required")
+    return weights
+
+
+def score_matrix(snapshot):
+    """(programs x indicators) float matrix of the snapshot's QS scores, NaN where NULL; built once per snapshot."""
+    matrix = getattr(snapshot, '_score_matrix', None)
+    if matrix is None:
+        matrix = np.column_stack([np.frombuffer(snapshot.scores[field], dtype=np.float64) for field in SCORE_FIELDS])
+        snapshot._score_matrix = matrix
+    return matrix
+
+
+def composite_scores(snapshot, weights):
+    """
+    Weighted mean of each program's indicator scores. A missing score drops
+    out and the remaining weights are renormalized, so a program is not
+    punished for an indicator QS did not publish; programs with none of the
+    weighted scores get NaN.
+    """
+    matrix = score_matrix(snapshot)
+    vector = np.array([weights.get(field, 0.0) for field in SCORE_FIELDS])
+    present = ~np.isnan(matrix)
+    totals = np.where(present, matrix, 0.0) @ vector
+    weight_sums = present @ vector
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weight_sums > 0, totals / weight_sums, np.nan)
+
+
+def rank_positions(snapshot, positions, weights):
+    """Order snapshot positions by composite score, best first, unscored last, ties by QS index."""
+    positions = np.asarray(positions, dtype=np.intp)
+    scores = composite_scores(snapshot, weights)[positions]
+    keys = np.where(np.isnan(scores), np.inf, -scores)
+    return positions[np.lexsort((positions, keys))].tolist()
@@ -0,0 +1,43 @@
+import os
+import re
+
+from bs4 import BeautifulSoup
+
+# Saved ranking pages are named after their page number: page-1.html, page-2.html, ...
+SNAPSHOT_RE = re.compile(r'^page-(\d+)\.html?$')
+
+
+def snapshot_name(page):
+    return f'page-{page}.html'
+
+
+def snapshot_pages(directory):
+    """[(page number, path), ...] of the ranking snapshots in `directory`, in page order."""
+    pages = []
+    for entry in os.scandir(directory):
+        match = SNAPSHOT_RE.match(entry.name)
+        if match and entry.is_file():
+            pages.append((int(match.group(1)), entry.path))
+    return sorted(pages)
+
+
+def location_city(location_text):
+    """'Cambridge, United States' -> 'Cambridge'."""
+    location_text = ' '.join(location_text.split())
+    return location_text.split(',')[0].strip()
+
+
+def page_cities(html, offset):
+    """{university index: city} for one ranking page whose first row is index offset + 1."""
+    soup = BeautifulSoup(html, 'html.parser')
+    return {offset + j: location_city(div.get_text(strip=True))
+            for j, div in enumerate(soup.find_all('div', class_='location'), start=1)}
+
+
+def parse_snapshot(path, page, per_page):
+    """
+    Parse a saved ranking page. Lives outside the management command so
+    pool workers can import it without setting Django up.
+    """
+    with open(path, encoding='utf-8') as html_file:
+        return page, page_cities(html_file.read(), (page - 1) * per_page)
@@ -0,0 +1,72 @@
+import threading
+import weakref
+from contextlib import contextmanager
+
+from django.db.models import Sum
+
+from .models import CoFavourite, ErasmusProgram, FavouriteErasmusProgram
+
+_co_favourites = threading.local()
+
+
+def co_favourites_recorded_by_caller():
+    return getattr(_co_favourites, 'depth', 0) > 0
+
+
+@contextmanager
+def recording_co_favourites():
+    """
+    For the favourite views, which call CoFavourite.record_change() once per
+    batch: the per-row delete signals leave CoFavourite alone inside the block.
+    """
+    depth = getattr(_co_favourites, 'depth', 0)
+    _co_favourites.depth = depth + 1
+    try:
+        yield
+    finally:
+        _co_favourites.depth = depth
+
+
+def favourites_uncounted(origin):
+    """
+    Pks of the favourites already uncounted by the delete started from
+    `origin` (a user, a queryset...); forgotten along with the origin.
+    """
+    if origin is None:
+        return set()
+    if not hasattr(_co_favourites, 'uncounted'):
+        _co_favourites.uncounted = weakref.WeakKeyDictionary()
+    return _co_favourites.uncounted.setdefault(origin, set())
+
+
+def _programs_in_order(scored_ids):
+    """[(ErasmusProgram, score)] for [(id, score)], keeping the order, in one query."""
+    programs = ErasmusProgram.objects.select_related('country_code').in_bulk([program_id for program_id, _ in scored_ids])
+    return [(programs[program_id], score) for program_id, score in scored_ids if program_id in programs]
+
+
+def also_saved(program_id, limit=8):
+    """Programs most often saved by the students who saved `program_id`."""
+    rows = (CoFavourite.objects
+            .filter(program_id=program_id)
+            .order_by('-count', 'other_id')
+            .values_list('other_id', 'count')[:limit])
+    return _programs_in_order(list(rows))
+
+
+def recommended_for(user, limit=12):
+    """
+    Programs the user has not saved, scored by how often they are saved
+    together with the user's favourites (summed over all of them).
+    """
+    favourite_ids = list(FavouriteErasmusProgram.objects.filter(user=user).values_list('program_id', flat=True))
+    if not favourite_ids:
+        return []
+    rows = (CoFavourite.objects
+            .filter(program_id__in=favourite_ids)
+            .exclude(other_id__in=favourite_ids)
+            .values('other_id')
+            .annotate(score=Sum('count'))
+            .order_by('-score', 'other_id')
+            .values_list('other_id', 'score')[:limit])
+    return _programs_in_order(list(rows))
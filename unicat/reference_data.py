@@ -0,0 +1,193 @@
+import csv
+import json
+import os
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from .catalog import deferred_catalog_bumps
+from .models import Country, ErasmusProgram, Field_Study
+
+CSV_DIR = os.path.join(os.path.dirname(__file__), 'management', 'commands', 'csvs')
+JSON_DIR = os.path.join(settings.BASE_DIR, 'jsons')
+
+# Categories of majors-list.csv that are not fields of study
+SKIPPED_MAJOR_CATEGORIES = {'NA', "N/A (less than bachelor's degree)"}
+
+
+def countries_from_csv(path):
+    """ISO 3166 CSV -> ({code: {'name': name}}, synced fields)."""
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        rows = {row['alpha-2'].strip(): {'name': row['name'].strip()}
+                for row in csv.DictReader(csv_file) if row.get('alpha-2', '').strip()}
+    return rows, ('name',)
+
+
+def fields_of_study_from_csv(path):
+    """
+    majors-list.csv -> ({category: {'order': order}}, synced fields). The
+    order is what Field_Study.save() would set, which bulk_create skips.
+    """
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        names = {name for name in (row.get('Major_Category', '').strip() for row in csv.DictReader(csv_file))
+                 if name and name not in SKIPPED_MAJOR_CATEGORIES}
+    names.add('Other')
+    return {name: {'order': Field_Study.order_for(name)} for name in sorted(names)}, ('order',)
+
+
+def rows_from_fixture(path, model):
+    """
+    The objects of `model` in a dumpdata fixture (jsons/*.json) ->
+    ({pk: {attname: value}}, synced fields). Only the fields present in the
+    fixture are synced.
+    """
+    with open(path, encoding='utf-8') as json_file:
+        objects = [obj for obj in json.load(json_file) if obj.get('model') == model._meta.label_lower]
+    rows = {}
+    fields = set()
+    for obj in objects:
+        row = {}
+        for name, value in obj['fields'].items():
+            model_field = model._meta.get_field(name)
+            row[model_field.attname] = model_field.to_python(value)
+        rows[model._meta.pk.to_python(obj['pk'])] = row
+        fields.update(row)
+    return rows, tuple(sorted(fields))
+
+
+def countries_in_use():
+    """Codes of the countries some Erasmus program points at; deleting them would blank those programs."""
+    return set(ErasmusProgram.objects.exclude(country_code=None).values_list('country_code', flat=True).distinct())
+
+
+class Dataset:
+    """A reference table and where its rows come from."""
+
+    def __init__(self, model, default_source, csv_rows, in_use=None, catalog=False):
+        self.model = model
+        self.default_source = default_source
+        self.csv_rows = csv_rows
+        self.in_use = in_use
+        self.catalog = catalog
+
+    def load(self, path=None):
+        path = path or self.default_source
+        if not os.path.exists(path):
+            raise CommandError(f"Fitxer no trobat: {path}")
+        if path.endswith('.json'):
+            return rows_from_fixture(path, self.model)
+        return self.csv_rows(path)
+
+
+DATASETS = {
+    'countries': Dataset(Country, os.path.join(CSV_DIR, 'countries.csv'), countries_from_csv,
+                         in_use=countries_in_use, catalog=True),
+    'fields_of_study': Dataset(Field_Study, os.path.join(CSV_DIR, 'majors-list.csv'), fields_of_study_from_csv),
+}
+
+
+class ReferenceDiff:
+    """What syncing a table would do: instances to create, update (with their changes) and delete."""
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.created = []
+        self.updated = []  # [(instance, {field: (old, new)}), ...]
+        self.deleted = []
+        self.kept = []  # missing from the source but still in use
+
+    def __bool__(self):
+        return bool(self.created or self.updated or self.deleted)
+
+    def report(self):
+        """One line per change, for --dry-run."""
+        lines = [f"+ {obj.pk}" + (f" {self.describe(obj)}" if self.fields else '') for obj in self.created]
+        for obj, changes in self.updated:
+            lines.append(f"~ {obj.pk}: " + ', '.join(f"{field} {old!r} -> {new!r}"
+                                                    for field, (old, new) in changes.items()))
+        lines.extend(f"- {obj.pk}" for obj in self.deleted)
+        lines.extend(f"= {obj.pk} (en ús, no s'esborra)" for obj in self.kept)
+        return lines
+
+    def describe(self, obj):
+        return ', '.join(f"{field}={getattr(obj, field)!r}" for field in self.fields)
+
+    def summary(self):
+        return (f"{len(self.created)} nous, {len(self.updated)} actualitzats, {len(self.deleted)} esborrats, "
+                f"{len(self.kept)} conservats perquè estan en ús")
+
+
+def diff_rows(model, rows, fields, keep=(), prune=True):
+    """
+    Compare the source rows ({pk: {field: value}}) with the whole table,
+    read in one query. Rows missing from the source are deleted when
+    `prune`, except the keys in `keep`.
+    """
+    diff = ReferenceDiff(model, fields)
+    existing = model.objects.in_bulk()
+    for pk, row in rows.items():
+        obj = existing.get(pk)
+        if obj is None:
+            diff.created.append(model(pk=pk, **row))
+            continue
+        changes = {field: (getattr(obj, field), row[field]) for field in fields
+                   if field in row and getattr(obj, field) != row[field]}
+        if changes:
+            for field, (_, new) in changes.items():
+                setattr(obj, field, new)
+            diff.updated.append((obj, changes))
+    if prune:
+        for pk, obj in existing.items():
+            if pk not in rows:
+                (diff.kept if pk in keep else diff.deleted).append(obj)
+    return diff
+
+
+def apply_diff(diff, catalog=False, batch_size=500):
+    """Apply a diff in one transaction: deletes first, so renames can take a freed unique value."""
+    model = diff.model
+    with transaction.atomic():
+        # The deletes' per-row signal bumps are folded into one
+        with deferred_catalog_bumps() if catalog and diff else nullcontext():
+            if diff.deleted:
+                model.objects.filter(pk__in=[obj.pk for obj in diff.deleted]).delete()
+            if diff.updated:
+                changed_fields = sorted({field for _, changes in diff.updated for field in changes})
+                model.objects.bulk_update([obj for obj, _ in diff.updated], changed_fields, batch_size=batch_size)
+            model.objects.bulk_create(diff.created, batch_size=batch_size)
+
+
+def sync_dataset(name, source=None, prune=True, dry_run=False):
+    """Sync a table of DATASETS with its source. Returns the diff (applied unless `dry_run`)."""
+    dataset = DATASETS[name]
+    rows, fields = dataset.load(source)
+    keep = dataset.in_use() if prune and dataset.in_use else ()
+    diff = diff_rows(dataset.model, rows, fields, keep=keep, prune=prune)
+    if not dry_run:
+        apply_diff(diff, catalog=dataset.catalog)
+    return diff
+
+
+class SyncCommand(BaseCommand):
+    """Base for the import_* commands of reference tables: set `dataset` to a key of DATASETS."""
+    dataset = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='Fitxer CSV o fixture JSON (jsons/*.json) d\'origen')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Mostra les diferències sense aplicar-les')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='No esborra les files que no surten a l\'origen')
+
+    def handle(self, *args, **options):
+        diff = sync_dataset(self.dataset, options['source'], prune=not options['keep_missing'],
+                            dry_run=options['dry_run'])
+        if options['dry_run']:
+            for line in diff.report():
+                self.stdout.write(line)
+            self.stdout.write(self.style.WARNING(f"DRY RUN: {diff.summary()}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(diff.summary()))
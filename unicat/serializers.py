@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from .logo_variants import logo_sources
 from .models import *
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -83,15 +84,17 @@ class ErasmusProgramSerializer(serializers.ModelSerializer):
     reviews_count = serializers.SerializerMethodField()
     participants_count = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    sub_ratings = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
     is_user_program = serializers.SerializerMethodField()
     has_user_program = serializers.SerializerMethodField()
+    logo = serializers.SerializerMethodField()
     
     class Meta:
         model = ErasmusProgram
-        fields = ['id', 'university', 'city', 'country', 'rank', 'static_image', 
+        fields = ['id', 'university', 'city', 'country', 'rank', 'static_image', 'logo', 
                  'is_connected', 'full_stars', 'has_half_star', 
-                 'average_rating', 'reviews_count', 'participants_count',
+                 'average_rating', 'sub_ratings', 'reviews_count', 'participants_count',
                  'is_favorite', 'is_user_program', 'has_user_program']
     
     def get_is_connected(self, obj):
@@ -99,43 +102,34 @@ class ErasmusProgramSerializer(serializers.ModelSerializer):
         return obj.id in user_program_ids
     
     def get_full_stars(self, obj):
-        avg = obj.average_rating() or 0
-        return int(avg)
+        return obj.full_stars()
     
     def get_has_half_star(self, obj):
-        avg = obj.average_rating() or 0
-        return (avg - int(avg)) >= 0.5
+        return obj.has_half_star()
     
     def get_reviews_count(self, obj):
-        return obj.reviews.count()
+        return obj.review_count
     
     def get_participants_count(self, obj):
-        return obj.participants.count()
+        return obj.participants_count
     
     def get_average_rating(self, obj):
-        return obj.average_rating() or 0
+        return obj.cached_average_rating or 0
+    
+    def get_sub_ratings(self, obj):
+        return obj.sub_rating_averages()
     
     def get_is_favorite(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            user_favorites = self.context.get('user_favorites', [])
-            return obj.id in user_favorites
-        return False
+        return obj.id in self.context.get('user_favorites', set())
     
     def get_is_user_program(self, obj):
         """Check if this program is the user's current program"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            try:
-                user_participant = ErasmusParticipant.objects.get(user=request.user)
-                return user_participant.program == obj
-            except ErasmusParticipant.DoesNotExist:
-                return False
-        return False
+        return obj.id in self.context.get('user_program_ids', set())
+    
+    def get_logo(self, obj):
+        """Responsive variants of static_image (src, srcset, width, height, sources), or None."""
+        return logo_sources(obj.static_image)
     
     def get_has_user_program(self, obj):
         """Check if user has any program (different from this one)"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return ErasmusParticipant.objects.filter(user=request.user).exists()
-        return False
\ No newline at end of file
+        return bool(self.context.get('user_program_ids'))
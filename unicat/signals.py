@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .catalog import catalog_bumps_deferred
+from .models import (
+    CoFavourite, Comment, Country, ErasmusParticipant, ErasmusProgram, ErasmusReview, Event, EventParticipant,
+    FavouriteErasmusProgram, Resource, TableGeneration,
+)
+from .recommendations import co_favourites_recorded_by_caller, favourites_uncounted
+
+# Generation bumped by every save/delete of each model (reviews bump theirs
+# in ErasmusProgram.apply_review_change). Bulk writes must bump explicitly,
+# and imports wrap their per-row saves in catalog.deferred_catalog_bumps().
+MODEL_GENERATIONS = {
+    Event: TableGeneration.EVENTS,
+    EventParticipant: TableGeneration.EVENT_PARTICIPANTS,
+    Resource: TableGeneration.RESOURCES,
+    Comment: TableGeneration.COMMENTS,
+    ErasmusProgram: TableGeneration.CATALOG,
+    Country: TableGeneration.CATALOG,
+    ErasmusParticipant: TableGeneration.ERASMUS_PARTICIPANTS,
+    FavouriteErasmusProgram: TableGeneration.FAVOURITES,
+}
+
+
+def bump_model_generation(sender, **kwargs):
+    name = MODEL_GENERATIONS[sender]
+    if name == TableGeneration.CATALOG and catalog_bumps_deferred():
+        return
+    transaction.on_commit(lambda: TableGeneration.bump(name))
+
+
+for model in MODEL_GENERATIONS:
+    post_save.connect(bump_model_generation, sender=model, dispatch_uid=f'generation_save_{model.__name__}')
+    post_delete.connect(bump_model_generation, sender=model, dispatch_uid=f'generation_delete_{model.__name__}')
+
+
+@receiver(post_delete, sender=ErasmusReview)
+def remove_review_from_aggregates(sender, instance, **kwargs):
+    """Also fires for cascaded deletes (user or program removed)."""
+    ErasmusProgram.apply_review_change(instance.program_id, instance.rating, -1, instance.sub_ratings())
+
+
+@receiver(post_save, sender=ErasmusParticipant)
+def count_new_participant(sender, instance, created, **kwargs):
+    if created:
+        ErasmusProgram.objects.filter(pk=instance.program_id).update(participants_count=F('participants_count') + 1)
+
+
+@receiver(post_delete, sender=ErasmusParticipant)
+def uncount_participant(sender, instance, **kwargs):
+    ErasmusProgram.objects.filter(pk=instance.program_id).update(participants_count=F('participants_count') - 1)
+
+
+@receiver(pre_delete, sender=FavouriteErasmusProgram)
+def uncount_co_favourite(sender, instance, origin=None, **kwargs):
+    """
+    Favourites deleted outside the favourite views: cascades from a deleted
+    user, the admin, the shell. pre_delete runs before any row of the batch
+    is gone, so each favourite is paired with the user's favourites not yet
+    uncounted; a pair losing both sides moves only once.
+    """
+    if co_favourites_recorded_by_caller():
+        return
+    # A deleted program takes all its pairs with it (CoFavourite cascades)
+    if isinstance(origin, ErasmusProgram) or (isinstance(origin, QuerySet) and origin.model is ErasmusProgram):
+        return
+    uncounted = favourites_uncounted(origin)
+    saved = {program_id for pk, program_id in FavouriteErasmusProgram.objects.filter(user_id=instance.user_id)
+             .values_list('pk', 'program_id') if pk not in uncounted}
+    CoFavourite.record_change([instance.program_id], saved | {instance.program_id}, -1)
+    uncounted.add(instance.pk)
+
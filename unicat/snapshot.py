@@ -0,0 +1,156 @@
+import math
+import threading
+from array import array
+
+from .catalog import catalog_programs, normalize
+from .models import RANK_FIELDS, ErasmusProgram, TableGeneration
+
+SCORE_FIELDS = (
+    'overall_score', 'ar_score', 'er_score', 'fsr_score', 'cpf_score',
+    'ifr_score', 'isr_score', 'irn_score', 'ger_score', 'sus_score',
+)
+
+# Programs without a QS index (or rank bound) sort after every ranked one
+MISSING_INDEX = 2 ** 31 - 1
+
+# ?sort= values ordering by one QS indicator rank, best first ("ar_rank_asc")
+RANK_SORTS = {f'{field}_asc': field for field in RANK_FIELDS if field != 'rank'}
+
+NAN = float('nan')
+
+
+class CatalogSnapshot:
+    """
+    Read-only, columnar copy of the exchange catalog. Rows are stored in
+    default (QS index) order, so a position doubles as the default sort key.
+    Filtering and sorting work on lists of positions; only the ids of the
+    requested page ever go back to the database.
+    """
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        self.index = array('l')
+        self.rating = array('d')
+        self.country = array('l')
+        self.university = []
+        self.university_folded = []
+        self.scores = {field: array('d') for field in SCORE_FIELDS}
+        self.sub_ratings = {name: array('d') for name in ErasmusProgram.SUB_RATINGS}
+        # (lower, upper) rank bounds per rank field; an open-ended band ("1401+") has no upper bound
+        self.ranks = {field: (array('l'), array('l')) for field in RANK_FIELDS}
+        self.country_names = []
+        self.country_ids = {}
+
+        for row in rows:
+            self.ids.append(row['id'])
+            self.index.append(MISSING_INDEX if row['index'] is None else row['index'])
+            self.rating.append(row['cached_average_rating'] or 0.0)
+            country = row['country_code__name']
+            if country not in self.country_ids:
+                self.country_ids[country] = len(self.country_names)
+                self.country_names.append(country)
+            self.country.append(self.country_ids[country])
+            self.university.append(row['university'])
+            self.university_folded.append(normalize(row['university']))
+            for field in SCORE_FIELDS:
+                self.scores[field].append(NAN if row[field] is None else row[field])
+            for field, (lows, highs) in self.ranks.items():
+                low, high = row[f'{field}_low'], row[f'{field}_high']
+                lows.append(MISSING_INDEX if low is None else low)
+                highs.append(MISSING_INDEX if high is None else high)
+            for name in ErasmusProgram.SUB_RATINGS:
+                count = row[f'{name}_rating_count']
+                self.sub_ratings[name].append(row[f'{name}_rating_sum'] / count if count else NAN)
+
+        self.positions = {program_id: position for position, program_id in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls):
+        fields = ['id', 'index', 'university', 'cached_average_rating', 'country_code__name', *SCORE_FIELDS,
+                  *ErasmusProgram.rank_bound_fields()]
+        for name in ErasmusProgram.SUB_RATINGS:
+            fields += [f'{name}_rating_sum', f'{name}_rating_count']
+        return cls(catalog_programs().order_by('index', 'id').values(*fields))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filter(self, university='', countries=(), favorites='', favorite_ids=(), rank_min=None, rank_max=None):
+        """Positions matching the list filters, in default order."""
+        positions = range(len(self.ids))
+        if rank_min is not None or rank_max is not None:
+            # Rank band on the lower bound of the overall rank; unranked programs never match
+            low = rank_min or 0
+            high = MISSING_INDEX - 1 if rank_max is None else rank_max
+            lows = self.ranks['rank'][0]
+            positions = [p for p in positions if low <= lows[p] <= high]
+        if university:
+            needle = normalize(university)
+            folded = self.university_folded
+            positions = [p for p in positions if needle in folded[p]]
+        if countries:
+            wanted = {self.country_ids[name] for name in countries if name in self.country_ids}
+            country = self.country
+            positions = [p for p in positions if country[p] in wanted]
+        if favorites in ('favorites', 'not_favorites'):
+            favourite_positions = {self.positions[i] for i in favorite_ids if i in self.positions}
+            keep = favorites == 'favorites'
+            positions = [p for p in positions if (p in favourite_positions) == keep]
+        return list(positions)
+
+    def sort(self, positions, sort=''):
+        """Order positions like get_erasmus_programs orders its queryset."""
+        ids, rating = self.ids, self.rating
+        if sort == 'rating_desc':
+            positions.sort(key=lambda p: (-rating[p], ids[p]))
+        elif sort == 'rating_asc':
+            positions.sort(key=lambda p: (rating[p], ids[p]))
+        elif sort == 'name_asc':
+            positions.sort(key=lambda p: (self.university[p], ids[p]))
+        elif sort == 'name_desc':
+            positions.sort(key=lambda p: (self.university[p], ids[p]), reverse=True)
+        elif sort == 'qs_rank_asc':
+            # Worst overall rank first, open-ended bands before bounded ones, unranked last
+            lows, highs = self.ranks['rank']
+            positions.sort(key=lambda p: (lows[p] == MISSING_INDEX, -lows[p], -highs[p], -p))
+        elif sort in RANK_SORTS:
+            lows, highs = self.ranks[RANK_SORTS[sort]]
+            positions.sort(key=lambda p: (lows[p], highs[p], p))
+        elif sort.endswith('_desc') and sort[:-len('_desc')] in self.sub_ratings:
+            averages = self.sub_ratings[sort[:-len('_desc')]]
+
+            def by_average(p):
+                # Highest mean first, unrated programs last, ties by QS index
+                average = averages[p]
+                return (True, 0.0, p) if math.isnan(average) else (False, -average, p)
+            positions.sort(key=by_average)
+        return positions
+
+    def ids_at(self, positions):
+        ids = self.ids
+        return [ids[p] for p in positions]
+
+
+_lock = threading.Lock()
+_current = (None, None)
+
+
+def get_snapshot():
+    """This worker's snapshot, reloaded when the catalog or reviews generation moves."""
+    global _current
+    stamp = TableGeneration.stamp(TableGeneration.CATALOG, TableGeneration.REVIEWS)
+    current_stamp, snapshot = _current
+    if snapshot is None or current_stamp != stamp:
+        with _lock:
+            current_stamp, snapshot = _current
+            if snapshot is None or current_stamp != stamp:
+                snapshot = CatalogSnapshot.load()
+                # Swapped in one assignment: readers see the old or the new snapshot, never half of one
+                _current = (stamp, snapshot)
+    return snapshot
+
+
+def clear_snapshot():
+    global _current
+    with _lock:
+        _current = (None, None)
@@ -18,8 +18,10 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Set up event listeners for real-time filtering
     document.getElementById('universitySearch').addEventListener('input', debounce(applyFilters, 300));
+    document.getElementById('universitySearch').addEventListener('input', debounce(fetchSuggestions, 150));
     // Remove the old countryFilter listener since we're using multi-select
     document.getElementById('favoritesFilter').addEventListener('change', applyFilters); 
+    document.getElementById('rankFilter').addEventListener('change', applyFilters);
     document.getElementById('sortFilter').addEventListener('change', applyFilters);
     
     // Initialize multi-select country filter
@@ -66,7 +68,9 @@ function generateCountryOptions() {
             <input type="checkbox" 
                    id="country_cb_${country.code}" 
                    onchange="toggleCountrySelection('${country.name.replace(/'/g, "\\'")}')">
-            <label for="country_cb_${country.code}">${country.name}</label>
+            <label for="country_cb_${country.code}">${country.name}
+                <span class="facet-count text-muted">${country.count !== undefined ? `(${country.count})` : ''}</span>
+            </label>
         `;
         optionsList.appendChild(option);
     });
@@ -214,6 +218,13 @@ function clearCountrySelections() {
     updateHiddenCountryInput();
 }
 
+// Weighted ranking presets carry their indicator weights on the selected option
+function sortWeightsParam() {
+    const select = document.getElementById('sortFilter');
+    const weights = select.options[select.selectedIndex].dataset.weights;
+    return weights ? `&weights=${encodeURIComponent(weights)}` : '';
+}
+
 // Debounce function to limit API calls while typing
 function debounce(func, delay) {
     let debounceTimer;
@@ -225,19 +236,52 @@ function debounce(func, delay) {
     };
 }
 
+// Fill the search box suggestions from the autocomplete endpoint
+function fetchSuggestions() {
+    const query = document.getElementById('universitySearch').value.trim();
+    const datalist = document.getElementById('universitySuggestions');
+    if (!datalist) return;
+    if (query.length < 2) {
+        datalist.innerHTML = '';
+        return;
+    }
+    fetch(`/api/erasmus-programs/autocomplete/?q=${encodeURIComponent(query)}&limit=8`)
+        .then(response => response.json())
+        .then(data => {
+            datalist.innerHTML = '';
+            data.results.forEach(program => {
+                const option = document.createElement('option');
+                option.value = program.university;
+                option.label = [program.city, program.country].filter(Boolean).join(', ');
+                datalist.appendChild(option);
+            });
+        })
+        .catch(error => console.error('Error fetching suggestions:', error));
+}
+
+// Responsive logo from the API's variant data: AVIF/WebP sources with a sized JPEG fallback
+function logoPicture(logo, alt) {
+    const sources = logo.sources.map(source =>
+        `<source type="${source.type}" srcset="${source.srcset}" sizes="${logo.sizes}">`).join('');
+    return `<picture>${sources}<img src="${logo.src}" srcset="${logo.srcset}" sizes="${logo.sizes}" ` +
+        `width="${logo.width}" height="${logo.height}" alt="${alt}" class="university-logo" ` +
+        `loading="lazy" decoding="async"></picture>`;
+}
+
 // Apply filters and fetch filtered results from API (updated for multi-select)
 function applyFilters() {
     const universitySearch = document.getElementById('universitySearch').value.trim();
     // Use selected countries array instead of single country filter
     const countryFilters = selectedCountries;
     const favoritesFilter = document.getElementById('favoritesFilter').value; 
+    const rankFilter = document.getElementById('rankFilter').value;
     const sortFilter = document.getElementById('sortFilter').value;
     
     // Show loading indicator
     showLoading(true);
     
     // Build API URL with filters
-    let apiUrl = '/api/erasmus-programs/?page=1';
+    let apiUrl = '/api/erasmus-programs/?page=1&facets=1';
     if (universitySearch) {
         apiUrl += `&university=${encodeURIComponent(universitySearch)}`;
     }
@@ -250,15 +294,19 @@ function applyFilters() {
     if (favoritesFilter) { 
         apiUrl += `&favorites=${encodeURIComponent(favoritesFilter)}`;
     }
+    if (rankFilter) {
+        apiUrl += `&rank_max=${encodeURIComponent(rankFilter)}`;
+    }
     if (sortFilter) {
         apiUrl += `&sort=${encodeURIComponent(sortFilter)}`;
+        apiUrl += sortWeightsParam();
     }
     
     // Reset to first page when filtering
     currentPage = 1;
     
-    // Fetch filtered results
-    fetch(apiUrl)
+    // Fetch filtered results (revalidated with the server's ETag, 304 when unchanged)
+    fetch(apiUrl, { cache: 'no-cache' })
         .then(response => {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
@@ -268,6 +316,7 @@ function applyFilters() {
         .then(data => {
             // Update the DOM with filtered results
             updateResultsDisplay(data);
+            updateFacetCounts(data.facets);
             
             // Show/hide search info text
             const searchInfo = document.getElementById('searchInfo');
@@ -300,6 +349,22 @@ function applyFilters() {
         });
 }
 
+// Show live per-country / favourites counts for the current filters
+function updateFacetCounts(facets) {
+    if (!facets) return;
+    countries.forEach(country => {
+        country.count = facets.countries[country.name] || 0;
+        const checkbox = document.getElementById(`country_cb_${country.code}`);
+        const badge = checkbox && checkbox.parentElement.querySelector('.facet-count');
+        if (badge) badge.textContent = `(${country.count})`;
+    });
+    const favoritesSelect = document.getElementById('favoritesFilter');
+    Object.entries(facets.favorites).forEach(([value, count]) => {
+        const option = favoritesSelect.querySelector(`option[value="${value}"]`);
+        if (option) option.textContent = `${option.textContent.replace(/ \(\d+\)$/, '')} (${count})`;
+    });
+}
+
 // Update the results display with the filtered programs
 function updateResultsDisplay(data) {
     const programsList = document.getElementById('programsList');
@@ -426,7 +491,8 @@ function createProgramCard(program) {
                 </div>
                 
                 <div class="university-logo-container">
-                ${program.static_image ? 
+                ${program.logo ? logoPicture(program.logo, program.university) :
+                program.static_image ? 
                 `<img src="/static/unicat/images/erasmus/${program.static_image}" alt="${program.university}" class="university-logo">` : 
                 `<img src="/static/unicat/images/university-placeholder.jpg" alt="${program.university}" class="university-logo">`}
             </div>
@@ -568,6 +634,7 @@ function goToPage(page) {
     // Use selected countries array
     const countryFilters = selectedCountries;
     const favoritesFilter = document.getElementById('favoritesFilter').value;
+    const rankFilter = document.getElementById('rankFilter').value;
     const sortFilter = document.getElementById('sortFilter').value;
     
     let apiUrl = `/api/erasmus-programs/?page=${page}`;
@@ -583,12 +650,16 @@ function goToPage(page) {
     if (favoritesFilter) {
         apiUrl += `&favorites=${encodeURIComponent(favoritesFilter)}`;
     }
+    if (rankFilter) {
+        apiUrl += `&rank_max=${encodeURIComponent(rankFilter)}`;
+    }
     if (sortFilter) {
         apiUrl += `&sort=${encodeURIComponent(sortFilter)}`;
+        apiUrl += sortWeightsParam();
     }
     
     // Fetch page data
-    fetch(apiUrl)
+    fetch(apiUrl, { cache: 'no-cache' })
         .then(response => {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
@@ -648,6 +719,7 @@ function clearFilters() {
     document.getElementById('universitySearch').value = '';
     clearCountrySelections(); // Clear country selections
     document.getElementById('favoritesFilter').value = '';
+    document.getElementById('rankFilter').value = '';
     document.getElementById('sortFilter').value = '';
     
     // Apply filters with empty values to reset
@@ -69,7 +69,7 @@ function infiniteScrollEvents() {
         data() {
             return {
                 events: [],
-                currentPage: 1,
+                nextCursor: null,
                 isLoading: false,
                 hasMorePages: true,
                 currentUser: null,
@@ -203,7 +203,6 @@ function infiniteScrollEvents() {
             window.onscroll = () => {
                 let bottomOfWindow = (window.innerHeight + window.scrollY) >= document.body.offsetHeight - 100;
                 if (bottomOfWindow && !this.isLoading && this.hasMorePages) {
-                    this.currentPage++;
                     this.getEvents();
                 }
             }
@@ -316,7 +315,7 @@ function infiniteScrollEvents() {
                 
                 // Reset state and load with new filters
                 this.events = [];
-                this.currentPage = 1;
+                this.nextCursor = null;
                 this.hasMorePages = true;
                 
                 // Load new events without changing scroll position
@@ -339,7 +338,9 @@ function infiniteScrollEvents() {
                 this.isLoading = true;
                 
                 // Fix URL - change from /get_events/ to /api/events
-                let url = `/api/events?page=${this.currentPage}`;
+                // Keyset (cursor) pagination: follow the opaque cursor from the previous page
+                let url = `/api/events?pagination=cursor`;
+                if (this.nextCursor) url += `&cursor=${encodeURIComponent(this.nextCursor)}`;
                 
                 // Add filters if present
                 if (this.universityFilter) url += `&university=${encodeURIComponent(this.universityFilter)}`;
@@ -348,7 +349,8 @@ function infiniteScrollEvents() {
                 if (this.yearFilter) url += `&year=${encodeURIComponent(this.yearFilter)}`;     
                 if (this.interestedFilter) url += `&interested=${encodeURIComponent(this.interestedFilter)}`;
                 
-                return fetch(url)
+                // Revalidate with the server's ETag instead of refetching
+                return fetch(url, { cache: 'no-cache' })
                     .then(response => {
                         if (!response.ok) {
                             throw new Error(`HTTP error! Status: ${response.status}`);
@@ -357,6 +359,7 @@ function infiniteScrollEvents() {
                     })
                     .then(data => {
                         this.hasMorePages = !!data.next;
+                        this.nextCursor = data.next ? new URL(data.next, window.location.origin).searchParams.get('cursor') : null;
                         
                         if (data.current_user) {
                             this.currentUser = data.current_user;
@@ -342,7 +342,7 @@ function infiniteScroll() {
         data() {
             return {
                 resources: [],
-                currentPage: 1,
+                nextCursor: null,
                 isLoading: false,
                 isFiltering: false,
                 hasMorePages: true,
@@ -428,7 +428,6 @@ function infiniteScroll() {
             window.onscroll = () => {
                 let bottomOfWindow = (window.innerHeight + window.scrollY) >= document.body.offsetHeight - 100;
                 if (bottomOfWindow && !this.isLoading && this.hasMorePages) {
-                    this.currentPage++;
                     this.getResources();
                 }
             }
@@ -529,7 +528,7 @@ function infiniteScroll() {
                 
                 // Reiniciar el estado i carregar amb els nous filtres
                 this.resources = [];
-                this.currentPage = 1;
+                this.nextCursor = null;
                 this.hasMorePages = true;
                 
                 // Cargar nous recursos sense canviar la posició del scroll
@@ -550,14 +549,17 @@ function infiniteScroll() {
                 this.isLoading = true;
                 
                 // Construir URL amb paràmetres de filtre
-                let url = `/get_resources/?page=${this.currentPage}`;
+                // Keyset (cursor) pagination: follow the opaque cursor from the previous page
+                let url = `/get_resources/?pagination=cursor`;
+                if (this.nextCursor) url += `&cursor=${encodeURIComponent(this.nextCursor)}`;
                 
                 // Afegir filtres si estan presents
                 if (this.searchText) url += `&search=${encodeURIComponent(this.searchText)}`;
                 if (this.categoryFilter) url += `&category=${encodeURIComponent(this.categoryFilter)}`;
                 if (this.fieldStudyFilter) url += `&field_study=${encodeURIComponent(this.fieldStudyFilter)}`;
                 
-                return fetch(url)
+                // Revalidate with the server's ETag instead of refetching
+                return fetch(url, { cache: 'no-cache' })
                     .then(response => {
                         if (!response.ok) {
                             throw new Error(`HTTP error! Status: ${response.status}`);
@@ -566,6 +568,7 @@ function infiniteScroll() {
                     })
                     .then(data => {
                         this.hasMorePages = !!data.next;
+                        this.nextCursor = data.next ? new URL(data.next, window.location.origin).searchParams.get('cursor') : null;
                         
                         if (data.current_user) {
                             this.currentUser = data.current_user;
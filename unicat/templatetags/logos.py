@@ -0,0 +1,27 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from unicat.logo_variants import LOGO_DIR, logo_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def university_logo(static_image, alt, css_class='university-logo', style=''):
+    """
+    <picture> with the AVIF/WebP variants and a sized JPEG fallback when
+    build_logo_variants has processed this logo, the original file otherwise.
+    """
+    style_attr = format_html(' style="{}"', style) if style else ''
+    logo = logo_sources(static_image)
+    if logo is None:
+        return format_html('<img src="{}" alt="{}" class="{}"{}>', static(f'{LOGO_DIR}/{static_image}'), alt,
+                           css_class, style_attr)
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}"{} '
+        'loading="lazy" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">',
+                         ((source['type'], source['srcset'], logo['sizes']) for source in logo['sources'])),
+        logo['src'], logo['srcset'], logo['sizes'], logo['width'], logo['height'], alt, css_class, style_attr,
+    )
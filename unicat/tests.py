@@ -1,3 +1,1208 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Avg, Count, F, Sum
+from django.template import Context, Template
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from PIL import Image
+
+from . import autocomplete, logo_variants, reference_data, snapshot
+from .catalog import bump_catalog_version
+from .management.commands.import_erasmus import Command as ImportErasmusCommand
+from .models import *
+from .neighbours import similar_programs
+from .serializers import ErasmusProgramSerializer
+
+
+class ErasmusProgramListQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshot.clear_snapshot()
+        self.country = Country.objects.create(code='FR', name='France')
+        self.user = User.objects.create_user(username='student', password='pass')
+        self.client.force_login(self.user)
+
+    def create_programs(self, count):
+        programs = ErasmusProgram.objects.bulk_create([
+            ErasmusProgram(index=ErasmusProgram.objects.count() + i, university=f'University {i}',
+                           country_code=self.country)
+            for i in range(count)
+        ])
+        for program in programs[:3]:
+            ErasmusParticipant.objects.create(user=User.objects.create(username=f'p{program.id}'),
+                                              program=program, start_date='2025-09-01',
+                                              end_date='2026-01-31', contact_info='-')
+            FavouriteErasmusProgram.objects.create(user=self.user, program=program)
+        bump_catalog_version()
+        return programs
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/erasmus-programs/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_programs(5)
+        small_page_queries, data = self.count_list_queries()
+        self.assertEqual(len(data['results']), 5)
+
+        self.create_programs(55)
+        full_page_queries, data = self.count_list_queries()
+        self.assertEqual(len(data['results']), 60)
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_annotated_counts_and_user_flags(self):
+        programs = self.create_programs(4)
+        ErasmusParticipant.objects.create(user=self.user, program=programs[1], start_date='2025-09-01',
+                                          end_date='2026-01-31', contact_info='-')
+        _, data = self.count_list_queries()
+        results = {row['id']: row for row in data['results']}
+        self.assertEqual(results[programs[1].id]['participants_count'], 2)
+        self.assertEqual(results[programs[3].id]['participants_count'], 0)
+        self.assertEqual(results[programs[0].id]['country'], 'France')
+        self.assertTrue(results[programs[0].id]['is_favorite'])
+        self.assertFalse(results[programs[3].id]['is_favorite'])
+        self.assertTrue(results[programs[1].id]['is_user_program'])
+        self.assertFalse(results[programs[0].id]['is_user_program'])
+        self.assertTrue(all(row['has_user_program'] for row in data['results']))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshot.clear_snapshot()
+        country = Country.objects.create(code='FR', name='France')
+        # Three ratings only, so pages end inside long runs of ties; every 7th program has no index
+        ErasmusProgram.objects.bulk_create([
+            ErasmusProgram(index=None if i % 7 == 0 else i // 3, university=f'University {i}', country_code=country,
+                           cached_average_rating=(0, 3.5, 4)[i % 3])
+            for i in range(150)
+        ])
+
+    def walk(self, url):
+        """Follow `next` to the end, then `previous` back to the start; return both id sequences."""
+        forward, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append(data)
+            forward += [row['id'] for row in data['results']]
+            url = data['next']
+        backward = []
+        url = pages[-1]['previous']
+        while url:
+            data = self.client.get(url).json()
+            backward = [row['id'] for row in data['results']] + backward
+            url = data['previous']
+        return forward, backward + [row['id'] for row in pages[-1]['results']], len(pages)
+
+    def test_every_program_once_with_ties_and_nulls(self):
+        programs = list(ErasmusProgram.objects.values('id', 'index', 'cached_average_rating'))
+        expected = {
+            '': [p['id'] for p in sorted(programs, key=lambda p: (p['index'] is None, p['index'] or 0, p['id']))],
+            'rating_desc': [p['id'] for p in sorted(programs, key=lambda p: (-p['cached_average_rating'], p['id']))],
+            'rating_asc': [p['id'] for p in sorted(programs, key=lambda p: (p['cached_average_rating'], p['id']))],
+        }
+        for sort, ids in expected.items():
+            with self.subTest(sort=sort):
+                forward, backward, pages = self.walk(f'/api/erasmus-programs/?pagination=cursor&sort={sort}')
+                self.assertEqual(pages, 3)
+                self.assertEqual(forward, ids)
+                self.assertEqual(backward, ids)
+
+    def test_seek_on_tied_datetimes(self):
+        user = User.objects.create(username='organiser')
+        soon = timezone.now() + timedelta(days=1, microseconds=123456)
+        Event.objects.bulk_create([
+            Event(title=f'Event {i}', date=soon + timedelta(days=i % 2), created_by=user, location='-', type='other')
+            for i in range(20)
+        ])
+        forward, backward, pages = self.walk('/api/events?pagination=cursor')
+        expected = list(Event.objects.order_by('date', 'id').values_list('id', flat=True))
+        self.assertEqual(pages, 3)
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_cursor_and_page_modes_filter_alike(self):
+        query = urlencode({'university': 'UNIVERSITÝ 1', 'sort': 'rating_desc'})
+        forward, _, _ = self.walk(f'/api/erasmus-programs/?pagination=cursor&{query}')
+        numbered, url = [], f'/api/erasmus-programs/?{query}'
+        while url:
+            data = self.client.get(url).json()
+            numbered += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(forward, numbered)
+        self.assertEqual(len(forward), 61)  # University 1, 10-19, 100-149
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/erasmus-programs/?cursor=bm9wZQ').status_code, 404)
+
+
+class ErasmusPageQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.country = Country.objects.create(code='FR', name='France')
+        self.user = User.objects.create_user(username='student', password='pass')
+        self.client.force_login(self.user)
+
+    def create_programs(self, count):
+        programs = ErasmusProgram.objects.bulk_create([
+            ErasmusProgram(index=ErasmusProgram.objects.count() + i, university=f'University {i}',
+                           city='Paris', country_code=self.country)
+            for i in range(count)
+        ])
+        for program in programs[:2]:
+            ErasmusReview.objects.create(program=program, user=User.objects.create(username=f'r{program.id}'),
+                                         rating=4)
+            ErasmusParticipant.objects.create(user=User.objects.create(username=f'p{program.id}'),
+                                              program=program, start_date='2025-09-01',
+                                              end_date='2026-01-31', contact_info='-')
+        bump_catalog_version()
+        return programs
+
+    def test_page_renders_with_a_fixed_query_budget(self):
+        self.create_programs(3)
+        # session, user, catalog version, total count, connected program,
+        # per-country counts, countries, favourites and the page of programs
+        with self.assertNumQueries(9):
+            response = self.client.get('/exchanges/')
+        self.assertContains(response, '1 students')
+        self.assertContains(response, '<small>(1)</small>', html=False)
+
+        self.create_programs(40)
+        with self.assertNumQueries(9):  # same budget for a full page of 40 cards
+            response = self.client.get('/exchanges/')
+        self.assertEqual(len(response.context['erasmus_programs']), 40)
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(code='FR', name='France')
+        self.sorbonne = ErasmusProgram.objects.create(index=1, university='Sorbonne', country_code=country)
+        self.sciences_po = ErasmusProgram.objects.create(index=2, university='Sciences Po', country_code=country)
+        self.users = [User.objects.create(username=f'reviewer{i}') for i in range(3)]
+
+    def assertAggregatesFresh(self):
+        for program in ErasmusProgram.objects.all():
+            fresh = program.reviews.aggregate(count=Count('id'), total=Sum('rating'), average=Avg('rating'))
+            self.assertEqual(program.review_count, fresh['count'])
+            self.assertEqual(program.review_rating_sum, fresh['total'] or 0)
+            self.assertAlmostEqual(program.cached_average_rating, fresh['average'] or 0)
+
+    def test_create_edit_and_delete(self):
+        first = ErasmusReview.objects.create(program=self.sorbonne, user=self.users[0], rating=5)
+        second = ErasmusReview.objects.create(program=self.sorbonne, user=self.users[1], rating=2)
+        self.assertAggregatesFresh()
+
+        second.rating = 3
+        second.save()
+        self.assertAggregatesFresh()
+
+        # Moving a review takes it out of one program and into the other, with its new rating
+        first.program = self.sciences_po
+        first.rating = 1
+        first.save()
+        self.assertAggregatesFresh()
+        self.sorbonne.refresh_from_db()
+        self.assertEqual((self.sorbonne.review_count, self.sorbonne.cached_average_rating), (1, 3))
+
+        second.delete()
+        self.assertAggregatesFresh()
+        self.sorbonne.refresh_from_db()
+        self.assertEqual((self.sorbonne.review_count, self.sorbonne.cached_average_rating), (0, 0))
+
+    def test_cascaded_deletes(self):
+        for user, rating in zip(self.users, (5, 4, 1)):
+            ErasmusReview.objects.create(program=self.sorbonne, user=user, rating=rating)
+            ErasmusReview.objects.create(program=self.sciences_po, user=user, rating=6 - rating)
+        self.users[0].delete()
+        self.assertAggregatesFresh()
+        User.objects.filter(username__in=['reviewer1', 'reviewer2']).delete()
+        self.assertAggregatesFresh()
+
+    def test_rebuild_matches_live_counters_for_out_of_range_ratings(self):
+        # The rating field is not constrained to 1..5
+        for user, rating in zip(self.users, (5, 7, 0)):
+            ErasmusReview.objects.create(program=self.sorbonne, user=user, rating=rating)
+        self.assertAggregatesFresh()
+        self.sorbonne.refresh_from_db()
+        live = [getattr(self.sorbonne, field) for field in ErasmusProgram.REVIEW_AGGREGATE_FIELDS]
+        self.assertEqual(self.sorbonne.rating_histogram(), {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+        ErasmusProgram.objects.filter(pk=self.sorbonne.pk).update(review_count=0, review_rating_sum=0,
+                                                                  rating_5_count=0)
+        ErasmusProgram.rebuild_review_aggregates()
+        self.sorbonne.refresh_from_db()
+        self.assertEqual([getattr(self.sorbonne, field) for field in ErasmusProgram.REVIEW_AGGREGATE_FIELDS], live)
+        self.sorbonne.update_average_rating()
+        self.assertEqual([getattr(self.sorbonne, field) for field in ErasmusProgram.REVIEW_AGGREGATE_FIELDS], live)
+        self.assertAggregatesFresh()
+
+    def assertSubRatingsFresh(self):
+        for program in ErasmusProgram.objects.all():
+            for name in ErasmusProgram.SUB_RATINGS:
+                field = f'{name}_rating'
+                rated = program.reviews.filter(**{f'{field}__gt': 0})
+                fresh = rated.aggregate(total=Sum(field), count=Count('id'))
+                self.assertEqual(getattr(program, f'{field}_sum'), fresh['total'] or 0, name)
+                self.assertEqual(getattr(program, f'{field}_count'), fresh['count'], name)
+
+    def test_sub_ratings_skip_unrated_values(self):
+        first = ErasmusReview.objects.create(program=self.sorbonne, user=self.users[0], rating=4,
+                                             academic_rating=4, housing_rating=0, social_rating=None)
+        second = ErasmusReview.objects.create(program=self.sorbonne, user=self.users[1], rating=3,
+                                              academic_rating=2.5, housing_rating=3, city_rating=0)
+        self.assertSubRatingsFresh()
+        self.sorbonne.refresh_from_db()
+        self.assertEqual(self.sorbonne.sub_rating_averages()['housing'], {'average': 3.0, 'count': 1})
+
+        # Rated -> unrated, unrated -> rated, NULL -> rated
+        first.academic_rating = 0
+        first.housing_rating = 5
+        first.social_rating = 2
+        first.save()
+        self.assertSubRatingsFresh()
+        second.academic_rating = None
+        second.city_rating = 4
+        second.program = self.sciences_po
+        second.save()
+        self.assertSubRatingsFresh()
+
+        first.delete()
+        second.delete()
+        self.assertSubRatingsFresh()
+        self.sorbonne.refresh_from_db()
+        self.assertEqual(self.sorbonne.sub_rating_averages()['academic'], {'average': None, 'count': 0})
+
+    def test_sub_rating_rebuild_matches_live_counters(self):
+        for user, value in zip(self.users, (5, 0, None)):
+            ErasmusReview.objects.create(program=self.sorbonne, user=user, rating=3,
+                                         academic_rating=value, city_rating=value)
+        ErasmusProgram.objects.update(academic_rating_sum=0, academic_rating_count=0)
+        ErasmusProgram.rebuild_review_aggregates()
+        self.assertSubRatingsFresh()
+        self.users[0].delete()
+        self.assertSubRatingsFresh()
+
+
+class ErasmusDetailQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.country = Country.objects.create(code='FR', name='France')
+        self.program = ErasmusProgram.objects.create(index=1, university='Sorbonne', city='Paris',
+                                                     country_code=self.country)
+        self.user = User.objects.create_user(username='student', password='pass')
+        self.client.force_login(self.user)
+
+    def add_activity(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create(username=f'u{i}')
+            ErasmusParticipant.objects.create(user=user, program=self.program, start_date='2025-09-01',
+                                              end_date='2026-01-31', contact_info='-')
+            ErasmusReview.objects.create(program=self.program, user=user, rating=4)
+
+    def count_detail_queries(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/exchanges_detail/{self.program.id}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_participant_count_follows_signups(self):
+        self.add_activity(3)
+        self.program.refresh_from_db()
+        self.assertEqual(self.program.participants_count, 3)
+        self.program.participants.first().delete()
+        self.program.refresh_from_db()
+        self.assertEqual(self.program.participants_count, 2)
+
+    def test_page_queries_do_not_grow_with_participants_or_reviews(self):
+        self.add_activity(2)
+        few, response = self.count_detail_queries()
+        self.assertContains(response, 'Program Participants (2)')
+
+        self.add_activity(50)
+        many, response = self.count_detail_queries()
+        self.assertEqual(many, few)
+        self.assertContains(response, 'Program Participants (52)')
+        self.assertEqual(len(response.context['participants']), 20)
+        self.assertEqual(len(response.context['reviews']), 10)
+
+        last_page, response = self.count_detail_queries('?participant_page=3&review_page=6')
+        self.assertEqual(last_page, few)
+        self.assertEqual(len(response.context['participants']), 12)
+        self.assertEqual(len(response.context['reviews']), 2)
+
+
+class CatalogCountCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshot.clear_snapshot()
+        country = Country.objects.create(code='FR', name='France')
+        ErasmusProgram.objects.bulk_create([
+            ErasmusProgram(index=i, university=f'University {i}', country_code=country) for i in range(3)
+        ])
+        self.user = User.objects.create_user(username='student', password='pass')
+        self.client.force_login(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT COUNT(')], response.json()
+
+    def test_counts_follow_the_catalog_version_without_count_queries(self):
+        counts, data = self.count_queries('/api/erasmus-programs/')
+        self.assertEqual(counts, [])
+        self.assertEqual((data['count'], data['total_count']), (3, 3))
+
+        ErasmusProgram.objects.filter(index=0).delete()
+        counts, data = self.count_queries('/api/erasmus-programs/')
+        self.assertEqual((data['count'], data['total_count']), (3, 3))
+
+        bump_catalog_version()
+        counts, data = self.count_queries('/api/erasmus-programs/')
+        self.assertEqual(counts, [])
+        self.assertEqual((data['count'], data['total_count']), (2, 2))
+
+    def test_admin_edits_bump_the_catalog_once(self):
+        program_admin = admin.site._registry[ErasmusProgram]
+        request = mock.Mock(user=self.user)
+        before = TableGeneration.current(TableGeneration.CATALOG)
+        program = ErasmusProgram.objects.get(index=0)
+        program.city = 'Paris'
+        with self.captureOnCommitCallbacks(execute=True):
+            program_admin.save_model(request, program, None, True)
+        self.assertEqual(TableGeneration.current(TableGeneration.CATALOG), before + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            program_admin.delete_queryset(request, ErasmusProgram.objects.all())
+        self.assertEqual(TableGeneration.current(TableGeneration.CATALOG), before + 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site._registry[Country].delete_model(request, Country.objects.get(code='FR'))
+        self.assertEqual(TableGeneration.current(TableGeneration.CATALOG), before + 3)
+
+    def test_filtered_counts_need_no_count_queries(self):
+        counts, data = self.count_queries('/api/erasmus-programs/?university=University 1')
+        self.assertEqual(counts, [])
+        self.assertEqual((data['count'], data['total_count']), (1, 3))
+        FavouriteErasmusProgram.objects.create(user=self.user, program=ErasmusProgram.objects.get(index=2))
+        counts, data = self.count_queries('/api/erasmus-programs/?favorites=favorites')
+        self.assertEqual(counts, [])
+        self.assertEqual(data['count'], 1)
+
+    def test_facets_come_from_one_cached_grouped_query(self):
+        italy = Country.objects.create(code='IT', name='Italy')
+        ErasmusProgram.objects.create(index=3, university='University of Bologna', country_code=italy)
+        FavouriteErasmusProgram.objects.create(user=self.user, program=ErasmusProgram.objects.get(index=0))
+        bump_catalog_version()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/erasmus-programs/', {'facets': 1, 'country': 'Italy'})
+        facets = response.json()['facets']
+        self.assertEqual(facets['countries'], {'France': 3, 'Italy': 1})
+        self.assertEqual(facets['favorites'], {'favorites': 0, 'not_favorites': 1})
+        self.assertEqual(sum('GROUP BY "unicat_country"."name"' in query['sql'] for query in queries), 1)
+
+        response = self.client.get('/api/erasmus-programs/', {'facets': 1, 'favorites': 'favorites'})
+        facets = response.json()['facets']
+        self.assertEqual(facets['countries'], {'France': 1, 'Italy': 0})
+        self.assertEqual(facets['favorites'], {'favorites': 1, 'not_favorites': 3})
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        snapshot.clear_snapshot()
+        france = Country.objects.create(code='FR', name='France')
+        italy = Country.objects.create(code='IT', name='Italy')
+        for index, (university, country, ratings) in enumerate([
+            ('Sorbonne', france, [5, 3]),
+            ('Politecnico di Milano', italy, [4]),
+            ('Sciences Po', france, []),
+            ('University of Bologna', italy, [5]),
+        ], start=1):
+            program = ErasmusProgram.objects.create(index=index, university=university, country_code=country)
+            for rating in ratings:
+                ErasmusReview.objects.create(program=program, user=User.objects.create(username=f'r{index}{rating}'),
+                                             rating=rating, academic_rating=rating)
+        self.user = User.objects.create_user(username='student', password='pass')
+        self.client.force_login(self.user)
+
+    def listed(self, **params):
+        response = self.client.get('/api/erasmus-programs/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['university'] for row in response.json()['results']]
+
+    def test_sorts_and_filters_match_the_database(self):
+        programs = ErasmusProgram.objects.all()
+        expected = {
+            '': programs.order_by('index'),
+            'qs_rank_asc': programs.order_by('-index'),
+            'rating_desc': programs.order_by('-cached_average_rating', 'id'),
+            'rating_asc': programs.order_by('cached_average_rating', 'id'),
+            'name_asc': programs.order_by('university'),
+            'name_desc': programs.order_by('-university'),
+            'academic_desc': programs.annotate(
+                avg=ErasmusProgram.sub_rating_average_expression('academic')
+            ).order_by(F('avg').desc(nulls_last=True), 'index'),
+        }
+        for sort, queryset in expected.items():
+            self.assertEqual(self.listed(sort=sort), [p.university for p in queryset], sort)
+        self.assertEqual(self.listed(country='Italy', university='poli'), ['Politecnico di Milano'])
+
+    def test_review_writes_reload_the_snapshot(self):
+        self.assertEqual(self.listed(sort='rating_desc')[0], 'University of Bologna')
+        with self.captureOnCommitCallbacks(execute=True):
+            ErasmusReview.objects.create(program=ErasmusProgram.objects.get(university='Sciences Po'),
+                                         user=self.user, rating=5)
+        self.assertEqual(self.listed(sort='rating_desc')[:2], ['Sciences Po', 'University of Bologna'])
+
+    def test_custom_weighted_ranking(self):
+        scores = {
+            'Sorbonne': {'ar_score': 90.0, 'er_score': 50.0},
+            'Politecnico di Milano': {'ar_score': 60.0, 'er_score': 100.0},
+            'Sciences Po': {'ar_score': None, 'er_score': 95.0},  # missing AR: judged on ER alone
+        }
+        for university, values in scores.items():
+            ErasmusProgram.objects.filter(university=university).update(**values)
+        bump_catalog_version()
+
+        self.assertEqual(self.listed(sort='custom', weights='ar:1,er:1'),
+                         ['Sciences Po', 'Politecnico di Milano', 'Sorbonne', 'University of Bologna'])
+        self.assertEqual(self.listed(sort='custom', weights='ar:3,er:1')[:3],
+                         ['Sciences Po', 'Sorbonne', 'Politecnico di Milano'])
+        for weights in ['', 'xx:1', 'ar:-1', 'ar:0', 'ar:abc']:
+            response = self.client.get('/api/erasmus-programs/', {'sort': 'custom', 'weights': weights})
+            self.assertEqual(response.status_code, 400, weights)
+
+    def test_rank_bands_and_rank_sorts(self):
+        ranks = {
+            'Sorbonne': ('=72', '601-650'),
+            'Politecnico di Milano': ('123', '15='),
+            'Sciences Po': ('601-650', '1401+'),
+            'University of Bologna': ('', '15'),
+        }
+        for university, (rank, ar_rank) in ranks.items():
+            program = ErasmusProgram.objects.get(university=university)
+            program.rank, program.ar_rank = rank, ar_rank
+            program.save(update_fields=['rank', 'ar_rank'])
+        bump_catalog_version()
+        sciences_po = ErasmusProgram.objects.get(university='Sciences Po')
+        self.assertEqual((sciences_po.rank_low, sciences_po.rank_high), (601, 650))
+        self.assertEqual((sciences_po.ar_rank_low, sciences_po.ar_rank_high), (1401, None))
+
+        self.assertEqual(self.listed(sort='qs_rank_asc'),
+                         ['Sciences Po', 'Politecnico di Milano', 'Sorbonne', 'University of Bologna'])
+        self.assertEqual(self.listed(sort='ar_rank_asc'),
+                         ['Politecnico di Milano', 'University of Bologna', 'Sorbonne', 'Sciences Po'])
+        self.assertEqual(self.listed(rank_max=200), ['Sorbonne', 'Politecnico di Milano'])
+        self.assertEqual(self.listed(rank_min=100, rank_max=1000), ['Politecnico di Milano', 'Sciences Po'])
+        # The database path (cursor mode) filters the same band
+        response = self.client.get('/api/erasmus-programs/', {'pagination': 'cursor', 'rank_max': 200})
+        self.assertEqual([row['university'] for row in response.json()['results']],
+                         ['Sorbonne', 'Politecnico di Milano'])
+        response = self.client.get('/api/erasmus-programs/', {'rank_max': 200, 'facets': 1})
+        self.assertEqual(response.json()['facets']['countries'], {'France': 1, 'Italy': 1})
+        self.assertEqual(self.client.get('/api/erasmus-programs/', {'rank_max': 'top'}).status_code, 400)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.clear_index()
+        spain = Country.objects.create(code='ES', name='Spain')
+        italy = Country.objects.create(code='IT', name='Italy')
+        ErasmusProgram.objects.create(index=120, university='Politecnico di Milano', city='Milano', country_code=italy)
+        ErasmusProgram.objects.create(index=40, university='Politècnica de València', city='València', country_code=italy)
+        ErasmusProgram.objects.create(index=10, university='Universitat Politècnica de Catalunya', city='Barcelona',
+                                      country_code=spain)
+        self.client.force_login(User.objects.create_user(username='student', password='pass'))
+
+    def search(self, query):
+        response = self.client.get('/api/erasmus-programs/autocomplete/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['university'] for row in response.json()['results']]
+
+    def test_matches_without_accents_ranked_by_index(self):
+        self.assertEqual(self.search('politecnica'), ['Politècnica de València'])
+        self.assertEqual(self.search('POLIT'), ['Politècnica de València', 'Politecnico di Milano'])
+        self.assertEqual(self.search('valencia pol'), ['Politècnica de València'])
+        self.assertEqual(self.search('milan'), ['Politecnico di Milano'])
+        self.assertEqual(self.search('xyz'), [])
+
+    def test_index_is_rebuilt_when_the_catalog_changes(self):
+        self.assertEqual(self.search('sorbonne'), [])
+        ErasmusProgram.objects.create(index=5, university='Sorbonne Université', city='Paris',
+                                      country_code=Country.objects.create(code='FR', name='France'))
+        bump_catalog_version()
+        self.assertEqual(self.search('sorbonne universite'), ['Sorbonne Université'])
+
+    def test_list_filter_folds_accents_like_the_suggestions(self):
+        snapshot.clear_snapshot()
+        for typed in ('Politècnica de València', 'politecnica de valencia', 'POLITÉCNICA DE VALÈNCIA'):
+            response = self.client.get('/api/erasmus-programs/', {'university': typed, 'facets': 1})
+            data = response.json()
+            self.assertEqual([row['university'] for row in data['results']], ['Politècnica de València'], typed)
+            self.assertEqual(data['facets']['countries'], {'Italy': 1}, typed)
+
+
+class ListETagTests(TestCase):
+    def setUp(self):
+        snapshot.clear_snapshot()
+        self.user = User.objects.create_user(username='student', password='pass')
+        self.client.force_login(self.user)
+        self.program = ErasmusProgram.objects.create(
+            index=1, university='Sorbonne', country_code=Country.objects.create(code='FR', name='France'))
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_unchanged_lists_answer_304(self):
+        for url in ['/api/erasmus-programs/', '/get_resources/', '/api/events']:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+            with self.assertNumQueries(3):  # session, user, generation stamp
+                self.assertEqual(self.get(url, response['ETag']).status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        etag = self.get('/api/erasmus-programs/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            FavouriteErasmusProgram.objects.create(user=self.user, program=self.program)
+        response = self.get('/api/erasmus-programs/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['is_favorite'])
+
+        etag = self.get('/api/erasmus-programs/?page=1')['ETag']
+        self.assertNotEqual(etag, response['ETag'])
+
+
+class SimilarProgramsTests(TestCase):
+    def setUp(self):
+        france = Country.objects.create(code='FR', name='France')
+        italy = Country.objects.create(code='IT', name='Italy')
+        profiles = [
+            ('Sorbonne', france, 'L', 90, 80),
+            ('Sciences Po', france, 'L', 88, 82),
+            ('Politecnico di Milano', italy, 'XL', 60, 95),
+            ('Politecnico di Torino', italy, 'XL', 58, 93),
+            ('Small College', italy, 'S', 10, 10),
+        ]
+        self.programs = {
+            name: ErasmusProgram.objects.create(index=i, university=name, country_code=country, size=size,
+                                                ar_score=ar, er_score=er)
+            for i, (name, country, size, ar, er) in enumerate(profiles, start=1)
+        }
+        self.client.force_login(User.objects.create_user(username='student', password='pass'))
+
+    def test_neighbour_table_and_batch_lookup(self):
+        call_command('rebuild_program_neighbours', k=2, stdout=StringIO())
+        self.assertEqual(ProgramNeighbour.objects.count(), 10)
+
+        ids = [self.programs['Sorbonne'].id, self.programs['Politecnico di Milano'].id]
+        with self.assertNumQueries(1):
+            similar = similar_programs(ids)
+        self.assertEqual(similar[ids[0]][0].university, 'Sciences Po')
+        self.assertEqual(similar[ids[1]][0].university, 'Politecnico di Torino')
+
+        response = self.client.get('/api/erasmus-programs/similar/', {'ids': ids})
+        results = response.json()['results']
+        self.assertEqual([row['university'] for row in results[str(ids[1])]],
+                         ['Politecnico di Torino', similar[ids[1]][1].university])
+
+        response = self.client.get(f'/exchanges_detail/{ids[0]}/')
+        self.assertContains(response, 'Programs Like This One')
+
+
+class CoFavouriteTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(code='FR', name='France')
+        self.programs = [ErasmusProgram.objects.create(index=i, university=f'University {i}', country_code=country)
+                         for i in range(4)]
+        self.users = [User.objects.create_user(username=f'student{i}', password='pass') for i in range(3)]
+
+    def toggle(self, user, program):
+        self.client.force_login(user)
+        response = self.client.post(f'/erasmus/{program.id}/toggle-favorite/', HTTP_ACCEPT='application/json')
+        self.assertTrue(response.json()['success'])
+
+    def pair_counts(self):
+        return {(row.program_id, row.other_id): row.count for row in CoFavourite.objects.all()}
+
+    def test_toggles_keep_counts_equal_to_a_rebuild(self):
+        p0, p1, p2, p3 = self.programs
+        for user, saved in zip(self.users, [[p0, p1, p2], [p0, p1], [p1, p3]]):
+            for program in saved:
+                self.toggle(user, program)
+        self.toggle(self.users[0], p2)  # removed again
+
+        counts = self.pair_counts()
+        self.assertEqual(counts[p0.id, p1.id], 2)
+        self.assertEqual(counts[p1.id, p0.id], 2)
+        self.assertEqual(counts[p1.id, p3.id], 1)
+        self.assertNotIn((p0.id, p2.id), counts)
+        CoFavourite.rebuild()
+        self.assertEqual(self.pair_counts(), counts)
+
+        self.client.force_login(self.users[2])
+        response = self.client.get(f'/api/erasmus-programs/{p1.id}/also-saved/')
+        self.assertEqual([(row['id'], row['score']) for row in response.json()['results']], [(p0.id, 2), (p3.id, 1)])
+        response = self.client.get('/api/erasmus-programs/recommended/')
+        self.assertEqual([(row['id'], row['score']) for row in response.json()['results']], [(p0.id, 2)])
+
+    def test_bulk_update_in_one_request(self):
+        p0, p1, p2, p3 = self.programs
+        self.toggle(self.users[1], p0)
+        self.toggle(self.users[1], p1)
+        self.client.force_login(self.users[0])
+        self.toggle(self.users[0], p0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/erasmus/favorites/bulk/', json.dumps({
+                'add': [p1.id, p2.id, p3.id, 999999], 'remove': [p0.id],
+            }), content_type='application/json')
+        data = response.json()
+        self.assertEqual((data['added'], data['removed']), (3, 1))
+        self.assertEqual(data['favorites'], sorted([p1.id, p2.id, p3.id]))
+        self.assertEqual(set(FavouriteErasmusProgram.objects.filter(user=self.users[0])
+                             .values_list('program_id', flat=True)), set(data['favorites']))
+
+        counts = self.pair_counts()
+        CoFavourite.rebuild()
+        self.assertEqual(self.pair_counts(), counts)
+
+        response = self.client.post('/erasmus/favorites/bulk/', {'add': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def assertCountsMatchRebuild(self):
+        counts = self.pair_counts()
+        CoFavourite.rebuild()
+        self.assertEqual(self.pair_counts(), counts)
+
+    def test_cascaded_and_direct_deletes_uncount_pairs(self):
+        p0, p1, p2, p3 = self.programs
+        for user, saved in zip(self.users, [[p0, p1, p2], [p0, p1, p2, p3], [p1, p3]]):
+            for program in saved:
+                self.toggle(user, program)
+
+        self.users[0].delete()
+        self.assertEqual(self.pair_counts()[p0.id, p1.id], 1)
+        self.assertCountsMatchRebuild()
+
+        FavouriteErasmusProgram.objects.filter(program__in=[p1, p3]).delete()
+        self.assertEqual(self.pair_counts(), {(p0.id, p2.id): 1, (p2.id, p0.id): 1})
+        self.assertCountsMatchRebuild()
+
+        self.toggle(self.users[2], p0)
+        self.toggle(self.users[2], p2)
+        p2.delete()
+        self.assertEqual(self.pair_counts(), {})
+        self.assertCountsMatchRebuild()
+
+    def test_failed_toggle_leaves_favourite_and_counts_alone(self):
+        p0, p1 = self.programs[:2]
+        self.toggle(self.users[0], p0)
+        with mock.patch.object(CoFavourite, 'record_change', side_effect=RuntimeError):
+            self.client.post(f'/erasmus/{p1.id}/toggle-favorite/', HTTP_ACCEPT='application/json')
+            self.client.post(f'/erasmus/{p0.id}/toggle-favorite/', HTTP_ACCEPT='application/json')
+        self.assertEqual(list(FavouriteErasmusProgram.objects.values_list('program_id', flat=True)), [p0.id])
+
+    def test_bulk_update_near_the_cap(self):
+        from .views import MAX_BULK_FAVORITES
+        country = Country.objects.get(code='FR')
+        shortlist = [ErasmusProgram.objects.create(index=i, university=f'Shortlisted {i}', country_code=country).id
+                     for i in range(100, 100 + MAX_BULK_FAVORITES - 2)]
+        self.toggle(self.users[0], self.programs[0])
+        self.toggle(self.users[1], self.programs[0])
+        self.client.force_login(self.users[0])
+
+        response = self.client.post('/erasmus/favorites/bulk/', json.dumps({
+            'add': shortlist + [self.programs[1].id], 'remove': [self.programs[0].id],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['added'], response.json()['removed']), (MAX_BULK_FAVORITES - 1, 1))
+        counts = self.pair_counts()
+        self.assertEqual(len(counts), (MAX_BULK_FAVORITES - 1) * (MAX_BULK_FAVORITES - 2))
+        CoFavourite.rebuild()
+        self.assertEqual(self.pair_counts(), counts)
+
+        # Removing them all again leaves no pair behind
+        response = self.client.post('/erasmus/favorites/bulk/', json.dumps({
+            'remove': shortlist + [self.programs[1].id],
+        }), content_type='application/json')
+        self.assertEqual(response.json()['removed'], MAX_BULK_FAVORITES - 1)
+        self.assertEqual(self.pair_counts(), {})
+
+        response = self.client.post('/erasmus/favorites/bulk/', json.dumps({
+            'add': list(range(1, MAX_BULK_FAVORITES + 2)),
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportErasmusTests(TestCase):
+    HEADER = 'INDEX,rank display,institution,location code,ar score,ar rank,Overall Score\n'
+
+    def setUp(self):
+        Country.objects.create(code='FR', name='France')
+        Country.objects.create(code='IT', name='Italy')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory.name, 'ranking.csv')
+        with open(path, 'w', encoding='utf-8') as csv_file:
+            csv_file.write(self.HEADER + ''.join(f'{row}\n' for row in rows))
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_erasmus', csv_file=path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_row_by_row_import_bumps_the_catalog_once(self):
+        path = self.write_csv([f'{i},{i},University {i},FR,90,{i},80' for i in range(1, 6)])
+        before = TableGeneration.current(TableGeneration.CATALOG)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(path)
+        self.assertEqual(ErasmusProgram.objects.count(), 5)
+        self.assertEqual(TableGeneration.current(TableGeneration.CATALOG), before + 1)
+
+        # Outside an import every saved program still bumps it
+        with self.captureOnCommitCallbacks(execute=True):
+            ErasmusProgram.objects.filter(index=1).first().save()
+        self.assertEqual(TableGeneration.current(TableGeneration.CATALOG), before + 2)
+
+    def test_bulk_upsert_keeps_existing_programs(self):
+        path = self.write_csv([
+            '1,=12,Sorbonne,FR,90.5,15,88',
+            '2,601-650,Politecnico di Milano,IT,,1401+,40',
+        ])
+        output = self.run_import(path, '--bulk')
+        self.assertIn('2 creats, 0 actualitzats, 0 sense canvis, 0 errors', output)
+        sorbonne = ErasmusProgram.objects.get(university='Sorbonne')
+        self.assertEqual((sorbonne.index, sorbonne.rank_low, sorbonne.country_code_id), (1, 12, 'FR'))
+        user = User.objects.create(username='student')
+        FavouriteErasmusProgram.objects.create(user=user, program=sorbonne)
+
+        path = self.write_csv([
+            '1,=12,Sorbonne,FR,90.5,15,88',
+            '2,501-600,Politecnico di Milano,IT,,1401+,40',
+            '3,700,Sciences Po,XX,,,',
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            output = self.run_import(path, '--bulk')
+        self.assertIn('1 creats, 1 actualitzats, 1 sense canvis, 0 errors', output)
+        self.assertIn('País no trobat: XX', output)
+        self.assertEqual(ErasmusProgram.objects.count(), 3)
+        self.assertTrue(FavouriteErasmusProgram.objects.filter(program=sorbonne).exists())
+        milano = ErasmusProgram.objects.get(university='Politecnico di Milano')
+        self.assertEqual((milano.rank_low, milano.rank_high), (501, 600))
+        self.assertEqual((milano.ar_rank_low, milano.ar_rank_high), (1401, None))
+        # Loading the CSV costs the same few queries however many rows it has
+        import_queries = [q for q in queries.captured_queries if 'unicat_programneighbour' not in q['sql']]
+        self.assertLess(len(import_queries), 20)
+
+    def test_reload_reconciles_by_name_or_index(self):
+        self.run_import(self.write_csv([
+            '1,=12,Sorbonne,FR,90.5,15,88',
+            '2,601-650,Politecnico di Milano,IT,,1401+,40',
+            '3,700,Università di Bologna,IT,,,',
+            '4,800,Sciences Po,FR,,,',
+        ]), '--bulk')
+        ids = dict(ErasmusProgram.objects.values_list('university', 'id'))
+        user = User.objects.create(username='student')
+        FavouriteErasmusProgram.objects.create(user=user, program_id=ids['Politecnico di Milano'])
+        ErasmusReview.objects.create(program_id=ids['Università di Bologna'], user=user, rating=5)
+
+        output = self.run_import(self.write_csv([
+            '1,=10,Sorbonne Université,FR,91,14,89',         # renamed: matched on INDEX
+            '2,601-650,Politecnico di Milano,IT,,1401+,40',  # unchanged
+            '5,650,UNIVERSITA  DI BOLOGNA,IT,,,',            # matched on the normalized name
+            '6,900,Freie Universität Berlin,,,,',
+        ]), '--reload')
+        self.assertIn('1 creats, 2 actualitzats, 1 sense canvis, 1 conservats', output)
+        programs = dict(ErasmusProgram.objects.values_list('id', 'university'))
+        self.assertEqual(programs[ids['Sorbonne']], 'Sorbonne Université')
+        self.assertEqual(programs[ids['Università di Bologna']], 'UNIVERSITA  DI BOLOGNA')
+        self.assertEqual(ErasmusProgram.objects.get(id=ids['Sorbonne']).rank_low, 10)
+        self.assertEqual(ErasmusProgram.objects.get(id=ids['Università di Bologna']).review_count, 1)
+        self.assertTrue(FavouriteErasmusProgram.objects.filter(program_id=ids['Politecnico di Milano']).exists())
+        self.assertIn(ids['Sciences Po'], programs)
+        self.assertFalse(StagedErasmusProgram.objects.exists())
+
+        # A bad file is rejected before anything live changes
+        output = self.run_import(self.write_csv([
+            '1,=10,Sorbonne Université,FR,91,14,89',
+            '2,601-650,Sorbonne  université,XX,,,',
+            'x,650,Università di Bologna,IT,,,',
+        ]), '--reload', '--prune')
+        self.assertIn('Nom repetit 2 vegades: sorbonne universite', output)
+        self.assertIn('País no trobat: XX', output)
+        self.assertIn('Recàrrega cancel·lada: 3 errors', output)
+        self.assertEqual(dict(ErasmusProgram.objects.values_list('id', 'university')), programs)
+
+        output = self.run_import(self.write_csv(['1,=10,Sorbonne Université,FR,91,14,89']), '--reload', '--prune')
+        self.assertIn('0 creats, 0 actualitzats, 1 sense canvis, 4 esborrats', output)
+        self.assertEqual(list(ErasmusProgram.objects.values_list('id', flat=True)), [ids['Sorbonne']])
+
+    def test_stream_resumes_after_a_failed_batch(self):
+        path = self.write_csv([
+            '1,=12,Sorbonne,FR,90.5,15,88',
+            '2,601-650,"Università di Bologna, Alma Mater",IT,,1401+,40',
+            '3,700,Sciences Po,FR,,,',
+            '4,800,Politecnico di Milano,IT,,,',
+            '5,900,Université Paris Cité,FR,,,',
+        ])
+        upsert_programs = ImportErasmusCommand.upsert_programs
+
+        def fail_on_second_batch(command, rows, *args):
+            if ErasmusProgram.objects.exists():
+                raise RuntimeError('connection lost')
+            return upsert_programs(command, rows, *args)
+
+        with mock.patch.object(ImportErasmusCommand, 'upsert_programs', fail_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, '--stream', '--batch-size', '2')
+        self.assertEqual(ErasmusProgram.objects.count(), 2)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.row_number, 2)
+
+        output = self.run_import(path, '--stream', '--batch-size', '2', '--resume')
+        self.assertIn('Reprenent des de la fila 2', output)
+        self.assertIn('3 creats, 0 actualitzats, 0 sense canvis, 0 errors', output)
+        self.assertIn('files/s', output)
+        self.assertEqual(sorted(ErasmusProgram.objects.values_list('index', flat=True)), [1, 2, 3, 4, 5])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+
+PNG_A = b'\x89PNG\r\n\x1a\n' + b'logo a' * 20
+PNG_B = b'\x89PNG\r\n\x1a\n' + b'logo b' * 20
+
+
+class RankingStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for the QS site: one ranking page and its logos, with ETags."""
+    images = {'/logos/a.png': PNG_A, '/logos/b.png': PNG_B, '/logos/a-again.png': PNG_A}
+    seen = []
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        self.seen.append((path, self.headers.get('If-None-Match')))
+        if path == '/world-university-rankings' and 'page=1&' in self.path:
+            spans = ''.join(f'<span class="logo-wrapper new-rank"><a href="#"><img src="{self.server.base}{logo}"></a></span>'
+                            for logo in ['/logos/a.png', '/logos/b.png', '/logos/a-again.png'])
+            self.reply(200, 'text/html', f'<html><body>{spans}</body></html>'.encode())
+        elif path == '/world-university-rankings':
+            self.reply(200, 'text/html', b'<html><body><div id="app"></div></body></html>')
+        elif path in self.images:
+            etag = '"' + hashlib.md5(self.images[path]).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.reply(304, 'image/png', b'', etag)
+            else:
+                self.reply(200, 'image/png', self.images[path], etag)
+        else:
+            self.reply(404, 'text/plain', b'not found')
+
+    def reply(self, status, content_type, body, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImportLogosTests(TestCase):
+    def setUp(self):
+        country = Country.objects.create(code='FR', name='France')
+        for index in (1, 2, 3):
+            ErasmusProgram.objects.create(index=index, university=f'University {index}', country_code=country)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.media_dir = os.path.join(self.directory.name, 'media')
+        self.static_dir = os.path.join(self.directory.name, 'static')
+        os.makedirs(self.media_dir)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RankingStandIn)
+        self.server.base = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        RankingStandIn.seen = []
+
+    def run_import(self, pages=1):
+        out = StringIO()
+        call_command('import_qs_logos', base_url=self.server.base, pages=pages, items_per_page=3,
+                     media_dir=self.media_dir, static_dir=self.static_dir, workers=2, no_render=True, stdout=out)
+        return out.getvalue()
+
+    def test_logos_are_deduplicated_and_revalidated(self):
+        output = self.run_import()
+        self.assertIn('3 descarregats, 0 sense canvis, 0 errors; 3 programes actualitzats', output)
+        images = dict(ErasmusProgram.objects.values_list('index', 'static_image'))
+        self.assertEqual(images[1], images[3])
+        self.assertNotEqual(images[1], images[2])
+        self.assertEqual(images[1], hashlib.sha256(PNG_A).hexdigest()[:32] + '.png')
+        self.assertEqual(sorted(name for name in os.listdir(self.media_dir) if not name.startswith('.')),
+                         sorted({images[1], images[2], 'manifest.json'}))
+        # Published before any program points at them
+        self.assertEqual(sorted(os.listdir(self.static_dir)), sorted({images[1], images[2]}))
+
+        RankingStandIn.seen = []
+        output = self.run_import()
+        self.assertIn('0 descarregats, 3 sense canvis, 0 errors; 0 programes actualitzats', output)
+        logo_requests = [etag for path, etag in RankingStandIn.seen if path.startswith('/logos/')]
+        self.assertEqual(len(logo_requests), 3)
+        self.assertTrue(all(logo_requests))
+
+    def test_a_page_without_logos_fails_loudly(self):
+        # Page 2 of the stand-in is like an unrendered QS page: no logo spans
+        with self.assertRaises(CommandError):
+            self.run_import(pages=2)
+        self.assertFalse(ErasmusProgram.objects.exclude(static_image=None).exists())
+
+
+class LogoVariantTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.logo_dir = os.path.join(directory.name, logo_variants.LOGO_DIR)
+        os.makedirs(self.logo_dir)
+        Image.new('RGBA', (300, 150), (200, 30, 30, 128)).save(os.path.join(self.logo_dir, 'wide logo.png'))
+        Image.new('RGB', (40, 40), 'navy').save(os.path.join(self.logo_dir, 'tiny.jpg'))
+        for name, value in [('STATIC_DIR', directory.name),
+                            ('MANIFEST_PATH', os.path.join(directory.name, logo_variants.VARIANT_DIR, 'manifest.json'))]:
+            patcher = mock.patch.object(logo_variants, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.variant_dir = os.path.join(directory.name, logo_variants.VARIANT_DIR)
+
+    def build(self):
+        out = StringIO()
+        call_command('build_logo_variants', workers=2, stdout=out)
+        return out.getvalue()
+
+    def test_variants_manifest_and_markup(self):
+        self.assertIn('2 logos (2 regenerats, 0 errors', self.build())
+        wide = logo_variants.logo_sources('wide logo.png')
+        self.assertEqual((wide['width'], wide['height']), (80, 40))
+        self.assertEqual(wide['srcset'].count('w, '), 1)  # 1x and 2x
+        self.assertEqual([source['type'] for source in wide['sources']][-1], 'image/webp')
+        tiny = logo_variants.logo_sources('tiny.jpg')
+        self.assertEqual((tiny['width'], tiny['height'], tiny['srcset'].count(',')), (40, 40, 0))
+        self.assertIsNone(logo_variants.logo_sources('missing.png'))
+
+        html = Template('{% load logos %}{% university_logo name "Sorbonne" %}').render(
+            Context({'name': 'wide logo.png'}))
+        self.assertIn('width="80" height="40"', html)
+        self.assertIn('<source type="image/webp"', html)
+        program = ErasmusProgram(university='Sorbonne', static_image='tiny.jpg')
+        self.assertEqual(ErasmusProgramSerializer(program).data['logo']['width'], 40)
+
+        self.assertIn('2 logos (0 regenerats', self.build())
+        os.remove(os.path.join(self.logo_dir, 'tiny.jpg'))
+        self.assertIn('1 logos (0 regenerats', self.build())
+        self.assertFalse([name for name in os.listdir(self.variant_dir) if name.startswith('tiny-')])
+
+    def test_rebuilt_variants_change_the_list_etag(self):
+        snapshot.clear_snapshot()
+        self.client.force_login(User.objects.create_user(username='student', password='pass'))
+        ErasmusProgram.objects.create(index=1, university='Sorbonne', static_image='tiny.jpg',
+                                      country_code=Country.objects.create(code='FR', name='France'))
+        response = self.client.get('/api/erasmus-programs/')
+        self.assertIsNone(response.json()['results'][0]['logo'])
+        self.build()
+        response = self.client.get('/api/erasmus-programs/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['logo']['width'], 40)
+
+    def test_style_is_passed_through(self):
+        self.build()
+        html = Template('{% load logos %}{% university_logo "tiny.jpg" "Sorbonne" "logo me-2" "width: 40px;" %}'
+                        ).render(Context())
+        self.assertIn('class="logo me-2" style="width: 40px;"', html)
+
+
+class CopyToStaticTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_dir = os.path.join(directory.name, 'media')
+        self.static_dir = os.path.join(directory.name, 'static')
+        os.makedirs(self.media_dir)
+        for name, content in [('a.png', PNG_A), ('b.png', PNG_B)]:
+            with open(os.path.join(self.media_dir, name), 'wb') as image_file:
+                image_file.write(content)
+        france = Country.objects.create(code='FR', name='France')
+        ErasmusProgram.objects.create(index=1, university='Sorbonne', country_code=france, static_image='a.png')
+        ErasmusProgram.objects.create(index=2, university='Sciences Po', country_code=france,
+                                      static_image='gone.png')
+
+    def copy(self, *args):
+        out = StringIO()
+        call_command('copy_to_static', '--media-dir', self.media_dir, '--static-dir', self.static_dir, *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_only_changed_files_are_published(self):
+        output = self.copy()
+        self.assertIn('enllaçades: 2, sense canvis: 0', output)
+        self.assertIn('Sense fitxer: 1', output)
+        self.assertIn('gone.png', output)
+        self.assertEqual(ErasmusProgram.objects.get(index=2).static_image, 'gone.png')  # copying never edits the DB
+        self.assertTrue(os.path.samefile(os.path.join(self.media_dir, 'a.png'), os.path.join(self.static_dir, 'a.png')))
+
+        with self.assertNumQueries(1):  # nothing changed: just the programs, no file is read
+            output = self.copy()
+        self.assertIn('Copiades: 0 imatges, enllaçades: 0, sense canvis: 2', output)
+
+        # A logo replaced by a new file (new inode) is published again; --no-links copies it
+        replacement = os.path.join(self.media_dir, 'b.png.new')
+        with open(replacement, 'wb') as image_file:
+            image_file.write(PNG_A)
+        os.replace(replacement, os.path.join(self.media_dir, 'b.png'))
+        output = self.copy('--no-links')
+        self.assertIn('Copiades: 1 imatges, enllaçades: 0, sense canvis: 1', output)
+        with open(os.path.join(self.static_dir, 'b.png'), 'rb') as image_file:
+            self.assertEqual(image_file.read(), PNG_A)
+
+    def test_missing_logos_are_cleared_only_on_request(self):
+        self.assertIn('Sense fitxer (restablerts): 1', self.copy('--clear-missing'))
+        self.assertIsNone(ErasmusProgram.objects.get(index=2).static_image)
+        self.assertEqual(ErasmusProgram.objects.get(index=1).static_image, 'a.png')
+
+    def test_missing_source_directory_is_an_error(self):
+        with self.assertRaises(CommandError):
+            call_command('copy_to_static', '--media-dir', os.path.join(self.media_dir, 'nope'),
+                         '--static-dir', self.static_dir, stdout=StringIO())
+        self.assertEqual(ErasmusProgram.objects.get(index=2).static_image, 'gone.png')
+
+
+def ranking_page(*locations):
+    rows = ''.join(f'<div class="row"><div class="location">{location}</div></div>' for location in locations)
+    return f'<html><body>{rows}</body></html>'
+
+
+class ImportCitiesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.snapshots = directory.name
+        for page, locations in [(1, ['Cambridge,  United States', 'Oxford, United Kingdom']),
+                                (2, ['Paris, France', ' Bologna '])]:
+            with open(os.path.join(self.snapshots, f'page-{page}.html'), 'w', encoding='utf-8') as html_file:
+                html_file.write(ranking_page(*locations))
+        france = Country.objects.create(code='FR', name='France')
+        for index, city in [(1, None), (2, 'Oxford'), (4, 'Bolonya'), (7, 'Lyon')]:
+            ErasmusProgram.objects.create(index=index, university=f'University {index}', country_code=france,
+                                          city=city)
+
+    def import_cities(self, *args):
+        out = StringIO()
+        call_command('import_erasmus-cities', '--snapshots', self.snapshots, '--items-per-page', '2',
+                     '--workers', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def cities(self):
+        return dict(ErasmusProgram.objects.values_list('index', 'city'))
+
+    def test_snapshots_are_applied_in_one_bulk_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            output = self.import_cities()
+        self.assertIn('2 programes actualitzats, 1 índexs sense programa', output)
+        # Programs outside the snapshots keep their city unless --clear-missing is given
+        self.assertEqual(self.cities(), {1: 'Cambridge', 2: 'Oxford', 4: 'Bologna', 7: 'Lyon'})
+
+        self.import_cities('--clear-missing')
+        self.assertIsNone(self.cities()[7])
+        self.assertIn('0 programes actualitzats', self.import_cities('--clear-missing'))
+
+    def test_missing_snapshots_are_an_error(self):
+        os.remove(os.path.join(self.snapshots, 'page-1.html'))
+        os.remove(os.path.join(self.snapshots, 'page-2.html'))
+        with self.assertRaises(CommandError):
+            self.import_cities()
+        self.assertEqual(self.cities()[2], 'Oxford')
+
+
+class ReferenceDataTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.countries_csv = os.path.join(directory.name, 'countries.csv')
+        with open(self.countries_csv, 'w', encoding='utf-8') as csv_file:
+            csv_file.write('name,alpha-2,alpha-3\nFrance,FR,FRA\nSpain,ES,ESP\nItaly,IT,ITA\n')
+        france = Country.objects.create(code='FR', name='France')
+        germany = Country.objects.create(code='DE', name='Germany')
+        Country.objects.create(code='ES', name='Espanya')
+        Country.objects.create(code='XX', name='Nowhere')
+        ErasmusProgram.objects.create(index=1, university='Sorbonne', country_code=france)
+        self.germany_program = ErasmusProgram.objects.create(index=2, university='TU Munich', country_code=germany)
+
+    def countries(self):
+        return dict(Country.objects.values_list('code', 'name'))
+
+    def test_sync_applies_only_the_diff(self):
+        out = StringIO()
+        call_command('import_countries', '--source', self.countries_csv, '--dry-run', stdout=out)
+        report = out.getvalue()
+        self.assertIn("+ IT name='Italy'", report)
+        self.assertIn("~ ES: name 'Espanya' -> 'Spain'", report)
+        self.assertIn('- XX', report)
+        self.assertIn('= DE', report)  # not in the file, but a program points at it
+        self.assertEqual(len(self.countries()), 4)
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            call_command('import_countries', '--source', self.countries_csv, stdout=StringIO())
+        self.assertFalse([q for q in queries.captured_queries if 'LIMIT 1' in q['sql']])  # no per-row lookups
+        self.assertEqual(self.countries(), {'FR': 'France', 'ES': 'Spain', 'IT': 'Italy', 'DE': 'Germany'})
+        self.germany_program.refresh_from_db()
+        self.assertEqual(self.germany_program.country_code_id, 'DE')
+
+        out = StringIO()
+        call_command('import_countries', '--source', self.countries_csv, stdout=out)
+        self.assertIn('0 nous, 0 actualitzats, 0 esborrats', out.getvalue())
+
+    def test_fields_of_study_from_csv_and_fixture(self):
+        Field_Study.objects.create(name='Astrology')
+        Field_Study.objects.bulk_create([Field_Study(name='Other', order=0)])
+        call_command('import_fields_of_study', stdout=StringIO())
+        orders = dict(Field_Study.objects.values_list('name', 'order'))
+        self.assertNotIn('Astrology', orders)
+        self.assertNotIn('NA', orders)
+        self.assertEqual(orders['Other'], 1)
+        self.assertEqual(set(orders.values()), {0, 1})
+        self.assertEqual(Field_Study.objects.last().name, 'Other')
+
+        Field_Study.objects.all().delete()
+        call_command('import_fields_of_study', stdout=StringIO())
+        self.assertEqual(Field_Study.objects.get(name='Other').order, 1)
+
+        fixture = os.path.join(reference_data.JSON_DIR, 'field_studies.json')
+        with open(fixture, encoding='utf-8') as json_file:
+            expected = {obj['pk']: obj['fields']['order'] for obj in json.load(json_file)}
+        call_command('import_fields_of_study', '--source', fixture, stdout=StringIO())
+        self.assertEqual(dict(Field_Study.objects.values_list('name', 'order')), expected)
 
-# Create your tests here.
+    def test_delete_useless_countries(self):
+        call_command('delete-useless-countries', '--force', stdout=StringIO())
+        self.assertEqual(set(self.countries()), {'FR', 'DE'})
@@ -46,6 +46,12 @@ urlpatterns = [
     path('delete_comment/<int:resource_id>/reply/<int:comment_id>/', views.delete_comment, name='delete_reply'),
     path("exchanges_add_review/<int:program_id>/", views.add_erasmus_review, name="exchanges_add_review"),
     path("api/erasmus-programs/", views.get_erasmus_programs, name="api_erasmus_programs"),
+    path("api/erasmus-programs/autocomplete/", views.autocomplete_erasmus_programs, name="api_erasmus_autocomplete"),
+    path("api/erasmus-programs/<int:program_id>/also-saved/", views.get_also_saved_erasmus_programs, name="api_erasmus_also_saved"),
+    path("api/erasmus-programs/recommended/", views.get_recommended_erasmus_programs, name="api_erasmus_recommended"),
+    path("api/erasmus-programs/similar/", views.get_similar_erasmus_programs, name="api_erasmus_similar"),
+    path("api/erasmus-programs/sub-ratings/", views.get_erasmus_sub_ratings, name="api_erasmus_sub_ratings"),
+    path('erasmus/favorites/bulk/', views.bulk_update_favorites_erasmus, name='bulk_update_favorites_erasmus'),
     path('erasmus/<int:program_id>/toggle-favorite/', views.toggle_favorite_erasmus, name='toggle_favorite_erasmus'),
     path('erasmus/<int:program_id>/disconnect/', views.disconnect_erasmus, name='disconnect_erasmus'),
     path('submit-bug-report/', views.submit_bug_report, name='submit_bug_report'),
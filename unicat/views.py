@@ -1,14 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse, HttpResponseRedirect
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import Q
 from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from datetime import datetime,timedelta
 
 # ✅ Afegir aquest import que falta
@@ -17,10 +18,20 @@ from django.contrib import messages
 from rest_framework.decorators import api_view
 from rest_framework.pagination import PageNumberPagination
 
+from .autocomplete import autocomplete
+from .catalog import catalog_country_counts, catalog_facets, catalog_programs, catalog_total, catalog_version
+from .etags import erasmus_programs_etag, events_etag, resources_etag
+from .neighbours import similar_programs
+from .pagination import CountedPaginator, get_paginator
+from .ranking import parse_weights, rank_positions
+from .recommendations import also_saved, recommended_for, recording_co_favourites
+from .snapshot import get_snapshot
+
 from .serializers import *
 from .models import *
 
 # ✅ Imports per verificació d'email
+import json
 import re
 from django.core.mail import send_mail
 from django.conf import settings
@@ -352,10 +363,11 @@ This link will expire in 24 hours.
     return render(request, 'unicat/resend_verification.html')
 
 # Resta de funcions existents...
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=events_etag)
 @api_view(['GET'])
 def get_events(request):
-    paginator = PageNumberPagination()
-    paginator.page_size = 9
+    paginator = get_paginator(request, 9, cursor_ordering=('date', 'id'))
 
     filter_university = request.GET.get('university', '')
     filter_type = request.GET.get('type', '')
@@ -872,9 +884,14 @@ def erasmus(request):
             "toast_type": "error"
         })
 
-    erasmus_programs = ErasmusProgram.objects.exclude(country_code="ES").order_by('index', 'university')
-    # Set up pagination
-    paginator = Paginator(erasmus_programs, 40)
+    # One annotated, select_related query for the page: the cards read
+    # participants_count, review_count and the cached rating, so rendering
+    # the template runs no queries of its own
+    erasmus_programs = catalog_programs().for_listing().order_by('index', 'university')
+    # Set up pagination (the catalog total is cached per catalog version)
+    version = catalog_version()
+    total_count = catalog_total(version)
+    paginator = CountedPaginator(erasmus_programs, 40, count=total_count)
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
     
@@ -884,21 +901,79 @@ def erasmus(request):
     if user_participant:
         user_program = user_participant.program
     
+    # Per-country program counts for the country filter (cached per catalog version)
+    country_counts = catalog_country_counts(version)
+    countries = list(Country.objects.all())
+    for country in countries:
+        country.program_count = country_counts.get(country.name, 0)
+    
     # Get user's favorite programs
-    user_favorites = []
+    user_favorites = set()
     if request.user.is_authenticated:
-        user_favorites = list(FavouriteErasmusProgram.objects.filter(
+        user_favorites = set(FavouriteErasmusProgram.objects.filter(
             user=request.user
         ).values_list('program_id', flat=True))
     
     return render(request, "unicat/erasmus.html", {
         "username": request.user,
-        "countries": Country.objects.all(),
+        "countries": countries,
         "erasmus_programs": page_obj,
         "user_program": user_program,
         "user_favorites": user_favorites,  
         "page_obj": page_obj,
-        "total_count": erasmus_programs.exclude(country_code="ES").count()
+        "total_count": total_count
+    })
+
+# Upper bound on ids per bulk favourites request: adding n programs writes about
+# n * (n + saved) co-favourite rows, so keep n to a shortlist
+MAX_BULK_FAVORITES = 100
+
+@login_required
+def bulk_update_favorites_erasmus(request):
+    """
+    Add and remove many favourites in one request and one transaction.
+    Body: {"add": [program ids], "remove": [program ids]}; returns the
+    user's resulting favourite set.
+    """
+    if request.method != "POST":
+        return JsonResponse({'success': False, 'message': 'POST required'}, status=405)
+    try:
+        data = json.loads(request.body or '{}')
+        add_ids = {int(program_id) for program_id in data.get('add', [])}
+        remove_ids = {int(program_id) for program_id in data.get('remove', [])}
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Invalid program ids'}, status=400)
+    if len(add_ids) + len(remove_ids) > MAX_BULK_FAVORITES:
+        return JsonResponse({'success': False, 'message': 'Too many program ids'}, status=400)
+    # An id in both lists is a no-op
+    add_ids, remove_ids = add_ids - remove_ids, remove_ids - add_ids
+
+    with transaction.atomic(), recording_co_favourites():
+        favorites = FavouriteErasmusProgram.objects.filter(user=request.user)
+        current = set(favorites.values_list('program_id', flat=True))
+
+        removed = remove_ids & current
+        if removed:
+            favorites.filter(program_id__in=removed).delete()
+            CoFavourite.record_change(removed, current, -1)
+        current -= removed
+
+        added = set(ErasmusProgram.objects.filter(id__in=add_ids - current).values_list('id', flat=True))
+        if added:
+            FavouriteErasmusProgram.objects.bulk_create(
+                [FavouriteErasmusProgram(user=request.user, program_id=program_id) for program_id in added],
+                ignore_conflicts=True,
+            )
+            current |= added
+            CoFavourite.record_change(added, current, 1)
+            # bulk_create sends no post_save: invalidate the list ETags ourselves
+            transaction.on_commit(lambda: TableGeneration.bump(TableGeneration.FAVOURITES))
+
+    return JsonResponse({
+        'success': True,
+        'added': len(added),
+        'removed': len(removed),
+        'favorites': sorted(current),
     })
 
 @login_required
@@ -906,20 +981,29 @@ def toggle_favorite_erasmus(request, program_id):
     if request.method == "POST":
         try:
             program = get_object_or_404(ErasmusProgram, id=program_id)
-            favorite, created = FavouriteErasmusProgram.objects.get_or_create(
-                user=request.user,
-                program=program
-            )
-            
-            if not created:
-                # Already exists, so remove it
-                favorite.delete()
-                is_favorite = False
-                message = f"Removed {program.university} from favorites"
-            else:
-                # Newly created
-                is_favorite = True
-                message = f"Added {program.university} to favorites"
+            # The favourite and its co-favourite counts change together or not at all
+            with transaction.atomic(), recording_co_favourites():
+                favorite, created = FavouriteErasmusProgram.objects.get_or_create(
+                    user=request.user,
+                    program=program
+                )
+
+                # The user's favourites including this program, for the co-favourite counts
+                favourite_ids = set(FavouriteErasmusProgram.objects.filter(
+                    user=request.user
+                ).values_list('program_id', flat=True))
+
+                if not created:
+                    # Already exists, so remove it
+                    favorite.delete()
+                    CoFavourite.record_change([program.id], favourite_ids, -1)
+                    is_favorite = False
+                    message = f"Removed {program.university} from favorites"
+                else:
+                    # Newly created
+                    CoFavourite.record_change([program.id], favourite_ids, 1)
+                    is_favorite = True
+                    message = f"Added {program.university} to favorites"
             
             # Return JSON response for AJAX
             if request.headers.get('Accept') == 'application/json':
@@ -1066,6 +1150,9 @@ def add_erasmus_review(request, program_id):
     
     # If not POST, redirect to the program detail page
     return redirect(reverse("exchanges_detail", args=[program_id]))
+DETAIL_PARTICIPANTS_PER_PAGE = 20
+DETAIL_REVIEWS_PER_PAGE = 10
+
 @login_required
 def erasmus_detail(request, program_id):
     try:
@@ -1077,18 +1164,25 @@ def erasmus_detail(request, program_id):
                 "toast_type": "error"
             })
 
-        program = ErasmusProgram.objects.get(id=program_id)
-        participants = program.participants.all()
+        program = ErasmusProgram.objects.select_related('country_code').get(id=program_id)
         avg = program.average_rating() or 0
         full_stars = int(avg)
         has_half_star = (avg - full_stars) >= 0.5
-        erasmus_reviews = program.reviews.all()
-        erasmus_reviews = erasmus_reviews.order_by('-created_at')
         empty_stars = 5 - full_stars - (1 if has_half_star else 0)
+
+        # Both lists are paginated, with their users joined in, and counted
+        # from the program's denormalized totals
+        participants = CountedPaginator(
+            program.participants.select_related('user').order_by('start_date', 'id'),
+            DETAIL_PARTICIPANTS_PER_PAGE, count=program.participants_count,
+        ).get_page(request.GET.get('participant_page'))
+        erasmus_reviews = CountedPaginator(
+            program.reviews.select_related('user').order_by('-created_at', '-id'),
+            DETAIL_REVIEWS_PER_PAGE, count=program.review_count,
+        ).get_page(request.GET.get('review_page'))
         
         # Check if the user is already registered for this program
-        is_registered = False
-        is_registered = participants.filter(user=request.user).exists()
+        is_registered = ErasmusParticipant.objects.filter(program=program, user=request.user).exists()
         
         user_has_reviewed = False
         if request.user.is_authenticated:
@@ -1097,14 +1191,17 @@ def erasmus_detail(request, program_id):
                 program=program
             ).exists()
         
-        # Get user's favorite programs
-        user_favorites = []
-        if request.user.is_authenticated:
-            user_favorites = list(FavouriteErasmusProgram.objects.filter(
-                user=request.user
-            ).values_list('program_id', flat=True))
+        # Only this program's favourite state is needed here
+        user_favorites = set()
+        if request.user.is_authenticated and FavouriteErasmusProgram.objects.filter(
+            user=request.user, program=program
+        ).exists():
+            user_favorites.add(program.id)
         
         is_registered_in_any_program = request.user.is_in_erasmus()
+
+        # "Programs like this one", from the precomputed neighbour table
+        similar = similar_programs([program.id], limit=4)[program.id]
         
         return render(request, "unicat/erasmus_detail.html", {
             "program": program,
@@ -1118,6 +1215,7 @@ def erasmus_detail(request, program_id):
             "user_favorites": user_favorites,
             "is_registered_in_any_program": is_registered_in_any_program,
             "user_has_reviewed": user_has_reviewed,
+            "similar_programs": similar,
         })
     except ErasmusProgram.DoesNotExist:
         return HttpResponseRedirect(reverse("exchanges"))
@@ -1227,6 +1325,8 @@ def erasmus_form(request, program_id, main=None):
 
 
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=resources_etag)
 @api_view(['GET'])
 def get_resources(request):
     # Obtener parámetros de filtro
@@ -1253,8 +1353,7 @@ def get_resources(request):
         resources = resources.filter(field_of_study=filter_field_study)
     
     # Paginar resultados
-    paginator = PageNumberPagination()
-    paginator.page_size = 5
+    paginator = get_paginator(request, 5, cursor_ordering=('-timestamp', 'id'))
     results = paginator.paginate_queryset(resources, request)
 
     serializer = ResourceSerializer(results, many=True)
@@ -1617,6 +1716,16 @@ def edit_profile(request):
     # Si no és POST, redirigir al perfil
     return redirect('profile')
 
+# Sort keys usable by KeysetPagination, per value of ?sort= (each ends with
+# the unique id); every other sort is paged by number
+PROGRAM_CURSOR_ORDERINGS = {
+    '': ('index', 'id'),
+    'rating_desc': ('-cached_average_rating', 'id'),
+    'rating_asc': ('cached_average_rating', 'id'),
+}
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=erasmus_programs_etag)
 @api_view(['GET'])
 def get_erasmus_programs(request):
     # Get filter parameters
@@ -1625,62 +1734,70 @@ def get_erasmus_programs(request):
     country_filters = request.GET.getlist('country')  # Changed from get() to getlist()
     favorites_filter = request.GET.get('favorites', '')
     sort_filter = request.GET.get('sort', '')
-    
-    # Start with all Erasmus programs
-    erasmus_programs = ErasmusProgram.objects.exclude(country_code="ES")
 
-    # Apply filters if provided
-    if university_filter:
-        erasmus_programs = erasmus_programs.filter(university__icontains=university_filter)
-    
-    # Apply country filters (multiple countries)
-    if country_filters:
-        erasmus_programs = erasmus_programs.filter(country_code__name__in=country_filters)
+    # Custom ranking: ?sort=custom&weights=ar:2,ger:1 over the QS indicator scores
+    weights = None
+    if sort_filter == 'custom':
+        try:
+            weights = parse_weights(request.GET.get('weights', ''))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
-    # Apply favorites filter if provided
-    if favorites_filter and request.user.is_authenticated:
-        user_favorite_ids = set(FavouriteErasmusProgram.objects.filter(
-            user=request.user
-        ).values_list('program_id', flat=True))
-        
-        if favorites_filter == 'favorites':
-            # Show only favorite programs
-            erasmus_programs = erasmus_programs.filter(id__in=user_favorite_ids)
-        elif favorites_filter == 'not_favorites':
-            # Show only non-favorite programs
-            erasmus_programs = erasmus_programs.exclude(id__in=user_favorite_ids)
-    
-    if sort_filter:
-        if sort_filter == 'rating_desc':
-            erasmus_programs = erasmus_programs.order_by('-cached_average_rating')
-        elif sort_filter == 'rating_asc':
-            erasmus_programs = erasmus_programs.order_by('cached_average_rating')
-        elif sort_filter == 'name_asc':
-            erasmus_programs = erasmus_programs.order_by('university')
-        elif sort_filter == 'name_desc':
-            erasmus_programs = erasmus_programs.order_by('-university')
-        elif sort_filter == 'qs_rank_asc':
-            erasmus_programs = erasmus_programs.order_by('-index')
-    else:
-        # Default sorting: Highest QS Rank (lowest index numbers = better ranking)
-        erasmus_programs = erasmus_programs.order_by('index')
+    # Overall QS rank band: ?rank_max=200 keeps the top 200, ?rank_min=201&rank_max=500 the next band
+    try:
+        rank_min, rank_max = (int(request.GET[name]) if request.GET.get(name) else None
+                              for name in ('rank_min', 'rank_max'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid rank band'}, status=400)
 
-    # Paginate results
-    paginator = PageNumberPagination()
-    paginator.page_size = 60
-    results = paginator.paginate_queryset(erasmus_programs, request)
-    
-    # Get user's registered programs and favorites
+    # Get user's registered programs and favorites once for the whole request
     user_program_ids = set()
-    user_favorites = []
+    user_favorites = set()
     if request.user.is_authenticated:
         user_program_ids = set(ErasmusParticipant.objects.filter(
             user=request.user
         ).values_list('program_id', flat=True))
         
-        user_favorites = list(FavouriteErasmusProgram.objects.filter(
+        user_favorites = set(FavouriteErasmusProgram.objects.filter(
             user=request.user
         ).values_list('program_id', flat=True))
+    else:
+        favorites_filter = ''
+
+    # Paginate results (cursor mode only for the index and rating sorts)
+    paginator = get_paginator(request, 60, cursor_ordering=PROGRAM_CURSOR_ORDERINGS.get(sort_filter))
+    snapshot = get_snapshot()
+    if isinstance(paginator, PageNumberPagination):
+        # Filter, sort and page this worker's in-memory catalog snapshot;
+        # only the programs on the requested page are read from the DB
+        positions = snapshot.filter(university_filter, country_filters, favorites_filter, user_favorites,
+                                    rank_min, rank_max)
+        if weights:
+            positions = rank_positions(snapshot, positions, weights)
+        else:
+            positions = snapshot.sort(positions, sort_filter)
+        page_ids = paginator.paginate_queryset(snapshot.ids_at(positions), request)
+        programs = ErasmusProgram.objects.for_listing().in_bulk(page_ids)
+        results = [programs[program_id] for program_id in page_ids if program_id in programs]
+    else:
+        # Keyset pages seek in the DB; KeysetPagination applies the ordering
+        erasmus_programs = catalog_programs().for_listing()
+        if university_filter:
+            # Same accent-insensitive match as page mode
+            erasmus_programs = erasmus_programs.filter(
+                id__in=snapshot.ids_at(snapshot.filter(university_filter))
+            )
+        if country_filters:
+            erasmus_programs = erasmus_programs.filter(country_code__name__in=country_filters)
+        if rank_min is not None:
+            erasmus_programs = erasmus_programs.filter(rank_low__gte=rank_min)
+        if rank_max is not None:
+            erasmus_programs = erasmus_programs.filter(rank_low__lte=rank_max)
+        if favorites_filter == 'favorites':
+            erasmus_programs = erasmus_programs.filter(id__in=user_favorites)
+        elif favorites_filter == 'not_favorites':
+            erasmus_programs = erasmus_programs.exclude(id__in=user_favorites)
+        results = paginator.paginate_queryset(erasmus_programs, request)
     
     # Serialize the data with additional fields
     serializer = ErasmusProgramSerializer(results, many=True, context={
@@ -1690,10 +1807,78 @@ def get_erasmus_programs(request):
     })
     
     response = paginator.get_paginated_response(serializer.data)
-    response.data['total_count'] = erasmus_programs.model.objects.exclude(country_code="ES").count()
+    response.data['total_count'] = len(snapshot)
+    if request.GET.get('facets'):
+        # Live filter counts (?facets=1), from one grouped query
+        response.data['facets'] = catalog_facets(
+            university_filter, country_filters, favorites_filter, user_favorites, rank_min, rank_max
+        )
 
     return response
 
+@api_view(['GET'])
+def autocomplete_erasmus_programs(request):
+    """Top university/city matches for the search box (?q=politecnica&limit=10)."""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    results = autocomplete(query, limit) if query else []
+    return JsonResponse({'results': results})
+
+@api_view(['GET'])
+def get_similar_erasmus_programs(request):
+    """Precomputed similar programs for a list of programs (?ids=1&ids=2...)."""
+    try:
+        program_ids = [int(program_id) for program_id in request.GET.getlist('ids')]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid program id'}, status=400)
+    similar = similar_programs(program_ids)
+    return JsonResponse({'results': {
+        str(program_id): [{
+            'id': neighbour.id,
+            'university': neighbour.university,
+            'country': neighbour.country_code.name if neighbour.country_code else None,
+            'rank': neighbour.rank,
+            'static_image': neighbour.static_image,
+            'distance': round(neighbour.similarity_distance, 4),
+        } for neighbour in similar.get(program_id, [])]
+        for program_id in program_ids
+    }})
+
+def _scored_programs_json(scored_programs):
+    return [{
+        'id': program.id,
+        'university': program.university,
+        'country': program.country_code.name if program.country_code else None,
+        'rank': program.rank,
+        'static_image': program.static_image,
+        'score': score,
+    } for program, score in scored_programs]
+
+@api_view(['GET'])
+def get_also_saved_erasmus_programs(request, program_id):
+    """"Students who saved this also saved" for one program."""
+    return JsonResponse({'results': _scored_programs_json(also_saved(program_id))})
+
+@api_view(['GET'])
+def get_recommended_erasmus_programs(request):
+    """Per-user feed: programs often saved together with the user's favourites."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'results': []})
+    return JsonResponse({'results': _scored_programs_json(recommended_for(request.user))})
+
+@api_view(['GET'])
+def get_erasmus_sub_ratings(request):
+    """Sub-rating averages and counts for a list of programs (?ids=1&ids=2...)."""
+    try:
+        program_ids = [int(program_id) for program_id in request.GET.getlist('ids')]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid program id'}, status=400)
+    summary = ErasmusProgram.sub_rating_summary(program_ids)
+    return JsonResponse({'results': {str(program_id): ratings for program_id, ratings in summary.items()}})
+
 @login_required
 def disconnect_erasmus(request, program_id):
     """Handle disconnection from an Erasmus program"""